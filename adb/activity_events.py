@@ -0,0 +1,150 @@
+# adb/activity_events.py
+"""
+Cambios de activity empujados desde el buffer `events` de logcat (eventos de
+ActivityManager/WindowManager), para esperar una activity sin sondear `current_activity`.
+"""
+import os
+import re
+import time
+import asyncio
+import threading
+from typing import Optional, List, Dict, Iterable, Tuple
+
+from adb import adb_client
+from adb.logcat_stream import LogcatStream
+
+# wm_* desde Android 10; am_* en versiones anteriores
+_EVENT_TAGS = ["wm_set_resumed_activity", "wm_on_resume_called", "am_set_resumed_activity", "am_on_resume_called"]
+# "... I wm_set_resumed_activity: [0,com.instagram.android/.activity.MainTabActivity,resumeTopActivity]"
+# "... I wm_on_resume_called: [217403386,com.instagram.mainactivity.MainActivity,RESUME_ACTIVITY]"
+_EVENT_RE = re.compile(r"\s(?:wm|am)_(set_resumed_activity|on_resume_called)\s*:\s*\[(.*)\]\s*$")
+_RESUMED_RE = re.compile(r"ResumedActivity.*?\s(\S+/\S+)")
+
+
+def _normalize(component: str) -> str:
+    """'pkg/.Act' o 'pkg/pkg.Act' -> nombre de clase completo."""
+    if "/" not in component:
+        return component
+    pkg, act = component.split("/", 1)
+    return pkg + act if act.startswith(".") else act
+
+
+def matches(activity: Optional[str], candidates: Iterable[str]) -> bool:
+    return bool(activity) and any(activity.endswith(c) for c in candidates)
+
+
+class ActivityEventStream(LogcatStream):
+    """
+    Activity en primer plano de un dispositivo, actualizada por eventos. Permite esperar
+    una activity concreta de forma síncrona (hilos de los flujos) o asíncrona.
+    """
+
+    def __init__(self, serial: str):
+        super().__init__(serial, max_lines=200)
+        self.current: Optional[str] = None
+        self.changed_at: Optional[float] = None
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future, Tuple[str, ...]]] = []
+
+    def _service(self) -> str:
+        filters = " ".join(f"{t}:I" for t in _EVENT_TAGS)
+        return f"shell:logcat -b events -v epoch -T 1 {filters} *:S"
+
+    def _on_connect(self) -> None:
+        # Estado inicial: la activity ya en primer plano no genera evento
+        try:
+            out = adb_client.session(self.serial).run(
+                "dumpsys activity activities | grep -m 1 ResumedActivity", timeout=10
+            )
+        except (OSError, TimeoutError):
+            return
+        m = _RESUMED_RE.search(out)
+        if m:
+            self._set_current(_normalize(m.group(1).rstrip("}")))
+
+    def _on_lines(self, lines: List[Tuple[float, str]]) -> None:
+        super()._on_lines(lines)
+        for _ts, line in lines:
+            m = _EVENT_RE.search(line)
+            if not m:
+                continue
+            fields = m.group(2).split(",")
+            if len(fields) >= 2:
+                self._set_current(_normalize(fields[1].strip()))
+
+    def _set_current(self, activity: str) -> None:
+        with self._cond:
+            if activity == self.current:
+                return
+            self.current = activity
+            self.changed_at = time.time()
+            self._cond.notify_all()
+            pending = []
+            for loop, fut, candidates in self._async_waiters:
+                if matches(activity, candidates):
+                    loop.call_soon_threadsafe(lambda f=fut: f.done() or f.set_result(activity))
+                else:
+                    pending.append((loop, fut, candidates))
+            self._async_waiters = pending
+
+    def wait_for(self, candidates: Iterable[str], timeout: float) -> Optional[str]:
+        """Bloquea hasta que la activity actual termine en alguno de `candidates` (o None)."""
+        candidates = tuple(candidates)
+        with self._cond:
+            ok = self._cond.wait_for(lambda: matches(self.current, candidates), timeout=timeout)
+            return self.current if ok else None
+
+    async def wait_for_async(self, candidates: Iterable[str], timeout: float) -> Optional[str]:
+        candidates = tuple(candidates)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._cond:
+            if matches(self.current, candidates):
+                return self.current
+            self._async_waiters.append((loop, fut, candidates))
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._cond:
+                self._async_waiters = [w for w in self._async_waiters if w[1] is not fut]
+
+
+# Registro por serial
+_streams: Dict[str, ActivityEventStream] = {}
+_streams_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _streams_lock
+    _streams.clear()
+    _streams_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def start(serial: str) -> ActivityEventStream:
+    with _streams_lock:
+        stream = _streams.get(serial)
+        if stream is None:
+            stream = _streams[serial] = ActivityEventStream(serial)
+    stream.start()
+    return stream
+
+
+def get(serial: Optional[str]) -> Optional[ActivityEventStream]:
+    """Stream conectado del dispositivo, o None (el llamador recurre al sondeo)."""
+    stream = _streams.get(serial) if serial else None
+    if stream is None or not stream.connected:
+        return None
+    return stream
+
+
+def stop(serial: str) -> None:
+    with _streams_lock:
+        stream = _streams.pop(serial, None)
+    if stream is not None:
+        stream.stop()
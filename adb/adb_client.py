@@ -0,0 +1,345 @@
+# adb/adb_client.py
+"""
+Capa de acceso a ADB sin lanzar el binario `adb` por llamada:
+- Habla directamente con el socket del servidor ADB (adbutils).
+- Mantiene una sesión `sh` abierta por dispositivo para comandos cortos (getprop, am, pm...).
+- Habla con la consola del emulador (telnet local) para `emu kill` / `avd snapshot ...`.
+Todas las funciones async delegan en hilos para no bloquear el event loop.
+"""
+import os
+import uuid
+import socket
+import asyncio
+import threading
+from pathlib import Path
+from typing import Optional, Dict, List, Tuple
+
+import adbutils
+
+ADB_SERVER_HOST = os.getenv("ADB_SERVER_HOST", "127.0.0.1")
+ADB_SERVER_PORT = int(os.getenv("ADB_SERVER_PORT", "5037"))
+CONSOLE_TOKEN_PATH = Path(os.getenv("EMULATOR_CONSOLE_TOKEN", str(Path.home() / ".emulator_console_auth_token")))
+
+_client: Optional[adbutils.AdbClient] = None
+_registry_lock = threading.Lock()
+_sessions: Dict[str, "ShellSession"] = {}
+_consoles: Dict[str, "EmulatorConsole"] = {}
+
+
+def _reset_after_fork() -> None:
+    """
+    Un proceso hijo (multiprocessing con fork) no debe compartir los sockets del padre:
+    cada proceso abre sus propias sesiones.
+    """
+    global _client, _registry_lock
+    _client = None
+    _registry_lock = threading.Lock()
+    _sessions.clear()
+    _consoles.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def client() -> adbutils.AdbClient:
+    global _client
+    with _registry_lock:
+        if _client is None:
+            _client = adbutils.AdbClient(host=ADB_SERVER_HOST, port=ADB_SERVER_PORT)
+        return _client
+
+
+def device(serial: str) -> adbutils.AdbDevice:
+    return client().device(serial=serial)
+
+
+def open_stream(serial: str, service: str) -> adbutils.AdbConnection:
+    """
+    Abre una conexión de larga duración a un servicio del dispositivo
+    (p.ej. 'shell:logcat -v epoch' o 'exec:screencap'). El llamador la cierra.
+    """
+    conn = device(serial).open_transport()
+    conn.send_command(service)
+    conn.check_okay()
+    conn.conn.settimeout(None)
+    return conn
+
+
+def forward_port(serial: str, remote_port: int) -> Tuple[int, bool]:
+    """
+    Puerto local reenviado (`adb forward`) a tcp:<remote_port> del dispositivo. Reutiliza
+    un reenvío existente (p.ej. el de Appium); el bool indica si se creó aquí, y por tanto
+    si el llamador debe quitarlo con `forward_remove`.
+    """
+    dev = device(serial)
+    remote = f"tcp:{remote_port}"
+    for item in dev.forward_list():
+        if item.serial == serial and item.remote == remote and item.local.startswith("tcp:"):
+            return int(item.local[4:]), False
+    return dev.forward_port(remote), True
+
+
+def forward_remove(serial: str, local_port: int) -> None:
+    device(serial).forward_remove(f"tcp:{local_port}", raise_non_found=False)
+
+
+class ShellCommandError(RuntimeError):
+    """Comando shell terminado con código distinto de 0 (solo con `check=True`)."""
+
+    def __init__(self, serial: str, cmd: str, code: int, output: str):
+        super().__init__(f"'{cmd}' terminó con código {code} en {serial}: {output[-300:]}")
+        self.code = code
+        self.output = output
+
+
+class ShellSession:
+    """
+    Sesión `sh` persistente sobre una sola conexión ADB. Cada comando se delimita con
+    un marcador para saber dónde termina su salida y cuál fue su código de salida.
+    Solo se reintenta si la sesión estaba rota antes de enviar el comando: uno ya enviado
+    (p.ej. `pm clear`) nunca se repite, aunque expire o se corte la conexión.
+    """
+
+    def __init__(self, serial: str):
+        self.serial = serial
+        self._conn: Optional[adbutils.AdbConnection] = None
+        self._lock = threading.Lock()
+        self._buf = b""
+
+    def _open(self) -> None:
+        self._conn = open_stream(self.serial, "shell:sh")
+        self._buf = b""
+
+    def close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+
+    def run(self, cmd: str, timeout: float = 10, check: bool = False) -> str:
+        """
+        Ejecuta `cmd` en la sesión y devuelve su salida (stdout+stderr) sin el marcador.
+        Con `check`, un código de salida distinto de 0 lanza ShellCommandError.
+        """
+        code, out = self.run_status(cmd, timeout)
+        if check and code != 0:
+            raise ShellCommandError(self.serial, cmd, code, out)
+        return out
+
+    def run_status(self, cmd: str, timeout: float = 10) -> Tuple[int, str]:
+        """Como `run`, pero devuelve (código de salida, salida)."""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._conn is not None and self._is_stale():
+                        self.close()
+                    if self._conn is None:
+                        self._open()
+                    marker = self._send(cmd)
+                except TimeoutError:
+                    self.close()
+                    raise
+                except (OSError, adbutils.AdbError):
+                    # Sesión rota antes de enviar el comando (p.ej. reinicio de adbd): reabrir una vez
+                    self.close()
+                    if attempt == 1:
+                        raise
+                    continue
+                try:
+                    return self._read_result(marker, cmd, timeout)
+                except BaseException:
+                    # La salida pendiente desincronizaría la sesión: descartarla (sin reintentar)
+                    self.close()
+                    raise
+            return -1, ""
+
+    def _is_stale(self) -> bool:
+        """True si adbd ya cerró la conexión (EOF pendiente), sin bloquear."""
+        sock = self._conn.conn
+        try:
+            sock.setblocking(False)
+            try:
+                return sock.recv(1, socket.MSG_PEEK) == b""
+            finally:
+                sock.setblocking(True)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    def _send(self, cmd: str) -> str:
+        marker = f"__ADBX_{uuid.uuid4().hex[:8]}__"
+        # stdin a /dev/null: ningún comando debe consumir los siguientes de la sesión
+        self._conn.conn.sendall(f"{{ {cmd} ; }} </dev/null 2>&1; echo \"{marker}:$?\"\n".encode())
+        return marker
+
+    def _read_result(self, marker: str, cmd: str, timeout: float) -> Tuple[int, str]:
+        sock = self._conn.conn
+        sock.settimeout(timeout)
+        needle = marker.encode() + b":"
+        try:
+            while needle not in self._buf:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    raise ConnectionResetError(f"Sesión ADB cerrada en {self.serial} ejecutando '{cmd}'")
+                self._buf += chunk
+        except socket.timeout:
+            raise TimeoutError(f"Timeout ({timeout}s) ejecutando '{cmd}' en {self.serial}")
+        head, _, rest = self._buf.partition(needle)
+        code, _, self._buf = rest.partition(b"\n")
+        try:
+            status = int(code.strip())
+        except ValueError:
+            status = -1
+        return status, head.decode(errors="ignore").replace("\r\n", "\n").strip()
+
+
+class EmulatorConsole:
+    """Cliente de la consola del emulador (puerto = número del serial emulator-XXXX)."""
+
+    def __init__(self, serial: str):
+        if not serial.startswith("emulator-"):
+            raise ValueError(f"{serial} no es un emulador.")
+        self.serial = serial
+        self.port = int(serial.split("-", 1)[1])
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+
+    def _read_reply(self) -> str:
+        data = b""
+        while True:
+            chunk = self._sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+            lines = data.decode(errors="ignore").splitlines()
+            if lines and (lines[-1].startswith("OK") or lines[-1].startswith("KO")) and data.endswith(b"\n"):
+                break
+        return data.decode(errors="ignore")
+
+    def _open(self, timeout: float) -> None:
+        self._sock = socket.create_connection(("127.0.0.1", self.port), timeout=timeout)
+        self._read_reply()  # banner
+        if CONSOLE_TOKEN_PATH.exists():
+            token = CONSOLE_TOKEN_PATH.read_text().strip()
+            self._sock.sendall(f"auth {token}\r\n".encode())
+            reply = self._read_reply()
+            if "KO" in reply:
+                raise RuntimeError(f"Autenticación de consola rechazada en {self.serial}: {reply.strip()}")
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+
+    def send(self, command: str, timeout: float = 30) -> str:
+        with self._lock:
+            if self._sock is None:
+                self._open(timeout)
+            self._sock.settimeout(timeout)
+            try:
+                self._sock.sendall(f"{command}\r\n".encode())
+                return self._read_reply()
+            except OSError:
+                self.close()
+                raise
+
+
+def session(serial: str) -> ShellSession:
+    with _registry_lock:
+        s = _sessions.get(serial)
+        if s is None:
+            s = _sessions[serial] = ShellSession(serial)
+        return s
+
+
+def console(serial: str) -> EmulatorConsole:
+    with _registry_lock:
+        c = _consoles.get(serial)
+        if c is None:
+            c = _consoles[serial] = EmulatorConsole(serial)
+        return c
+
+
+def close(serial: str) -> None:
+    """Cierra la sesión shell y la consola cacheadas para `serial`."""
+    with _registry_lock:
+        s = _sessions.pop(serial, None)
+        c = _consoles.pop(serial, None)
+    if s:
+        s.close()
+    if c:
+        c.close()
+
+
+# ---------------------- API asíncrona ---------------------- #
+
+async def list_devices() -> List[str]:
+    """Seriales en estado 'device' (consulta host:devices por socket)."""
+    def _list() -> List[str]:
+        return [d.serial for d in client().list() if d.state == "device"]
+    try:
+        return await asyncio.to_thread(_list)
+    except (OSError, adbutils.AdbError) as e:
+        print(f"[ADB] No se pudo consultar el servidor ADB: {e}")
+        return []
+
+
+def wait_for_device_blocking(serial: str, timeout: float) -> None:
+    """
+    Una sola petición `host-serial:<serial>:wait-for-any-device`: el servidor ADB
+    responde cuando el dispositivo pasa a estado 'device' (sin sondeo).
+    """
+    conn = client().make_connection(timeout=timeout)
+    try:
+        conn.send_command(f"host-serial:{serial}:wait-for-any-device")
+        conn.check_okay()  # petición aceptada
+        conn.check_okay()  # dispositivo disponible
+    finally:
+        conn.close()
+
+
+async def wait_for_device(serial: str, timeout: float = 60) -> None:
+    try:
+        await asyncio.to_thread(wait_for_device_blocking, serial, timeout)
+    except socket.timeout as e:
+        raise asyncio.TimeoutError(f"Timeout ({timeout}s) esperando a que {serial} aparezca en ADB") from e
+
+
+async def shell(serial: str, cmd: str, timeout: float = 10, check: bool = False) -> str:
+    return await asyncio.to_thread(session(serial).run, cmd, timeout, check)
+
+
+async def getprop(serial: str, prop: str) -> str:
+    return await shell(serial, f"getprop {prop}")
+
+
+async def emu(serial: str, command: str, timeout: float = 30) -> str:
+    """Equivalente a `adb -s serial emu <command>` sin lanzar procesos."""
+    return await asyncio.to_thread(console(serial).send, command, timeout)
+
+
+async def force_stop(serial: str, package: str) -> None:
+    await shell(serial, f"am force-stop {package}")
+
+
+async def clear_app(serial: str, package: str) -> str:
+    return await shell(serial, f"pm clear {package}", timeout=30)
+
+
+async def launch_app(serial: str, package: str) -> None:
+    await shell(serial, f"monkey -p {package} -c android.intent.category.LAUNCHER 1 >/dev/null")
+
+
+async def pull(serial: str, remote: str, local: Path) -> Path:
+    """Copia un fichero del dispositivo por el protocolo sync (en bloques, sin cargarlo en memoria)."""
+    local = Path(local)
+    local.parent.mkdir(parents=True, exist_ok=True)
+    await asyncio.to_thread(device(serial).sync.pull, remote, str(local))
+    return local
@@ -1,9 +1,10 @@
 # appium_server_manager.py
 import os
+import time
 import asyncio
 import socket
 from pathlib import Path
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, Tuple, Union
 from http.client import HTTPConnection
 from appium.webdriver.appium_service import AppiumService
 
@@ -12,6 +13,17 @@ _services: Dict[Tuple[str, int], AppiumService] = {}
 _services_lock = asyncio.Lock()
 
 
+def _reset_after_fork() -> None:
+    """Los Appium del padre no son del hijo: el proceso de grupo solo detiene los que arranca."""
+    global _services_lock
+    _services.clear()
+    _services_lock = asyncio.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
 async def _port_open(host: str, port: int, timeout: float = 0.5) -> bool:
     def _check() -> bool:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -52,6 +64,33 @@ def _find_free_port(host: str = "127.0.0.1", start: int = 4723, max_tries: int =
     raise RuntimeError("No hay puertos libres para Appium en el rango solicitado.")
 
 
+async def _stop_service_verified(host: str, port: int, service: AppiumService, timeout: float) -> float:
+    """
+    Detiene `service` y confirma que el proceso de Appium terminó; si sigue vivo al vencer
+    el plazo, lo mata (SIGKILL). Devuelve los segundos empleados.
+    """
+    t0 = time.monotonic()
+    # Antes de stop(): AppiumService.stop() deja `_process` a None
+    proc = getattr(service, "_process", None)
+    try:
+        await asyncio.to_thread(service.stop)
+    except Exception as e:
+        print(f"[AppiumServerManager] stop() falló en {host}:{port}: {e}")
+
+    deadline = t0 + timeout
+    while time.monotonic() < deadline:
+        exited = proc is None or proc.poll() is not None
+        if exited and not await _port_open(host, port, timeout=0.1):
+            return time.monotonic() - t0
+        await asyncio.sleep(0.2)
+
+    if proc is not None and proc.poll() is None:
+        print(f"[AppiumServerManager] Appium en {host}:{port} no salió en {timeout:.0f}s; SIGKILL.")
+        proc.kill()
+        await asyncio.to_thread(proc.wait, 5)
+    return time.monotonic() - t0
+
+
 class AppiumServerManager:
     @staticmethod
     async def start_appium_server(
@@ -132,8 +171,9 @@ class AppiumServerManager:
         Args:
             host (Optional[str]): Dirección del host donde está corriendo Appium. Por defecto, usa APPIUM_HOST o '127.0.0.1'.
             port (Optional[int]): Puerto donde está corriendo Appium. Obligatorio.
-            timeout (float): Tiempo máximo (en segundos) para esperar a que el puerto se libere. Por defecto, 5 segundos.
-            retry_interval (float): Intervalo entre reintentos (en segundos) para verificar el puerto. Por defecto, 0.5 segundos.
+            timeout (float): Tiempo máximo (en segundos) para que el proceso salga y el puerto se libere; después se
+                mata (SIGKILL). Por defecto, 5 segundos.
+            retry_interval (float): Sin uso; se conserva por compatibilidad.
 
         Raises:
             ValueError: Si no se proporciona el puerto.
@@ -151,45 +191,36 @@ class AppiumServerManager:
             print(f"[AppiumServerManager] No hay instancia registrada en {host}:{port}")
             return
 
+        # Mismo cierre verificado que stop_all (escala a SIGKILL si el proceso no sale)
         try:
-            # Detener el servicio de Appium
-            await asyncio.to_thread(service.stop)
-            print(f"[AppiumServerManager] Solicitud enviada para detener Appium en {host}:{port}.")
-
-            # Verificar si el puerto se ha liberado
-            start_time = asyncio.get_event_loop().time()
-            while asyncio.get_event_loop().time() - start_time < timeout:
-                try:
-                    # Intentar conectar al puerto para verificar si está en uso
-                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                        sock.settimeout(0.1)
-                        result = sock.connect_ex((host, port))
-                        if result != 0:  # Puerto libre (no se pudo conectar)
-                            print(f"[AppiumServerManager] Appium detenido correctamente en {host}:{port}. Puerto liberado.")
-                            return
-                except Exception as e:
-                    print(f"[AppiumServerManager] Error al verificar el puerto {host}:{port}: {e}")
-                    break
-                await asyncio.sleep(retry_interval)
-
-            raise RuntimeError(f"No se pudo confirmar que Appium se detuvo en {host}:{port}. El puerto sigue en uso.")
-
+            seconds = await _stop_service_verified(host, int(port), service, timeout)
         except Exception as e:
             print(f"[AppiumServerManager] Error al detener Appium en {host}:{port}: {e}")
             raise RuntimeError(f"Fallo al detener Appium en {host}:{port}: {e}")
+        if await _port_open(host, int(port), timeout=0.1):
+            raise RuntimeError(f"No se pudo confirmar que Appium se detuvo en {host}:{port}. El puerto sigue en uso.")
+        print(f"[AppiumServerManager] Appium detenido correctamente en {host}:{port} ({seconds:.1f}s). Puerto liberado.")
 
     @staticmethod
-    async def stop_all() -> None:
+    async def stop_all(timeout: float = 10.0) -> Dict[str, Union[float, str]]:
         """
-        Detiene todas las instancias registradas.
+        Detiene en paralelo todas las instancias registradas, verificando que cada proceso
+        termine. Devuelve "host:port" -> segundos (o el error).
         """
         async with _services_lock:
             items = list(_services.items())
             _services.clear()
 
-        for (host, port), service in items:
-            try:
-                await asyncio.to_thread(service.stop)
-                print(f"[AppiumServerManager] Appium detenido en {host}:{port}.")
-            except Exception as e:
-                print(f"[AppiumServerManager] Error al detener {host}:{port}: {e}")
+        results = await asyncio.gather(
+            *(_stop_service_verified(host, port, service, timeout) for (host, port), service in items),
+            return_exceptions=True,
+        )
+        report: Dict[str, Union[float, str]] = {}
+        for ((host, port), _service), r in zip(items, results):
+            if isinstance(r, BaseException):
+                print(f"[AppiumServerManager] Error al detener {host}:{port}: {r}")
+                report[f"{host}:{port}"] = f"error: {r}"
+            else:
+                print(f"[AppiumServerManager] Appium detenido en {host}:{port} ({r:.1f}s).")
+                report[f"{host}:{port}"] = r
+        return report
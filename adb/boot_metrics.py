@@ -0,0 +1,92 @@
+# adb/boot_metrics.py
+import os
+import json
+import time
+import statistics
+from pathlib import Path
+from typing import Optional, Dict, List, Any
+
+BOOT_LOG_PATH = Path(os.getenv("EMU_BOOT_LOG_PATH", "logs/boot_times.jsonl"))
+# Un arranque se marca como regresión si supera la mediana histórica por este factor
+REGRESSION_FACTOR = float(os.getenv("EMU_BOOT_REGRESSION_FACTOR", "1.5"))
+HISTORY_SIZE = 20
+
+
+def boot_mode(cmd: List[str]) -> str:
+    """'snapshot:<nombre>' si el comando carga un snapshot, 'cold' en otro caso."""
+    if "-snapshot" in cmd:
+        idx = cmd.index("-snapshot")
+        if idx + 1 < len(cmd):
+            return f"snapshot:{cmd[idx + 1]}"
+    return "cold"
+
+
+def _read_history(avd_name: Optional[str] = None, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+    if not BOOT_LOG_PATH.exists():
+        return []
+    rows: List[Dict[str, Any]] = []
+    with open(BOOT_LOG_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if avd_name and row.get("avd_name") != avd_name:
+                continue
+            if mode and row.get("mode") != mode:
+                continue
+            rows.append(row)
+    return rows
+
+
+def record_boot(avd_name: str, serial: str, mode: str, seconds: float,
+                phases: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Guarda la duración del arranque y avisa si es una regresión respecto a la
+    mediana de los últimos arranques del mismo AVD y modo.
+    """
+    history = [r["seconds"] for r in _read_history(avd_name, mode)[-HISTORY_SIZE:]]
+    baseline = statistics.median(history) if history else None
+    regression = bool(baseline and seconds > baseline * REGRESSION_FACTOR)
+
+    row = {
+        "ts": time.time(),
+        "avd_name": avd_name,
+        "serial": serial,
+        "mode": mode,
+        "seconds": round(seconds, 2),
+        "phases": phases or {},
+        "median_before": round(baseline, 2) if baseline else None,
+        "regression": regression,
+    }
+    try:
+        BOOT_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(BOOT_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(row) + "\n")
+    except OSError as e:
+        print(f"[BootMetrics] No se pudo registrar el arranque: {e}")
+
+    msg = f"[BootMetrics] {avd_name} ({mode}) arrancó en {seconds:.1f}s"
+    if baseline:
+        msg += f" (mediana {baseline:.1f}s)"
+    if regression:
+        msg += " -> REGRESIÓN"
+    print(msg)
+    return row
+
+
+def summary(avd_name: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Resumen por modo de arranque: n, mediana, último y si el último fue regresión."""
+    by_mode: Dict[str, List[Dict[str, Any]]] = {}
+    for row in _read_history(avd_name):
+        by_mode.setdefault(row.get("mode", "cold"), []).append(row)
+    out: Dict[str, Dict[str, Any]] = {}
+    for mode, rows in by_mode.items():
+        secs = [r["seconds"] for r in rows[-HISTORY_SIZE:]]
+        out[mode] = {
+            "count": len(rows),
+            "median_seconds": round(statistics.median(secs), 2),
+            "last_seconds": rows[-1]["seconds"],
+            "last_regression": rows[-1].get("regression", False),
+        }
+    return out
@@ -1,11 +1,16 @@
 import os
 import sys
+import json
+import time
 import asyncio
 import shlex
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, Tuple
 import socket
 
+from adb import adb_client
+from utils.emulator_cloner import EmulatorCloner
+
 def _default_sdk() -> str:
     if os.getenv("ANDROID_SDK_ROOT"):
         return os.getenv("ANDROID_SDK_ROOT")  # confiar en el entorno
@@ -20,12 +25,213 @@ SDK_PATH = os.getenv("ANDROID_SDK_ROOT") or _default_sdk()
 ADB_PATH = str(Path(SDK_PATH) / "platform-tools" / ("adb.exe" if os.name == "nt" else "adb"))
 EMULATOR_BIN = str(Path(SDK_PATH) / "emulator" / ("emulator.exe" if os.name == "nt" else "emulator"))
 
+LAUNCH_LOG_PATH = Path(os.getenv("EMU_LAUNCH_LOG_PATH", "logs/emulator_launches.jsonl"))
+
+# Perfiles de lanzamiento. Claves soportadas:
+#   headless, no_snapshot, snapshot, no_snapshot_save, no_boot_anim, no_audio,
+#   gpu, accel, cores, memory (MB)
+LAUNCH_PROFILES: Dict[str, Dict[str, Any]] = {
+    # CI / workers: sin ventana, sin animación ni audio, GPU por software
+    "headless-fast": {
+        "headless": True,
+        "no_snapshot": True,
+        "no_boot_anim": True,
+        "no_audio": True,
+        "gpu": "swiftshader_indirect",
+        "accel": "auto",
+        "cores": 2,
+        "memory": 2048,
+    },
+    # Depuración local: ventana visible y GPU del host
+    "debug-visible": {
+        "headless": False,
+        "no_snapshot": True,
+        "no_boot_anim": False,
+        "no_audio": True,
+        "gpu": "auto",
+        "accel": "auto",
+        "cores": None,
+        "memory": None,
+    },
+    # Arranque desde snapshot quickboot (sin sobrescribirlo al cerrar)
+    "snapshot-boot": {
+        "headless": True,
+        "no_snapshot": False,
+        "snapshot": "default",
+        "no_snapshot_save": True,
+        "no_boot_anim": True,
+        "no_audio": True,
+        "gpu": "swiftshader_indirect",
+        "accel": "auto",
+        "cores": 2,
+        "memory": 2048,
+    },
+}
+
+# Flags que reciben un valor (en extra_args sustituyen al valor del perfil)
+_VALUE_FLAGS = {"-gpu", "-accel", "-cores", "-memory", "-snapshot", "-port", "-ports", "-avd", "-data", "-cache", "-datadir"}
+
+# Flags excluyentes: si extra_args trae la clave, se quitan del comando los flags listados
+_EXCLUSIVE_FLAGS = {
+    "-no-snapshot": ("-snapshot", "-no-snapshot-load", "-no-snapshot-save"),
+    "-snapshot": ("-no-snapshot", "-no-snapshot-load"),
+    "-no-snapshot-load": ("-snapshot", "-no-snapshot"),
+    "-port": ("-ports",),
+    "-ports": ("-port",),
+}
+
+def _env_override(opts: Dict[str, Any]) -> Dict[str, Any]:
+    """Overrides globales por entorno (EMU_CORES, EMU_MEMORY_MB, EMU_ACCEL, EMU_GPU)."""
+    if os.getenv("EMU_CORES"):
+        opts["cores"] = int(os.getenv("EMU_CORES"))
+    if os.getenv("EMU_MEMORY_MB"):
+        opts["memory"] = int(os.getenv("EMU_MEMORY_MB"))
+    if os.getenv("EMU_ACCEL"):
+        opts["accel"] = os.getenv("EMU_ACCEL")
+    if os.getenv("EMU_GPU"):
+        opts["gpu"] = os.getenv("EMU_GPU")
+    return opts
+
+def _drop_flag(cmd: List[str], flag: str) -> List[str]:
+    """Quita todas las apariciones de `flag` (y su valor si es un flag con valor)."""
+    out: List[str] = []
+    i = 0
+    while i < len(cmd):
+        if cmd[i] == flag:
+            i += 2 if flag in _VALUE_FLAGS else 1
+            continue
+        out.append(cmd[i])
+        i += 1
+    return out
+
+def _merge_extra_args(cmd: List[str], extra_args: List[str]) -> List[str]:
+    """
+    Añade extra_args sin duplicar flags: los flags con valor sustituyen al existente
+    y los excluyentes (_EXCLUSIVE_FLAGS) eliminan los del perfil con los que chocan,
+    p.ej. '-no-snapshot' quita '-snapshot <x>' o '-ports' quita '-port <n>'.
+    """
+    cmd = list(cmd)
+    i = 0
+    while i < len(extra_args):
+        flag = extra_args[i]
+        for other in _EXCLUSIVE_FLAGS.get(flag, ()):
+            cmd = _drop_flag(cmd, other)
+        if flag in _VALUE_FLAGS and i + 1 < len(extra_args):
+            value = extra_args[i + 1]
+            if flag in cmd:
+                cmd[cmd.index(flag) + 1] = value
+            else:
+                cmd += [flag, value]
+            i += 2
+            continue
+        if flag not in cmd:
+            cmd.append(flag)
+        i += 1
+    return cmd
+
+def _launch_ports(args: List[str]) -> Optional[Tuple[int, int]]:
+    """
+    Puertos (consola, ADB) indicados en una línea de comandos: '-port <n>' usa n y n + 1,
+    '-ports <consola>,<adb>' los da explícitos. None si no aparece ninguno.
+    """
+    for i, flag in enumerate(args[:-1]):
+        try:
+            if flag == "-port":
+                port = int(args[i + 1])
+                return port, port + 1
+            if flag == "-ports":
+                console, adb_port = args[i + 1].split(",", 1)
+                return int(console), int(adb_port)
+        except ValueError:
+            raise ValueError(f"Valor no válido para {flag}: {args[i + 1]!r}")
+    return None
+
+def build_launch_cmd(
+    avd_name: str,
+    port: int,
+    profile: Optional[str] = None,
+    headless: bool = False,
+    wipe_data: bool = False,
+    no_snapshot: bool = True,
+    extra_args: Optional[List[str]] = None,
+    optimize: bool = True
+) -> List[str]:
+    """
+    Construye la línea de comandos del emulador.
+    - Con `profile`, las opciones salen de LAUNCH_PROFILES (headless/no_snapshot/optimize se ignoran).
+    - Sin `profile`, se respetan headless/no_snapshot/optimize como antes.
+    `wipe_data` y `extra_args` se aplican siempre; `wipe_data` no se admite en clones
+    enlazados (reescribiría imágenes compartidas con la base congelada y otros clones).
+    """
+    if (wipe_data or "-wipe-data" in (extra_args or [])) and EmulatorCloner.is_linked_clone(avd_name):
+        raise ValueError(f"'{avd_name}' comparte imágenes por hardlink; -wipe-data no está permitido "
+                         f"(recrea el clon en su lugar).")
+    if profile:
+        if profile not in LAUNCH_PROFILES:
+            raise ValueError(f"Perfil de lanzamiento desconocido: {profile}. Opciones: {sorted(LAUNCH_PROFILES)}")
+        opts = dict(LAUNCH_PROFILES[profile])
+    else:
+        opts = {
+            "headless": headless,
+            "no_snapshot": no_snapshot,
+            "no_boot_anim": optimize,
+            "no_audio": optimize,
+            "gpu": "swiftshader_indirect" if optimize else None,
+        }
+    opts = _env_override(opts)
+
+    cmd = [EMULATOR_BIN, "-avd", avd_name, "-port", str(port)]
+    if opts.get("headless"):
+        cmd += ["-no-window"]
+    if wipe_data:
+        cmd += ["-wipe-data"]
+    if opts.get("snapshot"):
+        cmd += ["-snapshot", str(opts["snapshot"])]
+    elif opts.get("no_snapshot"):
+        cmd += ["-no-snapshot"]
+    if opts.get("no_snapshot_save"):
+        cmd += ["-no-snapshot-save"]
+    if opts.get("no_boot_anim"):
+        cmd += ["-no-boot-anim"]
+    if opts.get("no_audio"):
+        cmd += ["-no-audio"]
+    if opts.get("gpu"):
+        cmd += ["-gpu", str(opts["gpu"])]
+    if opts.get("accel"):
+        cmd += ["-accel", str(opts["accel"])]
+    if opts.get("cores"):
+        cmd += ["-cores", str(opts["cores"])]
+    if opts.get("memory"):
+        cmd += ["-memory", str(opts["memory"])]
+    if extra_args:
+        cmd = _merge_extra_args(cmd, extra_args)
+    return cmd
+
+def _record_launch(avd_name: str, port: int, profile: Optional[str], cmd: List[str]) -> None:
+    """Registra cada lanzamiento (una línea JSON por ejecución)."""
+    try:
+        LAUNCH_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(LAUNCH_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "ts": time.time(),
+                "avd_name": avd_name,
+                "port": port,
+                "profile": profile,
+                "cmd": cmd,
+            }) + "\n")
+    except OSError as e:
+        print(f"[Emulator] No se pudo registrar el lanzamiento: {e}")
+
 def _is_port_free(host: str, port: int) -> bool:
     """Verifica si un puerto está libre en el host especificado."""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.settimeout(0.2)
         return s.connect_ex((host, port)) != 0
 
+def _is_port_pair_free(host: str, port: int) -> bool:
+    """El emulador usa `port` para la consola y `port + 1` para ADB."""
+    return _is_port_free(host, port) and _is_port_free(host, port + 1)
+
 async def _run(cmd: List[str], timeout: Optional[int] = None) -> asyncio.subprocess.Process:
     """
     Ejecuta comando como subproceso asíncrono y retorna el proceso ya finalizado
@@ -47,21 +253,9 @@ async def _run(cmd: List[str], timeout: Optional[int] = None) -> asyncio.subproc
 
 async def list_devices() -> List[str]:
     """
-    Devuelve lista de seriales en estado 'device' usando `adb devices`.
+    Devuelve lista de seriales en estado 'device' (socket del servidor ADB, sin lanzar `adb`).
     """
-    if not Path(ADB_PATH).exists():
-        return []
-    proc = await _run([ADB_PATH, "devices"], timeout=15)
-    devices: List[str] = []
-    lines = proc.stdout_text.splitlines()[1:]  # saltar encabezado
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        parts = line.split()
-        if len(parts) >= 2 and parts[1] == "device":
-            devices.append(parts[0])
-    return devices
+    return await adb_client.list_devices()
 
 async def is_any_running_devices() -> bool:
     """
@@ -89,133 +283,168 @@ async def launch(
     wipe_data: bool = False,
     no_snapshot: bool = True,
     extra_args: Optional[List[str]] = None,
-    optimize: bool = True
-) -> None:
+    optimize: bool = True,
+    profile: Optional[str] = None
+) -> asyncio.subprocess.Process:
     """
     Lanza un AVD por nombre en un puerto ADB específico. Si no se proporciona puerto,
-    busca uno libre comenzando desde 5554. Falla si el puerto está ocupado o si hay
-    dispositivos conectados.
-    """
-    if await is_any_running_devices():
-        raise RuntimeError("Ya existe un dispositivo en ejecución. Deténlo antes de iniciar el emulador.")
+    busca uno libre comenzando desde 5554. Falla si el puerto (consola o ADB) está ocupado.
+    Otros emuladores ya conectados no impiden el lanzamiento (ejecución en paralelo).
+
+    Devuelve el proceso del emulador para que el llamador (p.ej. EmulatorFleet) pueda
+    seguir su PID. El comando usado queda en `proc.launch_cmd` y en EMU_LAUNCH_LOG_PATH;
+    el puerto de consola efectivo (extra_args puede fijarlo) en `proc.launch_port`.
 
+    `profile` (o EMU_PROFILE) selecciona un perfil de LAUNCH_PROFILES.
+    """
+    profile = profile or os.getenv("EMU_PROFILE") or None
     if not Path(EMULATOR_BIN).exists():
         raise FileNotFoundError(f"No se encontró el binario del emulador: {EMULATOR_BIN}")
 
-    # Si no se proporciona puerto, buscar uno libre desde 5554
+    # Sin puerto explícito, usar el de extra_args (-port/-ports) o buscar uno libre desde 5554
+    requested = _launch_ports(extra_args or [])
+    if port is None and requested:
+        port = requested[0]
     if port is None:
         port = 5554
         max_tries = 50
-        while not _is_port_free("127.0.0.1", port) and max_tries > 0:
+        while not _is_port_pair_free("127.0.0.1", port) and max_tries > 0:
             port += 2  # Los puertos ADB avanzan de 2 en 2
             max_tries -= 1
         if max_tries == 0:
             raise RuntimeError(f"No se encontró un puerto ADB libre para {avd_name} comenzando desde 5554")
 
-    # Verificar que el puerto esté libre
-    if not _is_port_free("127.0.0.1", port):
-        raise RuntimeError(f"El puerto ADB {port} ya está en uso para {avd_name}")
+    cmd = build_launch_cmd(
+        avd_name,
+        port,
+        profile=profile,
+        headless=headless,
+        wipe_data=wipe_data,
+        no_snapshot=no_snapshot,
+        extra_args=extra_args,
+        optimize=optimize,
+    )
+    # extra_args puede sustituir el puerto: validar el que realmente usará el emulador
+    port, adb_port = _launch_ports(cmd)
+    if not (_is_port_free("127.0.0.1", port) and _is_port_free("127.0.0.1", adb_port)):
+        raise RuntimeError(f"El puerto {port}/{adb_port} ya está en uso para {avd_name}")
 
     print(f"Starting emulator for '{avd_name}' on ADB port {port} (expected UDID: emulator-{port})...")
-    cmd = [EMULATOR_BIN, "-avd", avd_name]
-    cmd += ["-port", str(port)]
-    
-    '''if headless:
-        cmd += ["-no-window"]
-    if wipe_data:
-        cmd += ["-wipe-data"]
-    if no_snapshot:
-        cmd += ["-no-snapshot"]
-    if optimize:
-        cmd += [
-            "-no-boot-anim",
-            "-no-audio",
-            "-gpu", "swiftshader_indirect",
-        ]
-    if extra_args:
-        cmd += extra_args'''
-    
+    _record_launch(avd_name, port, profile, cmd)
+
     print("Comando de lanzamiento:", " ".join(shlex.quote(c) for c in cmd))
     # Lanzar emulador en background
-    await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.STDOUT)
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.STDOUT)
+    proc.launch_cmd = cmd
+    proc.launch_profile = profile
+    proc.launch_port = port
     await asyncio.sleep(3)
-    print(f"Emulator for '{avd_name}' launched successfully on port {port}!")
+    if proc.returncode is not None:
+        raise RuntimeError(f"El emulador '{avd_name}' terminó al arrancar (rc={proc.returncode}).")
+    print(f"Emulator for '{avd_name}' launched successfully on port {port} (pid={proc.pid})!")
+    return proc
 
 async def _adb_shell(serial: Optional[str], args: List[str], timeout: int = 10) -> str:
-    base = [ADB_PATH]
-    if serial:
-        base += ["-s", serial]
-    base += ["shell"] + args
-    proc = await _run(base, timeout=timeout)
-    return (proc.stdout_text or "").strip()
+    if not serial:
+        raise ValueError("Se requiere 'serial' para ejecutar comandos shell.")
+    return await adb_client.shell(serial, " ".join(shlex.quote(a) for a in args), timeout=timeout)
+
+# Script que corre en el dispositivo sobre UNA conexión ADB: sondea localmente (sin
+# ida y vuelta por ADB) e imprime un marcador al cumplirse cada condición.
+_BOOT_WATCH_SCRIPT = (
+    'until [ "$(getprop sys.boot_completed)" = 1 ] || [ "$(getprop dev.bootcomplete)" = 1 ]; do sleep 0.2; done; '
+    'echo __BOOT_COMPLETED__; '
+    'until [ "$(getprop init.svc.bootanim)" = stopped ]; do sleep 0.2; done; '
+    'echo __BOOTANIM_STOPPED__; '
+)
+_LAUNCHER_WATCH_SCRIPT = (
+    'until dumpsys activity activities 2>/dev/null | grep -E "mResumedActivity|ResumedActivity:" | grep -qi launcher; '
+    'do sleep 0.5; done; '
+    'echo __LAUNCHER_READY__; '
+)
+_BOOT_MARKERS = {
+    "__BOOT_COMPLETED__": "boot_completed",
+    "__BOOTANIM_STOPPED__": "bootanim_stopped",
+    "__LAUNCHER_READY__": "launcher_ready",
+}
+
+def _watch_boot(serial: str, t0: float, deadline: float, wait_launcher: bool) -> Dict[str, float]:
+    """Lee los marcadores del script de arranque y anota cuándo llega cada uno (s desde t0)."""
+    script = _BOOT_WATCH_SCRIPT + (_LAUNCHER_WATCH_SCRIPT if wait_launcher else "")
+    conn = adb_client.open_stream(serial, "shell:" + script)
+    phases: Dict[str, float] = {}
+    buf = b""
+    try:
+        sock = conn.conn
+        expected = 3 if wait_launcher else 2
+        while len(phases) < expected:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout()
+            sock.settimeout(remaining)
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise RuntimeError(f"La conexión ADB con {serial} se cerró durante el arranque.")
+            buf += chunk
+            for marker, phase in _BOOT_MARKERS.items():
+                if phase not in phases and marker.encode() in buf:
+                    phases[phase] = round(time.monotonic() - t0, 2)
+    except socket.timeout:
+        pending = [p for p in _BOOT_MARKERS.values() if p not in phases]
+        raise asyncio.TimeoutError(f"Timeout esperando arranque de {serial}; fases pendientes: {pending}")
+    finally:
+        conn.close()
+    return phases
 
-async def wait_for_ready(serial: Optional[str] = None, timeout: int = 300) -> None:
+async def wait_for_ready(serial: Optional[str] = None, timeout: int = 300, wait_launcher: bool = True) -> Dict[str, float]:
     """
-    Espera a que el emulador esté listo (dev.bootcomplete == 1 y init.svc.bootanim == stopped).
+    Espera a que el emulador esté listo (bootcomplete == 1, init.svc.bootanim == stopped y,
+    opcionalmente, launcher en primer plano) con una espera bloqueante en el servidor ADB
+    más un único script en el dispositivo; responde en cuanto se cumplen las condiciones.
     Si no se pasa serial, detecta el primer 'emulator-*' en ~60s.
+
+    Devuelve los tiempos (s desde la llamada) de cada fase:
+    device_visible, boot_completed, bootanim_stopped y launcher_ready.
     """
     print(f"Checking emulator boot status for serial {serial or 'any'}...")
-    
+    t0 = time.monotonic()
+    deadline = t0 + timeout
+
     # Detectar serial si no se provee
     detected = serial
-    end_detect = asyncio.get_event_loop().time() + 60
-    while not detected and asyncio.get_event_loop().time() < end_detect:
+    end_detect = t0 + 60
+    while not detected and time.monotonic() < end_detect:
         detected = await first_emulator_serial()
         if not detected:
-            await asyncio.sleep(2)
+            await asyncio.sleep(1)
     serial = detected
     if not serial:
         raise RuntimeError("No se detectó un serial de emulador (emulator-XXXX).")
 
-    # Esperar dev.bootcomplete == 1
-    end = asyncio.get_event_loop().time() + timeout
-    while asyncio.get_event_loop().time() < end:
-        try:
-            val = await _adb_shell(serial, ["getprop", "dev.bootcomplete"])
-            if val == "1":
-                break
-        except Exception:
-            pass
-        await asyncio.sleep(2)
-    else:
-        raise asyncio.TimeoutError(f"Timeout esperando dev.bootcomplete == 1 para {serial}")
+    await adb_client.wait_for_device(serial, timeout=max(1.0, deadline - time.monotonic()))
+    phases: Dict[str, float] = {"device_visible": round(time.monotonic() - t0, 2)}
+    phases.update(await asyncio.to_thread(_watch_boot, serial, t0, deadline, wait_launcher))
 
-    # Esperar bootanim detenido
-    end2 = asyncio.get_event_loop().time() + timeout
-    while asyncio.get_event_loop().time() < end2:
-        try:
-            val = await _adb_shell(serial, ["getprop", "init.svc.bootanim"])
-            if val == "stopped":
-                print(f"Emulator {serial} is ready to use!")
-                return
-        except Exception:
-            pass
-        await asyncio.sleep(3)
-
-    raise asyncio.TimeoutError(f"Timeout esperando init.svc.bootanim == stopped para {serial}")
+    print(f"Emulator {serial} is ready to use! Fases (s): {phases}")
+    return phases
 
 async def stop(serial: Optional[str] = None) -> None:
     """
-    Envía 'adb emu kill'. Si no se pasa serial:
-     - Si hay un único emulador-*, lo usa.
-     - Si hay varios, usa el primero encontrado.
+    Envía 'kill' por la consola del emulador indicado. El serial es obligatorio: con varios
+    emuladores en paralelo no se debe cerrar "el primero que aparezca".
     """
-    print(f"Killing emulator {serial or 'any'}...")
     if not serial:
-        serial = await first_emulator_serial()
-
-    base = [ADB_PATH]
-    if serial:
-        base += ["-s", serial]
-    base += ["emu", "kill"]
+        raise ValueError("Debes indicar 'serial' para detener un emulador específico.")
+    print(f"Killing emulator {serial}...")
 
     try:
-        proc = await _run(base, timeout=10)
-        if proc.returncode == 0:
-            print(f"Emulator {serial or 'any'} closed successfully!")
+        reply = await adb_client.emu(serial, "kill", timeout=10)
+        if "KO" not in reply:
+            print(f"Emulator {serial} closed successfully!")
         else:
-            print(f"Advertencia: emu kill rc={proc.returncode}, intentando poweroff...")
-            base2 = [ADB_PATH] + (["-s", serial] if serial else []) + ["reboot", "-p"]
-            await _run(base2, timeout=10)
+            print(f"Advertencia: emu kill respondió '{reply.strip()}', intentando poweroff...")
+            await adb_client.shell(serial, "reboot -p", timeout=10)
     except Exception as e:
-        print(f"[Emulator] Error al cerrar emulador {serial or 'any'}: {e}")
+        print(f"[Emulator] Error al cerrar emulador {serial}: {e}")
+    finally:
+        adb_client.close(serial)
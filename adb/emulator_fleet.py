@@ -0,0 +1,267 @@
+# adb/emulator_fleet.py
+import os
+import time
+import asyncio
+from typing import Optional, Dict, List, Set, Any, Union
+
+import psutil
+
+import adb.emulator as Emulator
+from adb import boot_metrics
+from utils.avd_instances import AvdInstances
+
+BASE_EMULATOR_PORT = 5554
+MAX_EMULATOR_PORT = 5682  # rango de puertos que `adb` escanea para emuladores
+# Plazo para que el proceso salga tras `emu kill` antes de escalar a SIGTERM/SIGKILL
+STOP_TIMEOUT = float(os.getenv("EMU_STOP_TIMEOUT", "20"))
+
+
+class EmulatorInstance:
+    """Emulador lanzado por la flota: serial, PID, AVD y puerto."""
+
+    def __init__(self, avd_name: str, port: int, process: Optional[asyncio.subprocess.Process] = None):
+        self.avd_name = avd_name
+        self.port = port
+        self.serial = f"emulator-{port}"
+        self.process = process
+        self.cmd: List[str] = list(getattr(process, "launch_cmd", []) or [])
+        self.profile: Optional[str] = getattr(process, "launch_profile", None)
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+        self.boot_seconds: Optional[float] = None
+        self.boot_phases: Dict[str, float] = {}
+        # Opciones de lanzamiento, para poder relanzarlo igual (supervisor)
+        self.launch_kwargs: Dict[str, Any] = {}
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process else None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "serial": self.serial,
+            "avd_name": self.avd_name,
+            "port": self.port,
+            "pid": self.pid,
+            "profile": self.profile,
+            "cmd": self.cmd,
+            "alive": self.is_alive(),
+            "started_at": self.started_at,
+            "ready_at": self.ready_at,
+            "boot_seconds": self.boot_seconds,
+            "boot_phases": self.boot_phases,
+        }
+
+
+# Registro de emuladores propios: clave = serial
+_instances: Dict[str, EmulatorInstance] = {}
+_reserved_ports: Set[int] = set()
+# AVDs con un lanzamiento en curso (aún sin instancia registrada)
+_launching_avds: Set[str] = set()
+_instances_lock = asyncio.Lock()
+
+
+def _reset_after_fork() -> None:
+    """En un proceso hijo la flota empieza vacía: los emuladores del padre no son suyos."""
+    global _instances_lock
+    _instances.clear()
+    _reserved_ports.clear()
+    _launching_avds.clear()
+    _instances_lock = asyncio.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _port_taken(port: int) -> bool:
+    if port in _reserved_ports:
+        return True
+    return any(inst.port == port for inst in _instances.values())
+
+
+def _allocate_port(preferred: Optional[int] = None) -> int:
+    """
+    Reserva un puerto de consola (par) libre. Debe llamarse con `_instances_lock` tomado
+    para que dos lanzamientos concurrentes no elijan el mismo puerto.
+    """
+    if preferred is not None:
+        if _port_taken(preferred) or not Emulator._is_port_pair_free("127.0.0.1", preferred):
+            raise RuntimeError(f"El puerto ADB {preferred} ya está en uso.")
+        _reserved_ports.add(preferred)
+        return preferred
+
+    for port in range(BASE_EMULATOR_PORT, MAX_EMULATOR_PORT, 2):
+        if not _port_taken(port) and Emulator._is_port_pair_free("127.0.0.1", port):
+            _reserved_ports.add(port)
+            return port
+    raise RuntimeError("No hay puertos libres para emuladores en el rango 5554-5682.")
+
+
+class EmulatorFleet:
+    """
+    Gestiona todos los emuladores lanzados por este proceso. Permite lanzamientos
+    concurrentes y limita las paradas/consultas a los dispositivos propios.
+    """
+
+    @staticmethod
+    async def launch(avd_name: str, port: Optional[int] = None, **launch_kwargs) -> EmulatorInstance:
+        """
+        Lanza `avd_name` reservando un puerto propio y registra la instancia.
+        `launch_kwargs` se pasan tal cual a `Emulator.launch`. Un nombre lógico de
+        instancia ('<BASE>_InstN') lanza el AVD base en modo `-read-only`.
+        """
+        real_avd, real_kwargs = AvdInstances.resolve(avd_name, launch_kwargs)
+        if port is None:
+            # Un '-port'/'-ports' en extra_args fija el puerto: reservar ese mismo
+            requested = Emulator._launch_ports(real_kwargs.get("extra_args") or [])
+            port = requested[0] if requested else None
+        async with _instances_lock:
+            if avd_name in _launching_avds:
+                raise RuntimeError(f"El AVD '{avd_name}' ya se está lanzando.")
+            for inst in _instances.values():
+                if inst.avd_name == avd_name and inst.is_alive():
+                    raise RuntimeError(f"El AVD '{avd_name}' ya está en ejecución en {inst.serial}.")
+            port = _allocate_port(port)
+            # Reservado junto al puerto: otro launch concurrente del mismo AVD falla arriba
+            _launching_avds.add(avd_name)
+
+        try:
+            proc = await Emulator.launch(real_avd, port=port, **real_kwargs)
+        except BaseException:
+            async with _instances_lock:
+                _reserved_ports.discard(port)
+                _launching_avds.discard(avd_name)
+            raise
+
+        instance = EmulatorInstance(avd_name, getattr(proc, "launch_port", port), proc)
+        instance.launch_kwargs = dict(launch_kwargs)
+        async with _instances_lock:
+            _reserved_ports.discard(port)
+            _launching_avds.discard(avd_name)
+            _instances[instance.serial] = instance
+        print(f"[EmulatorFleet] Registrado {instance.serial} (avd={avd_name}, pid={instance.pid})")
+        return instance
+
+    @staticmethod
+    async def wait_for_ready(serial: str, timeout: int = 300) -> EmulatorInstance:
+        """
+        Espera el arranque de un emulador propio. Falla en cuanto el proceso muere,
+        sin esperar al timeout completo.
+        """
+        instance = EmulatorFleet.get(serial)
+        if instance is None:
+            raise KeyError(f"El emulador {serial} no pertenece a la flota.")
+
+        ready = asyncio.ensure_future(Emulator.wait_for_ready(serial=serial, timeout=timeout))
+        waiters = [ready]
+        exited = None
+        if instance.process is not None:
+            exited = asyncio.ensure_future(instance.process.wait())
+            waiters.append(exited)
+        try:
+            done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if exited is not None and not exited.done():
+                exited.cancel()
+        if ready not in done:
+            ready.cancel()
+            raise RuntimeError(f"El emulador {serial} terminó durante el arranque (rc={instance.process.returncode}).")
+        instance.boot_phases = ready.result()
+        instance.ready_at = time.time()
+        instance.boot_seconds = instance.ready_at - instance.started_at
+        boot_metrics.record_boot(
+            instance.avd_name, serial, boot_metrics.boot_mode(instance.cmd),
+            instance.boot_seconds, phases=instance.boot_phases
+        )
+        return instance
+
+    @staticmethod
+    async def _wait_exit(instance: EmulatorInstance, timeout: float) -> None:
+        """
+        Espera a que el proceso del emulador (y sus hijos qemu-system-*) termine. Al vencer
+        el plazo escala a SIGTERM y, si sigue vivo, a SIGKILL.
+        """
+        if instance.process is None:
+            return
+        try:
+            tree = [psutil.Process(instance.pid)]
+            tree += tree[0].children(recursive=True)
+        except psutil.NoSuchProcess:
+            tree = []
+
+        try:
+            await asyncio.wait_for(instance.process.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"[EmulatorFleet] {instance.serial} sigue vivo tras {timeout:.0f}s; enviando SIGTERM.")
+            for p in tree:
+                try:
+                    p.terminate()
+                except psutil.NoSuchProcess:
+                    pass
+            try:
+                await asyncio.wait_for(instance.process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+
+        # Los hijos pueden sobrevivir al lanzador: SIGKILL a lo que quede
+        _gone, alive = await asyncio.to_thread(psutil.wait_procs, tree, 5)
+        for p in alive:
+            print(f"[EmulatorFleet] {instance.serial}: SIGKILL a pid {p.pid}.")
+            try:
+                p.kill()
+            except psutil.NoSuchProcess:
+                pass
+        if alive:
+            await asyncio.to_thread(psutil.wait_procs, alive, 5)
+
+    @staticmethod
+    async def stop(serial: str, timeout: float = STOP_TIMEOUT) -> Optional[float]:
+        """
+        Detiene un emulador propio y confirma que su proceso ha terminado. Devuelve los
+        segundos que tardó; los emuladores ajenos se ignoran (None).
+        """
+        async with _instances_lock:
+            instance = _instances.pop(serial, None)
+        if instance is None:
+            print(f"[EmulatorFleet] {serial} no pertenece a la flota; no se detiene.")
+            return None
+        t0 = time.monotonic()
+        if instance.is_alive():
+            await Emulator.stop(serial)
+            await EmulatorFleet._wait_exit(instance, timeout)
+        elapsed = time.monotonic() - t0
+        print(f"[EmulatorFleet] {serial} detenido en {elapsed:.1f}s.")
+        return elapsed
+
+    @staticmethod
+    async def stop_all(timeout: float = STOP_TIMEOUT) -> Dict[str, Union[float, str]]:
+        """Detiene en paralelo todos los emuladores propios: serial -> segundos (o error)."""
+        async with _instances_lock:
+            serials = list(_instances.keys())
+        results = await asyncio.gather(*(EmulatorFleet.stop(s, timeout) for s in serials), return_exceptions=True)
+        return {s: (f"error: {r}" if isinstance(r, BaseException) else r) for s, r in zip(serials, results)}
+
+    @staticmethod
+    def get(serial: str) -> Optional[EmulatorInstance]:
+        return _instances.get(serial)
+
+    @staticmethod
+    def get_by_avd(avd_name: str) -> Optional[EmulatorInstance]:
+        for inst in _instances.values():
+            if inst.avd_name == avd_name:
+                return inst
+        return None
+
+    @staticmethod
+    def instances() -> List[EmulatorInstance]:
+        return list(_instances.values())
+
+    @staticmethod
+    async def list_devices() -> List[str]:
+        """Seriales propios que `adb` ve en estado 'device'."""
+        attached = set(await Emulator.list_devices())
+        return [s for s in _instances if s in attached]
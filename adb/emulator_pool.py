@@ -0,0 +1,290 @@
+# adb/emulator_pool.py
+import os
+import time
+import asyncio
+from typing import Optional, Dict, List, Any, Callable, Awaitable
+
+from adb import adb_client
+from adb.emulator_fleet import EmulatorFleet, EmulatorInstance
+
+APP_PACKAGE = os.getenv("APP_PACKAGE", "com.instagram.android")
+# Reset de la app: "clear" (pm clear), "force-stop" (am force-stop) o "none"
+RESET_BETWEEN_LEASES = os.getenv("EMU_RESET_BETWEEN_LEASES", "force-stop")
+RESET_BETWEEN_USERS = os.getenv("EMU_RESET_BETWEEN_USERS", "force-stop")
+
+
+async def reset_app(serial: str, package: str = APP_PACKAGE, mode: str = "force-stop", relaunch: bool = False) -> float:
+    """
+    Resetea la app sin reiniciar el emulador. Devuelve la duración en milisegundos.
+    - clear: borra datos de la app (pm clear; implica nuevo login)
+    - force-stop: solo detiene el proceso (conserva la sesión)
+    """
+    t0 = time.monotonic()
+    if mode == "clear":
+        out = await adb_client.clear_app(serial, package)
+        if "Success" not in out:
+            raise RuntimeError(f"pm clear {package} falló en {serial}: {out}")
+    elif mode == "force-stop":
+        await adb_client.force_stop(serial, package)
+    elif mode != "none":
+        raise ValueError(f"Modo de reset desconocido: {mode}")
+    if relaunch:
+        await adb_client.launch_app(serial, package)
+    elapsed_ms = (time.monotonic() - t0) * 1000
+    print(f"[EmulatorPool] Reset '{mode}' de {package} en {serial}: {elapsed_ms:.0f} ms")
+    return elapsed_ms
+
+
+class PooledEmulator:
+    """Entrada del pool: instancia de la flota + estado de préstamo."""
+
+    def __init__(self, avd_name: str):
+        self.avd_name = avd_name
+        self.instance: Optional[EmulatorInstance] = None
+        self.state = "booting"  # booting | idle | leased
+        self.owner: Optional[str] = None
+        self.leases = 0
+        self.idle_since: Optional[float] = None
+        self.ready: asyncio.Future = asyncio.get_event_loop().create_future()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "avd_name": self.avd_name,
+            "state": self.state,
+            "owner": self.owner,
+            "leases": self.leases,
+            "idle_since": self.idle_since,
+            "instance": self.instance.to_dict() if self.instance else None,
+        }
+
+
+class EmulatorPool:
+    """
+    Pool de emuladores arrancados que se prestan a grupos (uno por AVD, ya que cada
+    AVD guarda los datos de sus usuarios). Al devolverlos quedan encendidos en reposo;
+    entre préstamos solo se resetea la app. El tamaño sigue a la profundidad de la cola.
+    """
+
+    def __init__(self, max_size: int = 1, min_idle: Optional[int] = None,
+                 launcher: Optional[Callable[[str], Awaitable[EmulatorInstance]]] = None,
+                 boot_timeout: int = 300):
+        """
+        launcher: corrutina avd_name -> EmulatorInstance ya arrancada (por defecto,
+        EmulatorFleet.launch + wait_for_ready con las opciones por defecto).
+        """
+        self.max_size = max(1, max_size)
+        self.min_idle = int(os.getenv("EMU_POOL_MIN_IDLE", "1")) if min_idle is None else min_idle
+        self.launcher = launcher
+        self.boot_timeout = boot_timeout
+        self._entries: Dict[str, PooledEmulator] = {}  # avd_name -> entrada
+        self._cond = asyncio.Condition()
+
+    # ---------- helpers internos (con self._cond tomado) ----------
+    def _idle_lru(self) -> List[PooledEmulator]:
+        # Solo entradas ya arrancadas: las que aún arrancan (estado booting) no se desalojan
+        idle = [e for e in self._entries.values() if e.state == "idle" and e.ready.done()]
+        return sorted(idle, key=lambda e: e.idle_since or 0)
+
+    def _take(self, entry: PooledEmulator) -> PooledEmulator:
+        """Saca la entrada del pool; el apagado (lento) se hace después, sin el lock (`_stop`)."""
+        if self._entries.get(entry.avd_name) is entry:
+            del self._entries[entry.avd_name]
+        return entry
+
+    # ---------- helpers internos (sin el lock) ----------
+    @staticmethod
+    async def _stop(entries: List[PooledEmulator]) -> None:
+        async def _one(entry: PooledEmulator) -> None:
+            if entry.instance is not None:
+                print(f"[EmulatorPool] Apagando {entry.instance.serial} ({entry.avd_name}).")
+                await EmulatorFleet.stop(entry.instance.serial)
+        await asyncio.gather(*(_one(e) for e in entries), return_exceptions=True)
+
+    async def _boot(self, entry: PooledEmulator) -> None:
+        # El futuro de este arranque: si replace_instance lo resuelve antes, este arranque sobra
+        ready = entry.ready
+        launched: Optional[EmulatorInstance] = None
+        try:
+            if self.launcher is not None:
+                launched = await self.launcher(entry.avd_name)
+            else:
+                launched = await EmulatorFleet.launch(entry.avd_name)
+                await EmulatorFleet.wait_for_ready(launched.serial, timeout=self.boot_timeout)
+        except Exception as e:
+            async with self._cond:
+                superseded = ready.done() or entry.ready is not ready
+                if not superseded:
+                    self._take(entry)
+                self._cond.notify_all()
+            if superseded:
+                print(f"[EmulatorPool] Arranque de {entry.avd_name} sustituido; se ignora su error: {e}")
+                return
+            stray = launched or EmulatorFleet.get_by_avd(entry.avd_name)
+            if stray is not None:
+                await EmulatorFleet.stop(stray.serial)
+            ready.set_exception(e)
+            # Evitar "Future exception was never retrieved" si nadie esperaba este arranque
+            ready.exception()
+            return
+
+        async with self._cond:
+            if ready.done() or entry.ready is not ready:
+                return  # replace_instance ya puso la instancia relanzada: se queda esa
+            entry.instance = launched
+            if entry.state == "booting":
+                # Precalentado sin préstamo: pasa a reposo ahora que ha arrancado
+                entry.state = "idle"
+                entry.idle_since = time.time()
+            ready.set_result(launched)
+            self._cond.notify_all()
+
+    # ---------- API ----------
+    async def lease(self, avd_name: str, owner: Optional[str] = None) -> EmulatorInstance:
+        """
+        Presta el emulador de `avd_name`: reutiliza uno en reposo o en arranque; si no,
+        arranca uno (desalojando el más antiguo en reposo si el pool está lleno).
+        """
+        evicted: List[PooledEmulator] = []
+        async with self._cond:
+            while True:
+                entry = self._entries.get(avd_name)
+                if entry is not None and entry.state == "leased":
+                    raise RuntimeError(f"El AVD '{avd_name}' ya está prestado a {entry.owner}.")
+                if entry is not None:
+                    break
+                if len(self._entries) < self.max_size:
+                    entry = PooledEmulator(avd_name)
+                    self._entries[avd_name] = entry
+                    asyncio.ensure_future(self._boot(entry))
+                    break
+                idle = self._idle_lru()
+                if idle:
+                    evicted.append(self._take(idle[0]))
+                    continue
+                await self._cond.wait()
+            was_idle = entry.state == "idle"
+            entry.state = "leased"
+            entry.owner = owner
+            entry.leases += 1
+
+        if evicted:
+            await self._stop(evicted)
+        instance = await asyncio.shield(entry.ready)
+        if was_idle and RESET_BETWEEN_LEASES != "none":
+            try:
+                await reset_app(instance.serial, mode=RESET_BETWEEN_LEASES)
+            except Exception as e:
+                print(f"[EmulatorPool] Reset entre préstamos falló en {instance.serial}: {e}")
+        print(f"[EmulatorPool] {instance.serial} ({avd_name}) prestado a {owner} (préstamo #{entry.leases}).")
+        return instance
+
+    async def release(self, avd_name: str, healthy: bool = True) -> None:
+        """Devuelve el emulador al pool (en reposo) o lo apaga si no está sano."""
+        evicted: List[PooledEmulator] = []
+        async with self._cond:
+            entry = self._entries.get(avd_name)
+            if entry is None or entry.state != "leased":
+                return
+            if not healthy or entry.instance is None or not entry.instance.is_alive():
+                evicted.append(self._take(entry))
+            else:
+                entry.state = "idle"
+                entry.owner = None
+                entry.idle_since = time.time()
+            self._cond.notify_all()
+        await self._stop(evicted)
+
+    def owns(self, avd_name: str, serial: str) -> bool:
+        """True si la entrada de `avd_name` sigue en el pool con el emulador `serial`."""
+        entry = self._entries.get(avd_name)
+        return entry is not None and entry.instance is not None and entry.instance.serial == serial
+
+    async def replace_instance(self, avd_name: str, instance: EmulatorInstance) -> bool:
+        """
+        Sustituye la instancia de una entrada por otra relanzada (mismo AVD y puerto, por
+        tanto mismo serial) conservando el estado de préstamo: el grupo sigue con su UDID.
+        Devuelve False si la entrada ya no está en el pool (desalojada o retirada): el
+        llamador debe apagar la instancia relanzada.
+        """
+        async with self._cond:
+            entry = self._entries.get(avd_name)
+            if entry is None:
+                return False
+            entry.instance = instance
+            if entry.state == "booting":
+                entry.state = "idle"
+                entry.idle_since = time.time()
+            if entry.ready.done():
+                entry.ready = asyncio.get_event_loop().create_future()
+            # Si _boot sigue en curso, al terminar verá su futuro resuelto y no lo tocará
+            entry.ready.set_result(instance)
+            self._cond.notify_all()
+            return True
+
+    async def mark_failed(self, avd_name: str) -> None:
+        """Retira una entrada cuyo emulador no se pudo recuperar (libera su hueco)."""
+        async with self._cond:
+            entry = self._entries.pop(avd_name, None)
+            if entry is not None:
+                print(f"[EmulatorPool] {avd_name} retirado del pool (emulador irrecuperable).")
+            self._cond.notify_all()
+
+    async def prewarm(self, avd_names: List[str]) -> List[str]:
+        """Arranca en segundo plano los AVDs indicados mientras haya hueco libre."""
+        started: List[str] = []
+        async with self._cond:
+            for avd_name in avd_names:
+                if len(self._entries) >= self.max_size:
+                    break
+                if avd_name in self._entries:
+                    continue
+                entry = PooledEmulator(avd_name)  # booting hasta que _boot termine
+                self._entries[avd_name] = entry
+                asyncio.ensure_future(self._boot(entry))
+                started.append(avd_name)
+        if started:
+            print(f"[EmulatorPool] Precalentando: {started}")
+        return started
+
+    async def resize(self, queue_depth: int) -> None:
+        """
+        Ajusta el número de emuladores a la demanda: objetivo = grupos en cola + min_idle
+        (acotado por max_size). Apaga los que sobran en reposo, empezando por los más antiguos.
+        """
+        evicted: List[PooledEmulator] = []
+        async with self._cond:
+            target = min(self.max_size, max(0, queue_depth) + self.min_idle)
+            leased = sum(1 for e in self._entries.values() if e.state == "leased")
+            excess = len(self._entries) - max(target, leased)
+            for entry in self._idle_lru():
+                if excess <= 0:
+                    break
+                evicted.append(self._take(entry))
+                excess -= 1
+            self._cond.notify_all()
+        await self._stop(evicted)
+
+    async def shutdown(self, stop_emulators: bool = True) -> None:
+        """Vacía el pool. Con stop_emulators=False el apagado queda en manos del llamador."""
+        async with self._cond:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._cond.notify_all()
+        if not stop_emulators:
+            return
+        await asyncio.gather(
+            *(EmulatorFleet.stop(e.instance.serial) for e in entries if e.instance is not None),
+            return_exceptions=True,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        entries = list(self._entries.values())
+        return {
+            "max_size": self.max_size,
+            "min_idle": self.min_idle,
+            "size": len(entries),
+            "leased": sum(1 for e in entries if e.state == "leased"),
+            "idle": sum(1 for e in entries if e.state == "idle"),
+            "booting": sum(1 for e in entries if e.state == "booting"),
+            "emulators": [e.to_dict() for e in entries],
+        }
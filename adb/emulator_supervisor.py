@@ -0,0 +1,262 @@
+# adb/emulator_supervisor.py
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Optional, Dict, Any, Callable, Awaitable, Deque
+
+import adbutils
+import psutil
+
+from adb import adb_client
+from adb.emulator_fleet import EmulatorFleet, EmulatorInstance
+
+SUPERVISOR_INTERVAL = float(os.getenv("EMU_SUPERVISOR_INTERVAL", "10"))
+SUPERVISOR_MAX_RESTARTS = int(os.getenv("EMU_SUPERVISOR_MAX_RESTARTS", "2"))
+# Una llamada binder a ActivityManager que tarde más que esto cuenta como "sin respuesta"
+PROBE_TIMEOUT = float(os.getenv("EMU_SUPERVISOR_PROBE_TIMEOUT", "8"))
+HUNG_STRIKES = 2
+ANR_LOOP_COUNT = 3
+ANR_LOOP_WINDOW = 120.0
+# INTERFACE_TRANSACTION ('_NTF'): ping barato que atraviesa system_server
+_AM_PING = "service call activity 1598968902"
+
+
+class EmulatorHealth:
+    """Última muestra de salud de un emulador."""
+
+    def __init__(self, serial: str):
+        self.serial = serial
+        self.alive = True
+        self.cpu_percent = 0.0
+        self.rss_mb = 0.0
+        self.responsive = True
+        self.strikes = 0
+        self.system_server_pid: Optional[str] = None
+        self.last_anr: Optional[str] = None
+        self.anr_times: Deque[float] = deque(maxlen=ANR_LOOP_COUNT)
+        self.restarts = 0
+        self.checked_at: Optional[float] = None
+        self.reason: Optional[str] = None
+
+    def anr_loop(self) -> bool:
+        return (len(self.anr_times) == ANR_LOOP_COUNT
+                and self.anr_times[-1] - self.anr_times[0] <= ANR_LOOP_WINDOW)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "serial": self.serial,
+            "alive": self.alive,
+            "cpu_percent": round(self.cpu_percent, 1),
+            "rss_mb": round(self.rss_mb, 1),
+            "responsive": self.responsive,
+            "strikes": self.strikes,
+            "system_server_pid": self.system_server_pid,
+            "recent_anrs": len(self.anr_times),
+            "restarts": self.restarts,
+            "checked_at": self.checked_at,
+            "reason": self.reason,
+        }
+
+
+class EmulatorSupervisor:
+    """
+    Vigila los emuladores de la flota: vida del proceso, CPU y RSS (psutil), bloqueo de
+    system_server y bucles de ANR. Si un emulador cae o se cuelga, lo reinicia en el mismo
+    AVD y puerto (mismo serial) y lo vuelve a prestar a su grupo, con un presupuesto de
+    reinicios acotado.
+    """
+
+    def __init__(self, pool=None, interval: float = SUPERVISOR_INTERVAL, max_restarts: int = SUPERVISOR_MAX_RESTARTS,
+                 on_event: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None):
+        self.pool = pool
+        self.interval = interval
+        self.max_restarts = max_restarts
+        self.on_event = on_event
+        self._health: Dict[str, EmulatorHealth] = {}
+        self._procs: Dict[int, psutil.Process] = {}
+        self._restarting: set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- ciclo de vida ----------
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._loop())
+            print(f"[Supervisor] Vigilando emuladores cada {self.interval}s (máx. {self.max_restarts} reinicios).")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            instances = [i for i in EmulatorFleet.instances()
+                         if i.ready_at and i.serial not in self._restarting and self._owned(i)]
+            await asyncio.gather(*(self._check_and_recover(i) for i in instances), return_exceptions=True)
+            await asyncio.sleep(self.interval)
+
+    async def _emit(self, etype: str, data: Dict[str, Any]) -> None:
+        if self.on_event is None:
+            return
+        try:
+            await self.on_event(etype, data)
+        except Exception as e:
+            print(f"[Supervisor] Error notificando {etype}: {e}")
+
+    # ---------- sondas ----------
+    def _sample_process(self, instance: EmulatorInstance, health: EmulatorHealth) -> None:
+        """Vida, CPU y RSS del proceso del emulador (incluye hijos: qemu-system-*)."""
+        pid = instance.pid
+        if pid is None or not instance.is_alive():
+            health.alive = False
+            return
+        try:
+            proc = self._procs.get(pid)
+            if proc is None:
+                proc = self._procs[pid] = psutil.Process(pid)
+            if not proc.is_running() or proc.status() == psutil.STATUS_ZOMBIE:
+                health.alive = False
+                return
+            procs = [proc] + proc.children(recursive=True)
+            cpu = 0.0
+            rss = 0
+            for p in procs:
+                try:
+                    cpu += p.cpu_percent(interval=None)
+                    rss += p.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+            health.cpu_percent = cpu
+            health.rss_mb = rss / (1024 * 1024)
+            health.alive = True
+        except psutil.NoSuchProcess:
+            health.alive = False
+
+    async def _probe_device(self, serial: str, health: EmulatorHealth) -> None:
+        """system_server responde a binder y detecta ANRs nuevos."""
+        try:
+            out = await adb_client.shell(serial, _AM_PING, timeout=PROBE_TIMEOUT)
+            health.responsive = "Result: Parcel" in out
+        except (TimeoutError, OSError, adbutils.AdbError) as e:
+            # AdbError: dispositivo offline o desaparecido (ya no responde)
+            health.responsive = False
+            health.reason = f"probe: {e}"
+        if not health.responsive:
+            return
+        try:
+            ss_pid = await adb_client.shell(serial, "pidof system_server", timeout=PROBE_TIMEOUT)
+            if health.system_server_pid and ss_pid and ss_pid != health.system_server_pid:
+                print(f"[Supervisor] {serial}: system_server reiniciado ({health.system_server_pid} -> {ss_pid}).")
+            health.system_server_pid = ss_pid or health.system_server_pid
+
+            last_anr = await adb_client.shell(serial, "dumpsys activity lastanr | head -n 3", timeout=PROBE_TIMEOUT)
+            if "no ANR" not in last_anr and last_anr and last_anr != health.last_anr:
+                if health.last_anr is not None:
+                    health.anr_times.append(time.monotonic())
+                health.last_anr = last_anr
+        except (TimeoutError, OSError, adbutils.AdbError):
+            pass
+
+    async def check(self, instance: EmulatorInstance) -> EmulatorHealth:
+        health = self._health.setdefault(instance.serial, EmulatorHealth(instance.serial))
+        health.reason = None
+        self._sample_process(instance, health)
+        if health.alive:
+            await self._probe_device(instance.serial, health)
+            health.strikes = 0 if health.responsive else health.strikes + 1
+        health.checked_at = time.time()
+        return health
+
+    # ---------- recuperación ----------
+    async def _check_and_recover(self, instance: EmulatorInstance) -> None:
+        health = await self.check(instance)
+        if not health.alive:
+            reason = "process_exited"
+        elif health.strikes >= HUNG_STRIKES:
+            reason = "system_server_unresponsive"
+        elif health.anr_loop():
+            reason = "anr_loop"
+        else:
+            return
+        await self.recover(instance, reason)
+
+    def _owned(self, instance: EmulatorInstance) -> bool:
+        """Con pool, solo se vigilan sus emuladores: uno desalojado se está apagando a propósito."""
+        return self.pool is None or self.pool.owns(instance.avd_name, instance.serial)
+
+    def _owner(self, avd_name: str) -> Optional[str]:
+        if self.pool is None:
+            return None
+        entry = self.pool._entries.get(avd_name)
+        return entry.owner if entry else None
+
+    async def recover(self, instance: EmulatorInstance, reason: str) -> Optional[EmulatorInstance]:
+        """Reinicia el emulador en el mismo AVD/puerto si queda presupuesto; si no, lo retira."""
+        serial, avd_name = instance.serial, instance.avd_name
+        if not self._owned(instance):
+            # Desalojado o retirado por el pool, que ya lo está apagando: no relanzarlo
+            print(f"[Supervisor] {serial}: ya no pertenece al pool; no se relanza.")
+            self._health.pop(serial, None)
+            return None
+        health = self._health.setdefault(serial, EmulatorHealth(serial))
+        data = {"serial": serial, "avd": avd_name, "reason": reason, "owner": self._owner(avd_name),
+                "restarts": health.restarts, "health": health.to_dict()}
+        print(f"[Supervisor] {serial} ({avd_name}) con fallo: {reason}.")
+
+        self._restarting.add(serial)
+        try:
+            await self._kill(instance)
+            if health.restarts >= self.max_restarts:
+                print(f"[Supervisor] {serial}: presupuesto de reinicios agotado ({self.max_restarts}); se retira.")
+                if self.pool is not None:
+                    await self.pool.mark_failed(avd_name)
+                self._health.pop(serial, None)
+                await self._emit("emulator_retired", data)
+                return None
+
+            health.restarts += 1
+            await self._emit("emulator_restarting", data)
+            t0 = time.monotonic()
+            new_instance = await EmulatorFleet.launch(avd_name, port=instance.port, **instance.launch_kwargs)
+            try:
+                await EmulatorFleet.wait_for_ready(new_instance.serial)
+                replaced = self.pool is None or await self.pool.replace_instance(avd_name, new_instance)
+            except BaseException:
+                await EmulatorFleet.stop(new_instance.serial)
+                raise
+            if not replaced:
+                # La entrada salió del pool durante el reinicio: nadie apagaría este emulador
+                print(f"[Supervisor] {serial}: desalojado del pool durante el reinicio; se apaga.")
+                await EmulatorFleet.stop(new_instance.serial)
+                self._health.pop(serial, None)
+                return None
+            # Reiniciar las muestras (nuevo proceso, nuevo system_server)
+            health.strikes = 0
+            health.system_server_pid = None
+            health.last_anr = None
+            health.anr_times.clear()
+            data.update({"restarts": health.restarts, "recovery_seconds": round(time.monotonic() - t0, 1)})
+            await self._emit("emulator_recovered", data)
+            return new_instance
+        except Exception as e:
+            print(f"[Supervisor] {serial}: reinicio fallido: {e}")
+            if self.pool is not None:
+                await self.pool.mark_failed(avd_name)
+            data["error"] = str(e)
+            await self._emit("emulator_retired", data)
+            return None
+        finally:
+            self._restarting.discard(serial)
+
+    async def _kill(self, instance: EmulatorInstance) -> None:
+        """Cierre verificado (escala a SIGKILL si el emulador no sale a tiempo)."""
+        self._procs.pop(instance.pid, None)
+        await EmulatorFleet.stop(instance.serial, timeout=10)
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        return {serial: h.to_dict() for serial, h in self._health.items()}
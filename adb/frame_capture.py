@@ -0,0 +1,420 @@
+# adb/frame_capture.py
+"""
+Captura rápida de fotogramas del dispositivo sin pasar por el screenshot base64 de Appium.
+Backends:
+- raw:   `screencap` (sin PNG) en un bucle sobre una conexión `exec:` persistente: cada
+         petición es un salto de línea y la respuesta es la cabecera + los píxeles RGBA.
+- png:   igual pero con `screencap -p` (el dispositivo codifica el PNG).
+- mjpeg: último JPEG del servidor MJPEG de UiAutomator2 (puerto MJPEG_DEVICE_PORT del
+         dispositivo), por un `adb forward` propio de cada serial.
+`grab()` devuelve un `Frame` cuyo `data` es una vista (memoryview) sobre un buffer que se
+reutiliza: es válida hasta el siguiente `grab()`; quien quiera conservarla, que la copie.
+
+Benchmark:
+    python -m adb.frame_capture emulator-5554 --backend all --frames 30
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import socket
+import struct
+import argparse
+import threading
+from typing import Optional, Dict, Any, List
+
+from adb import adb_client
+
+FRAME_CAPTURE_BACKEND = os.getenv("FRAME_CAPTURE_BACKEND", "raw").strip().lower()
+MJPEG_HOST = os.getenv("MJPEG_HOST", "127.0.0.1")
+# Puerto del servidor MJPEG de UiAutomator2 dentro del dispositivo
+MJPEG_DEVICE_PORT = int(os.getenv("MJPEG_DEVICE_PORT", "7810"))
+_PNG_SIG = b"\x89PNG\r\n\x1a\n"
+# Formatos de píxel de screencap (android.graphics.PixelFormat)
+_PIXEL_FORMATS = {1: "rgba", 2: "rgbx", 5: "bgra"}
+
+
+class Frame:
+    """Fotograma: dimensiones (0 si no se conocen sin decodificar), formato y vista de los bytes."""
+    __slots__ = ("width", "height", "format", "data", "ts", "latency_ms")
+
+    def __init__(self, width: int, height: int, fmt: str, data: memoryview, ts: float, latency_ms: float):
+        self.width = width
+        self.height = height
+        self.format = fmt
+        self.data = data
+        self.ts = ts
+        self.latency_ms = latency_ms
+
+    def copy(self) -> "Frame":
+        """Copia independiente del buffer reutilizable (para guardarla o pasarla a otro hilo)."""
+        return Frame(self.width, self.height, self.format, memoryview(bytes(self.data)), self.ts, self.latency_ms)
+
+    def to_png(self) -> bytes:
+        """PNG del fotograma (para raw se codifica aquí, en el host; png se devuelve tal cual)."""
+        if self.format == "png":
+            return bytes(self.data)
+        if self.format not in ("rgba", "rgbx", "bgra"):
+            raise ValueError(f"No se puede convertir {self.format} a PNG.")
+        return encode_png(self.width, self.height, bytes(self.data), self.format)
+
+
+def encode_png(width: int, height: int, pixels: bytes, fmt: str = "rgba", level: int = 1) -> bytes:
+    """PNG RGBA mínimo (filtro 0 por fila) con zlib; pensado para hilos escritores, no para el flujo."""
+    if fmt != "rgba":
+        buf = bytearray(pixels)
+        if fmt == "bgra":
+            buf[0::4], buf[2::4] = pixels[2::4], pixels[0::4]
+        elif fmt == "rgbx":
+            buf[3::4] = b"\xff" * (len(buf) // 4)
+        pixels = bytes(buf)
+    rgba = pixels
+    stride = width * 4
+    raw = b"".join(b"\x00" + rgba[y * stride:(y + 1) * stride] for y in range(height))
+
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF)
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return _PNG_SIG + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(raw, level)) + chunk(b"IEND", b"")
+
+
+class _Buffer:
+    """bytearray reutilizable; si hace falta más sitio se crea otro (las vistas viejas siguen válidas)."""
+
+    def __init__(self, size: int = 1 << 20):
+        self.buf = bytearray(size)
+
+    def ensure(self, size: int, keep: int = 0) -> None:
+        """Garantiza `size` bytes conservando los `keep` primeros."""
+        if size > len(self.buf):
+            old = self.buf
+            self.buf = bytearray(max(size, len(old) * 2))
+            self.buf[:keep] = old[:keep]
+
+
+def _recv_exact_into(sock: socket.socket, view: memoryview, n: int) -> None:
+    pos = 0
+    while pos < n:
+        got = sock.recv_into(view[pos:n], n - pos)
+        if not got:
+            raise OSError("Conexión cerrada durante la captura.")
+        pos += got
+
+
+class _ScreencapBackend:
+    """`screencap` en bucle sobre una conexión `exec:` de larga duración."""
+
+    def __init__(self, serial: str, png: bool):
+        self.serial = serial
+        self.png = png
+        self.name = "png" if png else "raw"
+        self._buf = _Buffer(8 << 20 if not png else 1 << 20)
+        self._conn = None
+        self._header_size = 12
+
+    def _open(self) -> None:
+        try:
+            sdk = int(adb_client.session(self.serial).run("getprop ro.build.version.sdk") or "0")
+        except (ValueError, OSError, TimeoutError):
+            sdk = 0
+        self._header_size = 16 if sdk >= 28 else 12  # API 28+: + espacio de color
+        cmd = "screencap -p" if self.png else "screencap"
+        self._conn = adb_client.open_stream(self.serial, f"exec:while read -r _; do {cmd}; done")
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _read_raw(self, sock: socket.socket) -> Frame:
+        head = bytearray(self._header_size)
+        _recv_exact_into(sock, memoryview(head), self._header_size)
+        width, height, fmt = struct.unpack_from("<III", head)
+        size = width * height * 4
+        self._buf.ensure(size)
+        view = memoryview(self._buf.buf)
+        _recv_exact_into(sock, view, size)
+        return Frame(width, height, _PIXEL_FORMATS.get(fmt, f"format{fmt}"), view[:size], 0, 0)
+
+    def _read_png(self, sock: socket.socket) -> Frame:
+        # Se lee chunk a chunk hasta IEND (el PNG no lleva su longitud total)
+        self._buf.ensure(len(_PNG_SIG))
+        view = memoryview(self._buf.buf)
+        _recv_exact_into(sock, view, len(_PNG_SIG))
+        if bytes(view[:len(_PNG_SIG)]) != _PNG_SIG:
+            raise OSError("Respuesta de screencap -p no es un PNG.")
+        pos = len(_PNG_SIG)
+        width = height = 0
+        while True:
+            if pos + 8 > len(self._buf.buf):
+                self._buf.ensure(pos + 8, keep=pos)
+                view = memoryview(self._buf.buf)
+            _recv_exact_into(sock, view[pos:], 8)
+            length, kind = struct.unpack_from(">I4s", self._buf.buf, pos)
+            end = pos + 8 + length + 4
+            if end > len(self._buf.buf):
+                self._buf.ensure(end, keep=pos + 8)
+                view = memoryview(self._buf.buf)
+            _recv_exact_into(sock, view[pos + 8:], length + 4)
+            if kind == b"IHDR":
+                width, height = struct.unpack_from(">II", self._buf.buf, pos + 8)
+            pos = end
+            if kind == b"IEND":
+                return Frame(width, height, "png", view[:pos], 0, 0)
+
+    def grab(self) -> Frame:
+        for attempt in range(2):
+            try:
+                if self._conn is None:
+                    self._open()
+                sock = self._conn.conn
+                sock.sendall(b"\n")
+                return self._read_png(sock) if self.png else self._read_raw(sock)
+            except OSError:
+                # Conexión rota (adbd reiniciado, emulador relanzado): reabrir una vez
+                self.close()
+                if attempt == 1:
+                    raise
+        raise OSError("Captura no disponible.")
+
+
+class _MjpegBackend:
+    """
+    Cliente del stream MJPEG (multipart/x-mixed-replace); conserva solo el último JPEG.
+    Sin `port`, reenvía un puerto local propio al servidor MJPEG del dispositivo `serial`
+    (cada dispositivo su stream); con `port`, lee ese puerto local tal cual.
+    """
+
+    def __init__(self, serial: str, host: str = MJPEG_HOST, port: Optional[int] = None):
+        self.serial = serial
+        self.name = "mjpeg"
+        self.host, self.port = host, port
+        self._forwarded = False
+        self._latest = b""
+        self._latest_ts = 0.0
+        self._returned_ts = 0.0
+        self._error: Optional[str] = None
+        self._cond = threading.Condition()
+        self._buf = _Buffer(512 << 10)
+        self._stop = threading.Event()
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            if self.port is None:
+                self.port, self._forwarded = adb_client.forward_port(self.serial, MJPEG_DEVICE_PORT)
+                print(f"[FrameCapture] MJPEG de {self.serial}: {self.host}:{self.port} -> tcp:{MJPEG_DEVICE_PORT}")
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"mjpeg-{self.serial}", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self._forwarded:
+            self._forwarded = False
+            try:
+                adb_client.forward_remove(self.serial, self.port)
+            except Exception as e:
+                print(f"[FrameCapture] No se pudo quitar el reenvío MJPEG de {self.serial}: {e}")
+            self.port = None
+
+    def _fail(self, error: str) -> None:
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._sock = socket.create_connection((self.host, self.port), timeout=10)
+                self._sock.sendall(f"GET / HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n\r\n".encode())
+                self._read_stream(self._sock.makefile("rb"))
+                self._fail("el stream se cerró")
+            except OSError as e:
+                if self._stop.is_set():
+                    break
+                self._fail(str(e))
+                print(f"[FrameCapture] MJPEG {self.serial} ({self.host}:{self.port}) interrumpido ({e}); reintentando.")
+            self._stop.wait(1)
+
+    def _read_stream(self, f) -> None:
+        # Solo vale un stream MJPEG: cualquier otra respuesta (o ninguna) es un error
+        status = f.readline()
+        if not status.startswith(b"HTTP/") or status.split(b" ", 2)[1:2] != [b"200"]:
+            raise OSError(f"no es un servidor MJPEG (respuesta {status.strip()[:80]!r})")
+        content_type = b""
+        while (line := f.readline()) not in (b"\r\n", b"\n", b""):
+            if line.lower().startswith(b"content-type:"):
+                content_type = line.split(b":", 1)[1].strip().lower()
+        if not content_type.startswith(b"multipart/"):
+            raise OSError(f"respuesta sin stream MJPEG (Content-Type {content_type.decode(errors='ignore')!r})")
+        while not self._stop.is_set():
+            length = None
+            line = f.readline()
+            if not line:
+                return
+            # Cabeceras de la parte: '--boundary', Content-Type, Content-Length
+            while line not in (b"\r\n", b"\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+                line = f.readline()
+                if not line:
+                    return
+            if length is not None:
+                jpeg = f.read(length)
+            else:
+                data = bytearray()
+                while not data.endswith(b"\xff\xd9"):
+                    b = f.read(1)
+                    if not b:
+                        return
+                    data += b
+                jpeg = bytes(data)
+            with self._cond:
+                self._latest, self._latest_ts = jpeg, time.time()
+                self._error = None
+                self._cond.notify_all()
+
+    def grab(self, timeout: float = 5) -> Frame:
+        self._start()
+        with self._cond:
+            fresh = lambda: self._latest_ts > self._returned_ts
+            if not self._cond.wait_for(lambda: fresh() or self._error is not None, timeout):
+                raise TimeoutError(f"Sin fotogramas MJPEG de {self.serial} ({self.host}:{self.port}) en {timeout}s.")
+            if not fresh():
+                # No esperar al timeout: el puerto no está emitiendo para este dispositivo
+                raise OSError(f"MJPEG de {self.serial} ({self.host}:{self.port}) no disponible: {self._error}")
+            jpeg, self._returned_ts = self._latest, self._latest_ts
+        self._buf.ensure(len(jpeg))
+        view = memoryview(self._buf.buf)
+        view[:len(jpeg)] = jpeg
+        return Frame(0, 0, "jpeg", view[:len(jpeg)], 0, 0)
+
+
+_BACKENDS = ("raw", "png", "mjpeg")
+
+
+class FrameCapture:
+    """Capturador de fotogramas de un dispositivo con el backend elegido."""
+
+    def __init__(self, serial: str, backend: Optional[str] = None, **opts):
+        self.serial = serial
+        backend = (backend or FRAME_CAPTURE_BACKEND).lower()
+        if backend not in _BACKENDS:
+            raise ValueError(f"Backend de captura desconocido: {backend}. Opciones: {_BACKENDS}")
+        if backend == "mjpeg":
+            self._backend = _MjpegBackend(serial, **opts)
+        else:
+            self._backend = _ScreencapBackend(serial, png=backend == "png")
+        self.backend = backend
+        self._lock = threading.Lock()
+
+    def grab(self) -> Frame:
+        with self._lock:
+            t0 = time.perf_counter()
+            frame = self._backend.grab()
+            frame.latency_ms = (time.perf_counter() - t0) * 1000
+            frame.ts = time.time()
+            return frame
+
+    def close(self) -> None:
+        self._backend.close()
+
+    def benchmark(self, frames: int = 30, warmup: int = 2) -> Dict[str, Any]:
+        """Latencia (p50/p95/max) y fotogramas por segundo capturando `frames` seguidos."""
+        for _ in range(warmup):
+            self.grab()
+        latencies: List[float] = []
+        size = 0
+        t0 = time.perf_counter()
+        for _ in range(frames):
+            frame = self.grab()
+            latencies.append(frame.latency_ms)
+            size = len(frame.data)
+        elapsed = time.perf_counter() - t0
+        latencies.sort()
+        return {
+            "backend": self.backend,
+            "frames": frames,
+            "p50_ms": round(latencies[len(latencies) // 2], 1),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+            "max_ms": round(latencies[-1], 1),
+            "fps": round(frames / elapsed, 1) if elapsed else None,
+            "bytes_per_frame": size,
+        }
+
+
+# Un capturador por (serial, backend) en este proceso
+_captures: Dict[tuple, FrameCapture] = {}
+_captures_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _captures_lock
+    _captures.clear()
+    _captures_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get(serial: str, backend: Optional[str] = None) -> FrameCapture:
+    """Capturador (reutilizado) de `serial`; la conexión se abre en la primera captura."""
+    key = (serial, (backend or FRAME_CAPTURE_BACKEND).lower())
+    with _captures_lock:
+        capture = _captures.get(key)
+        if capture is None:
+            capture = _captures[key] = FrameCapture(serial, key[1])
+    return capture
+
+
+def close(serial: str) -> None:
+    with _captures_lock:
+        keys = [k for k in _captures if k[0] == serial]
+        captures = [_captures.pop(k) for k in keys]
+    for capture in captures:
+        capture.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de captura de fotogramas por backend.")
+    parser.add_argument("serial")
+    parser.add_argument("--backend", default="all", choices=("all",) + _BACKENDS)
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--mjpeg-port", type=int, default=None,
+                        help="puerto local ya reenviado; por defecto se crea un adb forward propio")
+    args = parser.parse_args()
+
+    results = []
+    for backend in (_BACKENDS if args.backend == "all" else (args.backend,)):
+        opts = {"port": args.mjpeg_port} if backend == "mjpeg" and args.mjpeg_port else {}
+        capture = FrameCapture(args.serial, backend, **opts)
+        try:
+            results.append(capture.benchmark(args.frames))
+        except (OSError, TimeoutError) as e:
+            results.append({"backend": backend, "error": str(e)})
+        finally:
+            capture.close()
+    for r in results:
+        print(json.dumps(r))
+    sys.exit(0 if any("error" not in r for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# adb/logcat_stream.py
+"""
+Logcat continuo por dispositivo sobre una única conexión ADB (`shell:logcat -v epoch`).
+Las líneas se guardan en un buffer circular en memoria; solo se escriben a disco cuando un
+flujo falla (`dump`), con los últimos N segundos.
+"""
+import os
+import re
+import time
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Optional, List, Dict, Deque, Tuple
+
+from adb import adb_client
+
+LOGCAT_BUFFER_LINES = int(os.getenv("LOGCAT_BUFFER_LINES", "20000"))
+LOGCAT_DUMP_SECONDS = float(os.getenv("LOGCAT_DUMP_SECONDS", "60"))
+# Filtros de tag estilo logcat separados por comas, p.ej. "ActivityManager:I,AndroidRuntime:E"
+LOGCAT_TAGS = [t.strip() for t in os.getenv("LOGCAT_TAGS", "").split(",") if t.strip()]
+LOGCAT_DUMP_DIR = Path(os.getenv("LOGCAT_DUMP_DIR", "debug"))
+
+# "  1700000000.123  1234  1250 I Tag: mensaje"
+_EPOCH_RE = re.compile(r"^\s*(\d+\.\d+)\s")
+
+
+class LogcatStream:
+    """Lector de logcat de un dispositivo con buffer circular de (timestamp, línea)."""
+
+    def __init__(self, serial: str, tags: Optional[List[str]] = None, package: Optional[str] = None,
+                 max_lines: int = LOGCAT_BUFFER_LINES):
+        self.serial = serial
+        self.tags = list(tags or [])
+        self.package = package
+        self._lines: Deque[Tuple[float, str]] = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _service(self) -> str:
+        # -T 1: solo líneas nuevas (no reenviar el buffer del dispositivo al reconectar)
+        args = ["logcat", "-v", "epoch", "-b", "main,system,crash", "-T", "1"]
+        if self.package:
+            uid = self._package_uid()
+            if uid:
+                args.append(f"--uid={uid}")
+        if self.tags:
+            args += self.tags + ["*:S"]
+        return "shell:" + " ".join(args)
+
+    def _package_uid(self) -> Optional[str]:
+        try:
+            out = adb_client.session(self.serial).run(f"pm list packages -U {self.package}")
+        except (OSError, TimeoutError):
+            return None
+        for line in out.splitlines():
+            # package:com.instagram.android uid:10123
+            if line.startswith(f"package:{self.package} ") and "uid:" in line:
+                return line.rsplit("uid:", 1)[1].split(",")[0].strip()
+        return None
+
+    def start(self) -> "LogcatStream":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"logcat-{self.serial}", daemon=True)
+            self._thread.start()
+            print(f"[Logcat] Stream iniciado en {self.serial} (tags={self.tags or '*'}, package={self.package}).")
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                self._conn = adb_client.open_stream(self.serial, self._service())
+                self.connected = True
+                backoff = 1.0
+                self._on_connect()
+                self._read(self._conn.conn)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                print(f"[Logcat] {self.serial}: stream interrumpido ({e}); reintentando en {backoff:.0f}s.")
+            finally:
+                self.connected = False
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except Exception:
+                        pass
+                    self._conn = None
+            # adbd reiniciado / emulador relanzado: reconectar con espera creciente
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 15.0)
+
+    def _read(self, sock) -> None:
+        pending = b""
+        while not self._stop.is_set():
+            chunk = sock.recv(65536)
+            if not chunk:
+                return
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            if not lines:
+                continue
+            now = time.time()
+            parsed = []
+            for raw in lines:
+                line = raw.decode(errors="ignore").rstrip("\r")
+                if not line:
+                    continue
+                m = _EPOCH_RE.match(line)
+                parsed.append((float(m.group(1)) if m else now, line))
+            self._on_lines(parsed)
+
+    def _on_connect(self) -> None:
+        """Gancho para subclases: conexión (re)abierta."""
+
+    def _on_lines(self, lines: List[Tuple[float, str]]) -> None:
+        with self._lock:
+            self._lines.extend(lines)
+
+    def tail(self, seconds: float = LOGCAT_DUMP_SECONDS) -> List[str]:
+        """Líneas de los últimos `seconds` (según el reloj del dispositivo)."""
+        with self._lock:
+            if not self._lines:
+                return []
+            cutoff = self._lines[-1][0] - seconds
+            return [line for ts, line in self._lines if ts >= cutoff]
+
+    def dump(self, path: Path, seconds: float = LOGCAT_DUMP_SECONDS) -> Optional[Path]:
+        """Escribe los últimos `seconds` en `path`. No escribe nada si el buffer está vacío."""
+        lines = self.tail(seconds)
+        if not lines:
+            return None
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"[Logcat] {len(lines)} líneas de {self.serial} guardadas en: {path}")
+        return path
+
+
+# Registro por serial (uno por dispositivo en este proceso)
+_streams: Dict[str, LogcatStream] = {}
+_streams_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _streams_lock
+    _streams.clear()
+    _streams_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def start(serial: str, tags: Optional[List[str]] = None, package: Optional[str] = None) -> LogcatStream:
+    """Arranca (o reutiliza) el stream de `serial`."""
+    with _streams_lock:
+        stream = _streams.get(serial)
+        if stream is None:
+            stream = _streams[serial] = LogcatStream(serial, tags=tags if tags is not None else LOGCAT_TAGS,
+                                                     package=package)
+    return stream.start()
+
+
+def get(serial: str) -> Optional[LogcatStream]:
+    return _streams.get(serial)
+
+
+def stop(serial: str) -> None:
+    with _streams_lock:
+        stream = _streams.pop(serial, None)
+    if stream is not None:
+        stream.stop()
+
+
+def tail_for(serial: Optional[str], seconds: float = LOGCAT_DUMP_SECONDS) -> List[str]:
+    """Últimas líneas del buffer del dispositivo (sin tocar disco); vacío si no hay stream."""
+    stream = _streams.get(serial) if serial else None
+    return stream.tail(seconds) if stream is not None else []
+
+
+def dump_for(serial: Optional[str], tag: str, seconds: float = LOGCAT_DUMP_SECONDS) -> Optional[Path]:
+    """Vuelca el buffer del dispositivo si tiene stream activo; si no, no hace nada."""
+    stream = _streams.get(serial) if serial else None
+    if stream is None:
+        return None
+    name = f"logcat_{tag}_{serial}_{time.strftime('%Y%m%d_%H%M%S')}.txt"
+    return stream.dump(LOGCAT_DUMP_DIR / name, seconds)
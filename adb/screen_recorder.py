@@ -0,0 +1,172 @@
+# adb/screen_recorder.py
+"""
+Grabación en el propio dispositivo con `screenrecord` encadenando segmentos desde un único
+`shell:` de larga duración (sin el límite de 180 s de screenrecord ni ida y vuelta por
+WebDriver). Con `keep=K` solo se conservan en el dispositivo los K últimos segmentos
+(grabación "rodante"): si el flujo va bien se descartan sin copiarlos; si falla se copian
+y se concatenan. Los comandos de control y las copias (`exec:cat`) van por conexiones ADB
+propias, así que no compiten con la sesión `sh` compartida ni con el driver.
+"""
+import os
+import re
+import shutil
+import threading
+import subprocess
+from pathlib import Path
+from typing import Optional, List
+
+import adbutils
+
+from adb import adb_client
+
+REMOTE_DIR = "/data/local/tmp/screenrec"
+_SEG_RE = re.compile(r"^seg_(\d+)\.mp4$")
+
+
+def concat_segments(segments: List[Path], out: Path) -> List[Path]:
+    """
+    Une los segmentos en `out` con ffmpeg (concat demuxer, sin recodificar) y los borra.
+    Sin ffmpeg los deja como `<out>_partN.mp4`. Devuelve los ficheros resultantes.
+    """
+    out = Path(out)
+    if not segments:
+        return []
+    if len(segments) == 1:
+        shutil.move(str(segments[0]), out)
+        return [out]
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        listing = out.with_suffix(".txt")
+        listing.write_text("".join(f"file '{p.resolve()}'\n" for p in segments))
+        try:
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                            "-i", str(listing), "-c", "copy", str(out)], check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            print(f"[ScreenRecorder] ffmpeg no pudo concatenar ({e.stderr.decode(errors='ignore')[-200:]}); "
+                  f"se guardan los segmentos por separado.")
+        else:
+            for p in segments:
+                p.unlink(missing_ok=True)
+            return [out]
+        finally:
+            listing.unlink(missing_ok=True)
+    parts = []
+    for i, p in enumerate(segments, 1):
+        dst = out.with_name(f"{out.stem}_part{i}{out.suffix}")
+        shutil.move(str(p), dst)
+        parts.append(dst)
+    return parts
+
+
+class AdbScreenRecorder:
+    """Segmentos de `screenrecord` encadenados en el dispositivo `serial`."""
+
+    def __init__(self, serial: str, tag: str, segment_seconds: int = 180, keep: Optional[int] = None,
+                 bit_rate: int = 4_000_000, size: Optional[str] = "720x1280"):
+        self.serial = serial
+        self.remote_dir = f"{REMOTE_DIR}/{re.sub(r'[^A-Za-z0-9_.-]', '_', tag)}"
+        self.segment_seconds = max(1, min(int(segment_seconds), 180))  # límite de screenrecord
+        self.keep = keep
+        self.bit_rate = bit_rate
+        self.size = size
+        self._conn = None
+        self._thread: Optional[threading.Thread] = None
+        self._done = threading.Event()
+
+    def _script(self) -> str:
+        d = self.remote_dir
+        opts = f"--time-limit {self.segment_seconds} --bit-rate {self.bit_rate}"
+        if self.size:
+            opts += f" --size {self.size}"
+        prune = f"rm -f {d}/seg_$((i-{self.keep})).mp4; " if self.keep else ""
+        # Un screenrecord en segundo plano por segmento: su pid permite pararlo con SIGINT
+        # (cierra el MP4 correctamente) y el fichero 'stop' corta el bucle.
+        return (
+            f"rm -rf {d}; mkdir -p {d}; i=0; "
+            f"while [ ! -f {d}/stop ]; do "
+            f"screenrecord {opts} {d}/seg_$i.mp4 & echo $! > {d}/rec.pid; wait $!; "
+            f"{prune}i=$((i+1)); done"
+        )
+
+    def start(self) -> "AdbScreenRecorder":
+        self._done.clear()
+        self._conn = adb_client.open_stream(self.serial, "shell:" + self._script())
+        self._thread = threading.Thread(target=self._drain, name=f"screenrec-{self.serial}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _drain(self) -> None:
+        # La salida no interesa; el fin del stream indica que el bucle terminó
+        try:
+            while self._conn is not None and self._conn.conn.recv(4096):
+                pass
+        except OSError:
+            pass
+        finally:
+            self._done.set()
+
+    def _run(self, cmd: str) -> str:
+        """Comando corto por una conexión propia (no espera a la sesión `sh` compartida)."""
+        return adb_client.device(self.serial).shell(cmd, timeout=15)
+
+    def stop(self, timeout: float = 15) -> None:
+        """Corta el bucle y cierra el segmento en curso (SIGINT) esperando a que se escriba."""
+        if self._conn is None:
+            return
+        d = self.remote_dir
+        try:
+            self._run(f"touch {d}/stop; kill -INT $(cat {d}/rec.pid) 2>/dev/null")
+            self._done.wait(timeout)
+        except (OSError, TimeoutError, adbutils.AdbError) as e:
+            print(f"[ScreenRecorder] {self.serial}: no se pudo parar la grabación limpiamente: {e}")
+        finally:
+            conn, self._conn = self._conn, None
+            try:
+                conn.close()
+            except Exception:
+                pass
+            if self._thread is not None:
+                self._thread.join(timeout=2)
+                self._thread = None
+
+    def segments(self) -> List[str]:
+        """Rutas remotas de los segmentos, en orden."""
+        out = self._run(f"ls {self.remote_dir} 2>/dev/null")
+        nums = sorted(int(m.group(1)) for m in (_SEG_RE.match(n.strip()) for n in out.split()) if m)
+        return [f"{self.remote_dir}/seg_{n}.mp4" for n in nums]
+
+    def _pull_exec_out(self, remote: str, dst: Path) -> int:
+        """Equivalente a `adb exec-out cat remote > dst`, por bloques."""
+        conn = adb_client.open_stream(self.serial, f"exec:cat {remote}")
+        size = 0
+        try:
+            with open(dst, "wb") as f:
+                while True:
+                    block = conn.conn.recv(1 << 20)
+                    if not block:
+                        break
+                    f.write(block)
+                    size += len(block)
+        finally:
+            conn.close()
+        return size
+
+    def pull(self, out: Path) -> List[Path]:
+        """Copia los segmentos del dispositivo y los une en `out` (ver `concat_segments`)."""
+        out = Path(out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        local = []
+        for remote in self.segments():
+            dst = out.with_name(f".{out.stem}_{os.path.basename(remote)}")
+            if self._pull_exec_out(remote, dst) > 0:
+                local.append(dst)
+            else:
+                dst.unlink()
+        return concat_segments(local, out)
+
+    def discard(self) -> None:
+        """Borra los segmentos del dispositivo."""
+        try:
+            self._run(f"rm -rf {self.remote_dir}")
+        except (OSError, TimeoutError, adbutils.AdbError) as e:
+            print(f"[ScreenRecorder] {self.serial}: no se pudieron borrar los segmentos: {e}")
@@ -0,0 +1,124 @@
+# adb/snapshots.py
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import List
+
+from adb import adb_client
+
+AVD_DIR = Path(os.getenv("ANDROID_AVD_HOME", str(Path.home() / ".android" / "avd")))
+# Snapshot "limpio" recién arrancado que se guarda una vez por clon
+BASELINE_SNAPSHOT = os.getenv("EMU_BASELINE_SNAPSHOT", "booted-clean")
+
+
+# Nombres admitidos: van tal cual a una línea de la consola y a una ruta en disco
+SNAPSHOT_NAME_RE = re.compile(r"^[A-Za-z0-9._-]+$")
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+class SnapshotRequestError(SnapshotError, ValueError):
+    """Petición inválida (nombre de snapshot o serial): error del llamador, no del emulador."""
+
+
+def validate_name(name: str) -> str:
+    if not SNAPSHOT_NAME_RE.fullmatch(name or "") or name in (".", ".."):
+        raise SnapshotRequestError(f"Nombre de snapshot no válido: {name!r} (solo letras, dígitos, '.', '_' y '-').")
+    return name
+
+
+class SnapshotManager:
+    """
+    Ciclo de vida de snapshots quickboot por AVD a través de la consola del emulador
+    (equivalente a `adb emu avd snapshot ...`).
+    """
+
+    @staticmethod
+    async def _emu(serial: str, args: List[str], timeout: int = 120) -> str:
+        command = "avd snapshot " + " ".join(args)
+        try:
+            out = await adb_client.emu(serial, command, timeout=timeout)
+        except ValueError as e:
+            raise SnapshotRequestError(str(e)) from e  # serial que no es un emulador
+        except (OSError, RuntimeError) as e:
+            # Consola inaccesible, timeout o autenticación rechazada
+            raise SnapshotError(f"'{command}' falló en {serial}: {e}") from e
+        if any(line.startswith("KO") for line in out.splitlines()):
+            raise SnapshotError(f"'{command}' falló en {serial}: {out.strip()}")
+        return out
+
+    @staticmethod
+    async def save(serial: str, name: str = BASELINE_SNAPSHOT) -> None:
+        """Guarda el estado actual del emulador como snapshot `name`."""
+        validate_name(name)
+        await SnapshotManager._emu(serial, ["save", name], timeout=300)
+        print(f"[Snapshots] {serial}: snapshot '{name}' guardado.")
+
+    @staticmethod
+    async def load(serial: str, name: str = BASELINE_SNAPSHOT) -> None:
+        """Restaura el snapshot `name` en un emulador en ejecución."""
+        validate_name(name)
+        await SnapshotManager._emu(serial, ["load", name], timeout=300)
+        print(f"[Snapshots] {serial}: snapshot '{name}' cargado.")
+
+    @staticmethod
+    async def delete(serial: str, name: str) -> None:
+        validate_name(name)
+        await SnapshotManager._emu(serial, ["delete", name])
+        print(f"[Snapshots] {serial}: snapshot '{name}' eliminado.")
+
+    @staticmethod
+    async def list(serial: str) -> List[str]:
+        """
+        Nombres de snapshots según la consola. Formato de salida:
+            List of snapshots present on all disks:
+            ID        TAG                 VM SIZE                DATE       VM CLOCK
+            --        booted-clean         270M 2024-01-01 10:00:00   00:00:42.000
+            OK
+        """
+        out = await SnapshotManager._emu(serial, ["list"])
+        names: List[str] = []
+        for line in out.splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] == "--":
+                names.append(parts[1])
+        return names
+
+    # ---------- Consultas en disco (sin emulador en ejecución) ----------
+    @staticmethod
+    def snapshots_dir(avd_name: str) -> Path:
+        return AVD_DIR / f"{avd_name}.avd" / "snapshots"
+
+    @staticmethod
+    def list_on_disk(avd_name: str) -> List[str]:
+        d = SnapshotManager.snapshots_dir(avd_name)
+        if not d.is_dir():
+            return []
+        return sorted(p.name for p in d.iterdir() if p.is_dir())
+
+    @staticmethod
+    def exists_on_disk(avd_name: str, name: str = BASELINE_SNAPSHOT) -> bool:
+        return (SnapshotManager.snapshots_dir(avd_name) / name / "snapshot.pb").exists()
+
+    @staticmethod
+    def delete_on_disk(avd_name: str, name: str) -> bool:
+        """Elimina un snapshot con el emulador apagado."""
+        d = SnapshotManager.snapshots_dir(avd_name) / validate_name(name)
+        if not d.is_dir():
+            return False
+        shutil.rmtree(d)
+        return True
+
+    @staticmethod
+    async def ensure_baseline(serial: str, avd_name: str, name: str = BASELINE_SNAPSHOT) -> bool:
+        """
+        Guarda el snapshot base si el AVD aún no lo tiene. Devuelve True si lo creó.
+        Debe llamarse justo después de un arranque limpio (antes de abrir la app).
+        """
+        if SnapshotManager.exists_on_disk(avd_name, name):
+            return False
+        await SnapshotManager.save(serial, name)
+        return True
@@ -0,0 +1,35 @@
+# adb/teardown.py
+import time
+import asyncio
+from typing import Dict, Any
+
+from adb.appium_server_manager import AppiumServerManager
+from adb.emulator_fleet import EmulatorFleet
+
+
+async def teardown_all(pool=None, supervisor=None, emulator_timeout: float = 20.0,
+                       appium_timeout: float = 10.0) -> Dict[str, Any]:
+    """
+    Apaga en paralelo todos los emuladores de la flota y todos los servidores Appium
+    registrados, confirmando que cada proceso terminó. Devuelve el tiempo por recurso:
+        {"emulators": {serial: s}, "appium": {"host:port": s}, "total_seconds": s}
+    """
+    t0 = time.monotonic()
+    if supervisor is not None:
+        # Que no relance nada mientras se apaga
+        await supervisor.stop()
+    if pool is not None:
+        await pool.shutdown(stop_emulators=False)
+
+    emulators, appium = await asyncio.gather(
+        EmulatorFleet.stop_all(timeout=emulator_timeout),
+        AppiumServerManager.stop_all(timeout=appium_timeout),
+    )
+    report = {
+        "emulators": {k: round(v, 2) if isinstance(v, float) else v for k, v in emulators.items()},
+        "appium": {k: round(v, 2) if isinstance(v, float) else v for k, v in appium.items()},
+        "total_seconds": round(time.monotonic() - t0, 2),
+    }
+    print(f"[Teardown] {len(emulators)} emuladores y {len(appium)} servidores Appium "
+          f"detenidos en {report['total_seconds']}s: {report}")
+    return report
@@ -13,6 +13,8 @@ from app.utils.instagram_locators import LoginLocators
 from app.utils.instagram_selectors import IG_APP_ID, ResourceID, TabBarText
 from app.flows.otp_flow import OtpFlow                 # requiere pyotp instalado
 from app.flows.password_change_flow import PasswordChangeFlow  # opcional
+from adb import activity_events
+from driver.driver_manager import driver_serial
 
 # Activities típicas de IG
 CANDIDATE_ACTIVITIES = [
@@ -64,6 +66,10 @@ class LoginFlow:
 
     # ---------- Helpers de contexto/estado ----------
     def wait_instagram_activity(self, timeout: int = 25) -> bool:
+        # Con stream de eventos del dispositivo: sin sondear Appium
+        stream = activity_events.get(driver_serial(self.driver))
+        if stream is not None:
+            return stream.wait_for(CANDIDATE_ACTIVITIES, timeout) is not None
         end = time.time() + timeout
         while time.time() < end:
             try:
@@ -272,7 +278,8 @@ class LoginFlow:
             return True
         # Activity principal
         try:
-            act = self.driver.current_activity or ""
+            stream = activity_events.get(driver_serial(self.driver))
+            act = (stream.current if stream else self.driver.current_activity) or ""
             if any(act.endswith(x) for x in LOGGED_IN_ACTIVITIES):
                 return True
         except Exception:
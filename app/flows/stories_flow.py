@@ -1,7 +1,8 @@
 # app/flows/stories_flow.py
 from __future__ import annotations
+import os
 import time
-from typing import List
+from typing import List, Optional
 
 from appium.webdriver.common.appiumby import AppiumBy
 from selenium.webdriver.support.ui import WebDriverWait
@@ -11,6 +12,12 @@ from app.core.ui import UI
 from app.gramaddict_adapter import GA
 from app.flows.navigation import NavigationFlow
 from app.utils.instagram_selectors import IG_APP_ID, ResourceID
+from driver.driver_manager import driver_serial
+
+# Detectores visuales (NumPy) antes que la jerarquía; la jerarquía queda como respaldo
+STORIES_VISUAL_DETECTORS = os.getenv("STORIES_VISUAL_DETECTORS", "0") == "1"
+# Si se define, guarda muestras etiquetadas por la jerarquía para `story_visual_detectors bench`
+STORIES_VISUAL_RECORD_DIR = os.getenv("STORIES_VISUAL_RECORD_DIR", "")
 
 
 class StoriesFlow:
@@ -27,12 +34,43 @@ class StoriesFlow:
     OUTER_CONTAINER_XP_GLOBAL = f"(//android.widget.LinearLayout[@resource-id='{OUTER_CONTAINER_RID}'])[1]"
     OUTER_CONTAINER_XP_REL = f".//android.widget.LinearLayout[@resource-id='{OUTER_CONTAINER_RID}']"
 
-    def __init__(self, driver):
+    def __init__(self, driver, visual: Optional[bool] = None):
         self.driver = driver
         self.ui = UI(driver)
         self.ga = GA(driver)
         self.rids = ResourceID(IG_APP_ID)
-        print("[Stories] Inicializado StoriesFlow (modo simple 1.5s + ads)")
+        self.visual = None
+        self._visual_state = None
+        if (STORIES_VISUAL_DETECTORS if visual is None else visual) or STORIES_VISUAL_RECORD_DIR:
+            self.visual = self._init_visual()
+        self._visual_trusted = bool(self.visual) and (STORIES_VISUAL_DETECTORS if visual is None else visual)
+        print("[Stories] Inicializado StoriesFlow (modo simple 1.5s + ads"
+              + (", detectores visuales)" if self._visual_trusted else ")"))
+
+    def _init_visual(self):
+        serial = driver_serial(self.driver)
+        if not serial:
+            print("[Stories] Sin serial del dispositivo; detectores visuales desactivados")
+            return None
+        try:
+            # Import perezoso: NumPy solo hace falta con los detectores activos
+            from adb import frame_capture
+            from app.utils.story_visual_detectors import StoryVisualDetectors
+            return StoryVisualDetectors(frame_capture.get(serial, "raw"))
+        except Exception as e:
+            print(f"[Stories] Detectores visuales no disponibles: {e!r}")
+            return None
+
+    def _observe(self):
+        """Estado visual de la pantalla actual (None si falla la captura)."""
+        if self.visual is None:
+            return None
+        try:
+            self._visual_state = self.visual.observe()
+        except Exception as e:
+            print(f"[Stories] Captura visual falló: {e!r}")
+            self._visual_state = None
+        return self._visual_state
 
     # ------- utils básicos -------
     def _size(self):
@@ -94,6 +132,18 @@ class StoriesFlow:
             print(f"[Stories] Swipe izquierda falló: {e!r}")
 
     def _is_viewer_open(self) -> bool:
+        if self._visual_trusted:
+            state = self._observe()
+            # Barra de progreso visible y pantalla viva: no hace falta consultar la jerarquía
+            if state is not None and state.viewer_open and not state.stalled:
+                print(f"[Stories] Visor activo (visual: {state.progress.current + 1}/{state.progress.segments}, "
+                      f"{state.capture_ms + state.detect_ms:.0f} ms)")
+                return True
+            if state is not None and state.stalled:
+                print("[Stories] Pantalla congelada según detector visual; confirmo con la jerarquía")
+        return self._is_viewer_open_hierarchy()
+
+    def _is_viewer_open_hierarchy(self) -> bool:
         # Señales suficientes de visor activo (con prints)
         try:
             if self.ga.id_any(self.rids.REEL_VIEWER_MEDIA_CONTAINER).exists(1):
@@ -122,8 +172,41 @@ class StoriesFlow:
         except Exception as e:
             print(f"[Stories] No se pudo cerrar el visor: {e!r}")
 
+    def _record_sample(self) -> None:
+        """Guarda el fotograma actual etiquetado (y cronometrado) con la jerarquía."""
+        state = self._observe()
+        if state is None:
+            return
+        gray = self.visual.last_gray
+        t0 = time.perf_counter()
+        viewer_open = self._is_viewer_open_hierarchy()
+        t1 = time.perf_counter()
+        is_ad = self._looks_like_ad_hierarchy()
+        t2 = time.perf_counter()
+        try:
+            from app.utils.story_visual_detectors import save_sample
+            save_sample(STORIES_VISUAL_RECORD_DIR, gray, {
+                "viewer_open": viewer_open, "is_ad": is_ad,
+                "viewer_open_ms": round((t1 - t0) * 1000, 1), "is_ad_ms": round((t2 - t1) * 1000, 1),
+                "capture_ms": round(state.capture_ms, 1),
+                "visual": {"viewer_open": state.viewer_open, "is_ad": state.is_ad, "stalled": state.stalled,
+                           "progress": state.progress.to_dict()},
+            })
+        except Exception as e:
+            print(f"[Stories] No se pudo guardar la muestra visual: {e!r}")
+
     # ------- detección de anuncios -------
     def _looks_like_ad(self) -> bool:
+        if self._visual_trusted:
+            # Reutiliza la captura de _is_viewer_open si es de este mismo paso
+            state = self._visual_state or self._observe()
+            if state is not None and state.is_ad is not None:
+                if state.is_ad:
+                    print("[Stories] Anuncio detectado por plantilla visual")
+                return state.is_ad
+        return self._looks_like_ad_hierarchy()
+
+    def _looks_like_ad_hierarchy(self) -> bool:
         """
         Devuelve True si la storie actual parece ser un anuncio:
         - por contenedor SPONSORED_CONTENT_SERVER_RENDERED_ROOT
@@ -237,12 +320,16 @@ class StoriesFlow:
         while seen < max_stories and self._is_viewer_open():
             print(f"[Stories] Esperando {delay:.1f}s antes de avanzar… (story #{seen + 1})")
             time.sleep(delay)
+            self._visual_state = None
+            if STORIES_VISUAL_RECORD_DIR:
+                self._record_sample()
 
             if self._looks_like_ad():
                 print("[Stories] Anuncio detectado → usar swipe izquierda")
                 self._swipe_left()
             else:
                 self._tap_right()
+            self._visual_state = None
 
             seen += 1
             print(f"[Stories] Avanzado → {seen}/{max_stories}")
@@ -1,9 +1,10 @@
 # app/instagram_actions.py
 import asyncio
 import time
-from pathlib import Path
 
-from driver.driver_manager import get_driver
+from driver.driver_manager import get_driver, driver_serial
+from adb import logcat_stream, activity_events, frame_capture
+from utils import debug_sink
 from app.flows.login_flow import LoginFlow
 from app.flows.navigation import NavigationFlow
 from app.flows.stories_flow import StoriesFlow
@@ -15,9 +16,6 @@ from appium.webdriver.common.appiumby import AppiumBy
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-DEBUG_DIR = Path("debug")
-DEBUG_DIR.mkdir(exist_ok=True)
-
 class InstagramActions:
 
     @staticmethod
@@ -60,24 +58,47 @@ class InstagramActions:
         time.sleep(extra_delay)
         print("[HomeReady] Home listo para iniciar Stories.")
         
+    @staticmethod
+    def _capture_screenshot(driver):
+        """
+        Fotograma por captura ADB (decenas de ms; el PNG se codifica luego en el hilo del
+        debug sink). Si no hay serial o falla, screenshot de Appium.
+        """
+        serial = driver_serial(driver)
+        if serial:
+            try:
+                return frame_capture.get(serial).grab().copy().to_png
+            except Exception as e:
+                print(f"[DEBUG] captura ADB no disponible ({e}); uso screenshot de Appium.")
+        return driver.get_screenshot_as_png()
+
     @staticmethod
     def dump_debug(driver, tag="init"):
-        """Guarda info de depuración: package, activity, page source y screenshot."""
+        """
+        Captura info de depuración (package, activity, page source, screenshot y logcat
+        reciente) y la encola en el debug sink: la escritura a disco no bloquea el flujo.
+        """
+        try:
+            lines = logcat_stream.tail_for(driver_serial(driver))
+        except Exception as e:
+            print(f"[DEBUG] logcat tail error: {e}")
+            lines = []
+        log = "\n".join(lines) + "\n" if lines else None
         try:
             pkg = driver.current_package
             act = driver.current_activity
             print(f"[DEBUG] current_package={pkg} current_activity={act}")
 
-            src_path = DEBUG_DIR / f"page_source_{tag}.xml"
-            with open(src_path, "w", encoding="utf-8") as f:
-                f.write(driver.page_source)
-            print(f"[DEBUG] page source guardado en: {src_path}")
-
-            ss_path = DEBUG_DIR / f"screenshot_{tag}.png"
-            driver.save_screenshot(str(ss_path))
-            print(f"[DEBUG] screenshot guardado en: {ss_path}")
+            debug_sink.capture(
+                tag,
+                txt=f"current_package={pkg}\ncurrent_activity={act}\n",
+                xml=driver.page_source,
+                png=InstagramActions._capture_screenshot(driver),
+                log=log,
+            )
         except Exception as e:
             print(f"[DEBUG] dump error: {e}")
+            debug_sink.capture(tag, log=log)  # el logcat sirve aunque la sesión Appium haya caído
 
     @staticmethod
     def wait_instagram_activity(driver, timeout=25):
@@ -90,6 +111,9 @@ class InstagramActions:
             ".activity.IgActivity",
             "com.instagram.modal.ModalActivity",
         ]
+        stream = activity_events.get(driver_serial(driver))
+        if stream is not None:
+            return stream.wait_for(CANDIDATAS, timeout) is not None
         end = time.time() + timeout
         while time.time() < end:
             try:
@@ -0,0 +1,304 @@
+# app/utils/story_visual_detectors.py
+"""
+Detectores visuales del visor de stories sobre fotogramas reducidos (NumPy, vectorizado),
+como alternativa a consultar la jerarquía de accesibilidad varias veces por storie:
+- ProgressBarDetector: barra segmentada de progreso arriba del visor (visor abierto,
+  número de segmentos, segmento actual y avance).
+- StallDetector: pantalla congelada (diferencia entre fotogramas bajo umbral y la barra
+  de progreso sin moverse).
+- SponsoredBadgeDetector: "Sponsored"/"Patrocinado" por correlación normalizada (NCC, FFT)
+  con una plantilla en la zona de cabecera.
+
+Todos trabajan con la imagen en grises de ancho PREP_WIDTH que devuelve `prepare(frame)`.
+Para validarlos contra la jerarquía, StoriesFlow guarda muestras (.npz con la imagen, las
+etiquetas y latencias de la jerarquía) si STORIES_VISUAL_RECORD_DIR está definido, y:
+
+    python -m app.utils.story_visual_detectors bench <dir_muestras> [--template sponsored.npy]
+    python -m app.utils.story_visual_detectors template <muestra.npz> --box X Y W H -o sponsored.npy
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+
+import numpy as np
+
+PREP_WIDTH = int(os.getenv("STORY_VISUAL_WIDTH", "360"))
+STORY_SPONSORED_TEMPLATE = os.getenv("STORY_SPONSORED_TEMPLATE", "")
+STORY_SPONSORED_THRESHOLD = float(os.getenv("STORY_SPONSORED_THRESHOLD", "0.7"))
+
+
+def prepare(frame) -> np.ndarray:
+    """Grises uint8 de ancho ~PREP_WIDTH desde un `Frame` raw (vista sin copia del buffer)."""
+    if frame.format not in ("rgba", "rgbx", "bgra"):
+        raise ValueError(f"Se necesita un fotograma raw, no {frame.format}.")
+    arr = np.frombuffer(frame.data, dtype=np.uint8).reshape(frame.height, frame.width, 4)
+    step = max(1, frame.width // PREP_WIDTH)
+    small = arr[::step, ::step]
+    r, b = (small[..., 2], small[..., 0]) if frame.format == "bgra" else (small[..., 0], small[..., 2])
+    g = small[..., 1]
+    # Luma BT.601 en enteros
+    return ((r.astype(np.uint16) * 77 + g.astype(np.uint16) * 150 + b.astype(np.uint16) * 29) >> 8).astype(np.uint8)
+
+
+class ProgressState:
+    __slots__ = ("visible", "segments", "current", "fraction")
+
+    def __init__(self, visible: bool, segments: int = 0, current: int = 0, fraction: float = 0.0):
+        self.visible = visible
+        self.segments = segments
+        self.current = current
+        self.fraction = fraction
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"visible": self.visible, "segments": self.segments, "current": self.current,
+                "fraction": round(self.fraction, 3)}
+
+
+class ProgressBarDetector:
+    """Línea fina y clara a lo ancho de la franja superior, partida en segmentos."""
+
+    def __init__(self, band: float = 0.05, bar_min: int = 160, filled_min: int = 235,
+                 min_coverage: float = 0.6, max_rows: int = 3):
+        self.band = band
+        self.bar_min = bar_min
+        self.filled_min = filled_min
+        self.min_coverage = min_coverage
+        self.max_rows = max_rows
+
+    def detect(self, gray: np.ndarray) -> ProgressState:
+        h, w = gray.shape
+        band = gray[:max(4, int(h * self.band)), int(w * 0.02):int(w * 0.98)]
+        bright = band >= self.bar_min
+        coverage = bright.mean(axis=1)
+        row = int(coverage.argmax())
+        # Una pantalla clara da cobertura alta en muchas filas; la barra ocupa muy pocas
+        if coverage[row] < self.min_coverage or int((coverage >= self.min_coverage).sum()) > self.max_rows:
+            return ProgressState(False)
+
+        line = bright[row]
+        edges = np.diff(np.concatenate(([0], line.view(np.int8), [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        keep = (ends - starts) >= 2
+        starts, ends = starts[keep], ends[keep]
+        if len(starts) == 0:
+            return ProgressState(False)
+
+        filled = band[row] >= self.filled_min
+        cum = np.concatenate(([0], np.cumsum(filled)))
+        seg_fill = (cum[ends] - cum[starts]) / (ends - starts)
+        unfinished = np.flatnonzero(seg_fill < 0.98)
+        current = int(unfinished[0]) if len(unfinished) else len(starts) - 1
+        fraction = float(filled[line].sum()) / float(line.sum())
+        return ProgressState(True, len(starts), current, fraction)
+
+
+class StallDetector:
+    """Congelado si `frames` observaciones seguidas difieren menos de `threshold` (media abs)."""
+
+    def __init__(self, threshold: float = 1.5, frames: int = 3):
+        self.threshold = threshold
+        self.frames = frames
+        self._prev: Optional[np.ndarray] = None
+        self._prev_progress: Optional[float] = None
+        self._still = 0
+
+    def update(self, gray: np.ndarray, progress: Optional[float] = None) -> bool:
+        sample = gray[::2, ::2]
+        if self._prev is not None and self._prev.shape == sample.shape:
+            diff = float(np.abs(sample.astype(np.int16) - self._prev).mean())
+            # Una foto fija con la barra avanzando no está congelada
+            moving = progress is not None and self._prev_progress is not None and progress != self._prev_progress
+            self._still = self._still + 1 if diff < self.threshold and not moving else 0
+        self._prev, self._prev_progress = sample, progress
+        return self._still >= self.frames - 1
+
+    def reset(self) -> None:
+        self._prev, self._prev_progress, self._still = None, None, 0
+
+
+def _ncc_max(region: np.ndarray, template: np.ndarray) -> float:
+    """Máximo de la correlación cruzada normalizada de `template` sobre `region` (FFT + imagen integral)."""
+    th, tw = template.shape
+    rh, rw = region.shape
+    if th > rh or tw > rw:
+        return 0.0
+    r = region.astype(np.float64)
+    t = template.astype(np.float64)
+    t = t - t.mean()
+    t_norm = np.sqrt((t * t).sum())
+    if t_norm == 0:
+        return 0.0
+    # Numerador: correlación (convolución con la plantilla invertida); la zona válida no sufre aliasing circular
+    corr = np.fft.irfft2(np.fft.rfft2(r) * np.fft.rfft2(t[::-1, ::-1], s=r.shape), s=r.shape)
+    corr = corr[th - 1:, tw - 1:]
+    # Suma y suma de cuadrados por ventana con imágenes integrales
+    ii = np.pad(r, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    ii2 = np.pad(r * r, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    s = ii[th:, tw:] - ii[:-th, tw:] - ii[th:, :-tw] + ii[:-th, :-tw]
+    s2 = ii2[th:, tw:] - ii2[:-th, tw:] - ii2[th:, :-tw] + ii2[:-th, :-tw]
+    var = np.maximum(s2 - s * s / (th * tw), 0)
+    denom = np.sqrt(var) * t_norm
+    score = np.where(denom > 1e-6, corr / np.maximum(denom, 1e-6), 0.0)
+    return float(score.max())
+
+
+class SponsoredBadgeDetector:
+    """Plantilla de la etiqueta de anuncio buscada en la cabecera (debajo de la barra de progreso)."""
+
+    def __init__(self, template: Optional[np.ndarray] = None, threshold: float = STORY_SPONSORED_THRESHOLD,
+                 region=(0.03, 0.16, 0.0, 0.75)):
+        self.template = template
+        self.threshold = threshold
+        self.region = region  # (y0, y1, x0, x1) relativos
+
+    @classmethod
+    def load(cls, path: str = STORY_SPONSORED_TEMPLATE, **kwargs) -> "SponsoredBadgeDetector":
+        template = np.load(path) if path and os.path.isfile(path) else None
+        return cls(template, **kwargs)
+
+    def score(self, gray: np.ndarray) -> Optional[float]:
+        if self.template is None:
+            return None
+        h, w = gray.shape
+        y0, y1, x0, x1 = self.region
+        return _ncc_max(gray[int(h * y0):int(h * y1), int(w * x0):int(w * x1)], self.template)
+
+    def detect(self, gray: np.ndarray) -> Optional[bool]:
+        """True/False, o None si no hay plantilla (decide la jerarquía)."""
+        s = self.score(gray)
+        return None if s is None else s >= self.threshold
+
+
+class StoryVisualState:
+    __slots__ = ("viewer_open", "is_ad", "stalled", "progress", "capture_ms", "detect_ms")
+
+    def __init__(self, viewer_open: bool, is_ad: Optional[bool], stalled: bool, progress: ProgressState,
+                 capture_ms: float, detect_ms: float):
+        self.viewer_open = viewer_open
+        self.is_ad = is_ad
+        self.stalled = stalled
+        self.progress = progress
+        self.capture_ms = capture_ms
+        self.detect_ms = detect_ms
+
+
+class StoryVisualDetectors:
+    """Los tres detectores sobre fotogramas de `frame_capture` del dispositivo."""
+
+    def __init__(self, capture, sponsored: Optional[SponsoredBadgeDetector] = None):
+        self.capture = capture
+        self.progress = ProgressBarDetector()
+        self.stall = StallDetector()
+        self.sponsored = sponsored or SponsoredBadgeDetector.load()
+        self.last_gray: Optional[np.ndarray] = None
+
+    def analyze(self, gray: np.ndarray) -> StoryVisualState:
+        t0 = time.perf_counter()
+        progress = self.progress.detect(gray)
+        stalled = self.stall.update(gray, progress.fraction if progress.visible else None)
+        is_ad = self.sponsored.detect(gray) if progress.visible else False
+        return StoryVisualState(progress.visible, is_ad, stalled, progress, 0.0,
+                                (time.perf_counter() - t0) * 1000)
+
+    def observe(self) -> StoryVisualState:
+        frame = self.capture.grab()
+        gray = prepare(frame)
+        self.last_gray = gray
+        state = self.analyze(gray)
+        state.capture_ms = frame.latency_ms
+        return state
+
+
+# ---------------------- muestras y benchmark ---------------------- #
+
+def save_sample(directory: Path, gray: np.ndarray, labels: Dict[str, Any]) -> Path:
+    """Guarda una muestra etiquetada por la jerarquía (ver StoriesFlow)."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"story_{time.strftime('%Y%m%d_%H%M%S')}_{time.perf_counter_ns() % 10**6:06d}.npz"
+    np.savez_compressed(path, gray=gray, labels=json.dumps(labels))
+    return path
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    return round(float(np.percentile(values, q)), 2) if values else None
+
+
+def benchmark(samples_dir: Path, template: Optional[str] = None) -> Dict[str, Any]:
+    """Precisión y latencia de los detectores frente a las etiquetas y latencias de la jerarquía."""
+    sponsored = SponsoredBadgeDetector.load(template or STORY_SPONSORED_TEMPLATE)
+    progress = ProgressBarDetector()
+    confusion = {k: {"tp": 0, "fp": 0, "fn": 0, "tn": 0} for k in ("viewer_open", "is_ad")}
+    visual_ms: Dict[str, List[float]] = {"viewer_open": [], "is_ad": []}
+    hier_ms: Dict[str, List[float]] = {"viewer_open": [], "is_ad": []}
+    files = sorted(Path(samples_dir).glob("*.npz"))
+    for path in files:
+        with np.load(path) as data:
+            gray = data["gray"]
+            labels = json.loads(str(data["labels"]))
+        capture_ms = float(labels.get("capture_ms") or 0.0)
+
+        t0 = time.perf_counter()
+        state = progress.detect(gray)
+        visual_ms["viewer_open"].append(capture_ms + (time.perf_counter() - t0) * 1000)
+        predictions = {"viewer_open": state.visible}
+
+        t0 = time.perf_counter()
+        ad = sponsored.detect(gray)
+        visual_ms["is_ad"].append(capture_ms + (time.perf_counter() - t0) * 1000)
+        predictions["is_ad"] = ad
+
+        for key, predicted in predictions.items():
+            truth = labels.get(key)
+            if truth is None or predicted is None:
+                continue
+            cell = ("t" if predicted == truth else "f") + ("p" if predicted else "n")
+            confusion[key][cell] += 1
+            if labels.get(f"{key}_ms") is not None:
+                hier_ms[key].append(float(labels[f"{key}_ms"]))
+
+    report: Dict[str, Any] = {"samples": len(files), "template": bool(sponsored.template is not None)}
+    for key, c in confusion.items():
+        n = sum(c.values())
+        report[key] = {
+            **c,
+            "n": n,
+            "accuracy": round((c["tp"] + c["tn"]) / n, 4) if n else None,
+            "visual_p50_ms": _percentile(visual_ms[key], 50),
+            "visual_p95_ms": _percentile(visual_ms[key], 95),
+            "hierarchy_p50_ms": _percentile(hier_ms[key], 50),
+            "hierarchy_p95_ms": _percentile(hier_ms[key], 95),
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Detectores visuales de stories: benchmark y plantillas.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_bench = sub.add_parser("bench", help="Compara detectores y jerarquía sobre muestras grabadas.")
+    p_bench.add_argument("samples_dir")
+    p_bench.add_argument("--template", default=None)
+    p_tpl = sub.add_parser("template", help="Recorta la plantilla 'Sponsored' de una muestra.")
+    p_tpl.add_argument("sample")
+    p_tpl.add_argument("--box", type=int, nargs=4, metavar=("X", "Y", "W", "H"), required=True,
+                       help="Recorte en coordenadas de la imagen reducida.")
+    p_tpl.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        print(json.dumps(benchmark(Path(args.samples_dir), args.template), indent=2))
+    else:
+        with np.load(args.sample) as data:
+            gray = data["gray"]
+        x, y, w, h = args.box
+        np.save(args.output, gray[y:y + h, x:x + w].copy())
+        print(f"Plantilla {w}x{h} guardada en {args.output}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
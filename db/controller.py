@@ -3,6 +3,9 @@ from db.users import Users
 from db.avds import Avds
 from typing import List, Tuple
 
+USERS_PER_AVD = 5
+
+
 class Controller:
     """Controlador para manejar operaciones con la base de datos (users y avds)."""
     
@@ -22,7 +25,65 @@ class Controller:
         """
         return self.avds.create(avd_name)
     
-    def add_user(self, user: str, password: str, key: str = None, new_password: str = None) -> bool:
+    def avd_usage(self) -> dict:
+        """Número de usuarios asignados por AVD.
+        
+        Returns:
+            dict: avd_name -> usuarios.
+        """
+        used = {}
+        for u in self.users.read_all():
+            if u[4]:
+                used[u[4]] = used.get(u[4], 0) + 1
+        return used
+    
+    def free_slots(self) -> int:
+        """Huecos de usuario libres en AVDs 'active' (5 usuarios por AVD).
+        
+        Returns:
+            int: Usuarios que aún caben sin crear AVDs.
+        """
+        used = self.avd_usage()
+        return sum(
+            max(0, USERS_PER_AVD - used.get(name, 0))
+            for name, status, *_ in self.avds.read_all()
+            if (status or "").strip().lower() == "active"
+        )
+    
+    def _find_available_avd(self):
+        """Primer AVD activo con menos de 5 usuarios, o None."""
+        used = self.avd_usage()
+        for avd_name, status, *_ in self.avds.read_all():
+            if status == 'active' and used.get(avd_name, 0) < USERS_PER_AVD:
+                return avd_name
+        return None
+    
+    def _mark_if_full(self, avd_name: str) -> None:
+        if self.avd_usage().get(avd_name, 0) >= USERS_PER_AVD:
+            self.avds.update(avd_name, 'completed')
+    
+    def unassigned_users(self) -> List[Tuple]:
+        """Usuarios a la espera de AVD (avd_name vacío)."""
+        return [u for u in self.users.read_all() if not u[4]]
+    
+    def assign_pending_users(self) -> int:
+        """Asigna los usuarios sin AVD a los huecos libres.
+        
+        Returns:
+            int: Usuarios asignados.
+        """
+        assigned = 0
+        for u in self.unassigned_users():
+            avd_name = self._find_available_avd()
+            if not avd_name:
+                break
+            self.users.update(u[0], avd_name=avd_name)
+            self._mark_if_full(avd_name)
+            assigned += 1
+        return assigned
+    
+    def add_user(self, user: str, password: str, key: str = None, new_password: str = None,
+                 allow_unassigned: bool = False) -> bool:
         """Agrega un usuario a la base de datos, asignando un AVD disponible (con menos de 5 usuarios).
         
         Args:
@@ -30,6 +91,8 @@ class Controller:
             password (str): Contraseña.
             key (str, optional): Clave.
             new_password (str, optional): Nueva contraseña.
+            allow_unassigned (bool, optional): Si no hay hueco, deja el usuario sin AVD
+                (lo asignará `assign_pending_users`) en lugar de crear un AVD 'avd_NNN'.
         
         Returns:
             bool: True si se agregó exitosamente, False si ya existía.
@@ -41,14 +104,10 @@ class Controller:
             return False
         
         # Encontrar un AVD activo con menos de 5 usuarios
-        available_avd = None
-        for avd in self.avds.read_all():
-            avd_name, status, _ = avd
-            if status == 'active':
-                count = len([u for u in self.users.read_all() if u[4] == avd_name])  # Índice 4: avd_name
-                if count < 5:
-                    available_avd = avd_name
-                    break
+        available_avd = self._find_available_avd()
+        
+        if not available_avd and allow_unassigned:
+            return self.users.create(user, password, key, new_password, None)
         
         if not available_avd:
             # Crear un nuevo AVD si no hay disponible
@@ -60,25 +119,30 @@ class Controller:
         created = self.users.create(user, password, key, new_password, available_avd)
         
         # Verificar si se alcanzó el límite y actualizar status a 'completed'
-        count = len([u for u in self.users.read_all() if u[4] == available_avd])
-        if count >= 5:
-            self.avds.update(available_avd, 'completed')
+        self._mark_if_full(available_avd)
         
         return created
     
-    def add_users(self, users_list: list):
+    def add_users(self, users_list: list, allow_unassigned: bool = False) -> int:
         """Agrega múltiples usuarios desde una lista (e.g., desde Excel).
         
         Args:
             users_list (list): Lista de diccionarios con datos de usuarios ({'user':, 'password':, 'key':, 'new_password':}).
+            allow_unassigned (bool, optional): Ver `add_user`.
+        
+        Returns:
+            int: Usuarios nuevos agregados.
         """
+        added = 0
         for user_data in users_list:
-            self.add_user(
+            added += bool(self.add_user(
                 user_data['user'],
                 user_data['password'],
                 user_data.get('key'),
-                user_data.get('new_password')
-            )
+                user_data.get('new_password'),
+                allow_unassigned=allow_unassigned
+            ))
+        return added
     
     def get_all_users(self) -> list:
         """Obtiene todos los usuarios de la base de datos.
@@ -8,7 +8,8 @@ from collections import defaultdict
 from app.instagram_actions import InstagramActions
 
 from adb.appium_server_manager import AppiumServerManager
-import adb.emulator as Emulator
+from adb.emulator_fleet import EmulatorFleet
+from adb import adb_client
 from utils.screen_recording import async_start, async_stop
 # from app.instagram_actions import InstagramActions
 from driver.driver_factory import (
@@ -58,7 +59,7 @@ async def start_infra_for_group(avd_name: str, port_offset: int):
 
     print(f"[{avd_name}] Lanzando emulador en ADB {adb_port} (UDID: {expected_udid})")
     # Emulador
-    await Emulator.launch(
+    await EmulatorFleet.launch(
         avd_name,
         port=adb_port,
         headless=False,
@@ -72,10 +73,11 @@ async def start_infra_for_group(avd_name: str, port_offset: int):
         ],
         optimize=True
     )
-    await Emulator.wait_for_ready(serial=expected_udid, timeout=300)
+    await EmulatorFleet.wait_for_ready(expected_udid, timeout=300)
 
-    devices = await Emulator.list_devices()
+    devices = await EmulatorFleet.list_devices()
     if expected_udid not in devices:
+        await EmulatorFleet.stop(expected_udid)
         await AppiumServerManager.stop_appium_server(host, appium_bound_port)
         raise RuntimeError(f"No se detectó el UDID esperado {expected_udid}. Dispositivos: {devices}")
 
@@ -84,7 +86,7 @@ async def start_infra_for_group(avd_name: str, port_offset: int):
 async def stop_infra_for_group(host: str, appium_port: int, expected_udid: str):
     # Cierre ordenado del emulador y Appium
     try:
-        await Emulator.stop(expected_udid)
+        await EmulatorFleet.stop(expected_udid)
     finally:
         await AppiumServerManager.stop_appium_server(host, appium_port)
 
@@ -99,16 +101,15 @@ async def create_driver(avd_name: str, udid: str, appium_url: str):
     print(f"[{avd_name}] Driver iniciado. session_id={driver.session_id}")
     return driver
 
-async def reset_instagram_app_safely(driver):
+async def reset_instagram_app_safely(udid: str):
     """
     Opcional: limpia estado entre usuarios sin cerrar driver.
-    Puedes ajustarlo según tu `initialize_driver_emulador` (noReset, fullReset, etc).
+    Usa la sesión ADB persistente del dispositivo (force-stop + relanzar).
     """
     try:
         pkg = "com.instagram.android"
-        await asyncio.to_thread(driver.terminate_app, pkg)
-        await asyncio.sleep(1)
-        await asyncio.to_thread(driver.activate_app, pkg)
+        await adb_client.force_stop(udid, pkg)
+        await adb_client.launch_app(udid, pkg)
         await asyncio.sleep(1)
     except Exception as e:
         print(f"[reset] No se pudo reiniciar Instagram de forma segura: {e}")
@@ -132,7 +133,7 @@ async def process_group_async(avd_name: str, port_offset: int, user_list: list[d
         for user in user_list:
             print(f"[{avd_name}] Procesando usuario {user['user']}")
             # Reset suave de la app entre usuarios (opcional/recomendado)
-            # await reset_instagram_app_safely(driver)
+            # await reset_instagram_app_safely(udid)
 
             # Grabar cada ejecución de usuario
             await async_start({"timeLimit": "120"})
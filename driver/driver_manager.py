@@ -16,3 +16,13 @@ def set_driver(driver: AppiumWebDriver) -> None:
 
 def unload() -> None:
     _driver_ctx.set(None)
+
+def driver_serial(driver: Optional[AppiumWebDriver]) -> Optional[str]:
+    """UDID del dispositivo de la sesión Appium (None si no se puede leer)."""
+    if driver is None:
+        return None
+    try:
+        caps = driver.capabilities or {}
+    except Exception:
+        return None
+    return caps.get("udid") or caps.get("deviceUDID") or caps.get("appium:udid")
@@ -8,6 +8,7 @@ from starlette import status
 import os
 import time
 import json
+import signal
 import uuid
 import logging
 import asyncio
@@ -20,10 +21,20 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+import adbutils
 
 from adb.appium_server_manager import AppiumServerManager
 import adb.emulator as Emulator
-from utils.screen_recording import async_start, async_stop
+from adb.emulator_fleet import EmulatorFleet, EmulatorInstance
+from adb.emulator_pool import EmulatorPool, reset_app, RESET_BETWEEN_USERS, APP_PACKAGE
+from adb.emulator_supervisor import EmulatorSupervisor
+from adb.teardown import teardown_all
+from adb import adb_client, logcat_stream, activity_events, frame_capture
+from adb.snapshots import SnapshotManager, SnapshotError, SnapshotRequestError, BASELINE_SNAPSHOT
+from adb import boot_metrics
+from utils.recording_policy import UserRecording
+from utils import video_postprocess, debug_sink
+from utils.recording_receiver import stop_receiver
 from app.instagram_actions import InstagramActions  # Acciones reales de Instagram
 from driver.driver_factory import (
     MobilePlatformName,
@@ -33,6 +44,9 @@ from driver.driver_factory import (
 from utils.Xls_Reader import XlsReader
 from db.controller import Controller
 from utils.emulator_cloner import EmulatorCloner
+from utils.avd_instances import AvdInstances
+from utils.avd_provisioner import AvdProvisioner
+from utils.avd_gc import AvdDiskManager
 
 import math
 
@@ -72,6 +86,12 @@ UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "./uploads")); UPLOAD_DIR.mkdir(parent
 PLATFORM_VERSION = os.getenv("ANDROID_PLATFORM_VERSION", "12")
 HEADLESS = os.getenv("EMU_HEADLESS", "false").lower() in {"1", "true", "yes", "y"}
 NO_SNAPSHOT = os.getenv("EMU_NO_SNAPSHOT", "true").lower() in {"1", "true", "yes", "y"}
+EMU_PROFILE = os.getenv("EMU_PROFILE") or None  # headless-fast | debug-visible | snapshot-boot
+# Arrancar desde el snapshot base (BASELINE_SNAPSHOT) si el AVD ya lo tiene; si no, se crea tras el primer arranque.
+# Ojo: cargar el snapshot descarta los datos de la app guardados después de crearlo.
+SNAPSHOT_BOOT = os.getenv("EMU_SNAPSHOT_BOOT", "false").lower() in {"1", "true", "yes", "y"}
+# clones: un directorio .avd por AVD | instances: instancias -read-only del AVD base
+AVD_FLEET_MODE = os.getenv("AVD_FLEET_MODE", "clones").lower()
 SHEET_NAME_DEFAULT = os.getenv("SHEET_NAME", "Sheet1")
 
 # Puertos base (ajústalos si corres múltiples jobs con distintas sesiones)
@@ -123,9 +143,17 @@ async def emit(sid: str, etype: str, data: Dict[str, Any]):
     if sid in event_queues:
         await event_queues[sid].put({"type": etype, "data": data, "ts": int(time.time())})
 
+@app.on_event("startup")
+async def _startup():
+    # Tras un reinicio: recuperar el margen y asignar usuarios pendientes sin esperar a una subida
+    avd_provisioner.start()
+
 @app.on_event("shutdown")
 async def _shutdown():
-    # Cierra Controller si tiene recursos abiertos
+    # Apaga en paralelo emuladores y Appium (verificando que terminan) y cierra Controller
+    await avd_provisioner.stop()
+    await teardown_all(pool=emulator_pool, supervisor=emulator_supervisor)
+    stop_receiver()
     controller.close()
 
 # =========================
@@ -141,6 +169,7 @@ class LaunchRequest(BaseModel):
 
 class CloneManyRequest(BaseModel):
     count: int = 1
+    hw_profile: Optional[str] = None  # perfil de EmulatorCloner.HW_PROFILES (por defecto AVD_HW_PROFILE)
 
 # =========================
 # Helpers AVD / capacidad
@@ -148,8 +177,10 @@ class CloneManyRequest(BaseModel):
 import math
 from typing import List, Dict, Any
 
-async def ensure_avd_capacity(sid: str, incoming_users: List[Dict[str, Any]]) -> List[str]:
+async def ensure_avd_capacity(sid: str, incoming_users: List[Dict[str, Any]], clone: bool = True) -> List[str]:
     """
+    Con clone=False no crea AVDs: el déficit queda para el aprovisionador en segundo plano.
+
     Asegura capacidad de AVDs 'active' suficiente (5 usuarios por AVD) SOLO para los
     usuarios realmente NUEVOS que vienen en 'incoming_users' (deduplicados por 'user'
     y excluyendo los que ya existen en DB).
@@ -234,11 +265,20 @@ async def ensure_avd_capacity(sid: str, incoming_users: List[Dict[str, Any]]) ->
             existing_nums = []
 
         registered_from_fs: List[str] = []
+        if AVD_FLEET_MODE == "instances":
+            for name in AvdInstances.existing():
+                try:
+                    controller.create_avd(name)  # 'active'
+                    registered_from_fs.append(name)
+                    await emit(sid, "avd_existing_registered", {"avd_name": name})
+                except Exception as e:
+                    await emit(sid, "avd_existing_register_error", {"avd_name": name, "error": str(e)})
         for n in existing_nums:
             name = f"{EmulatorCloner.BASE_NAME}_Clone{n}"
             avd_path = os.path.join(EmulatorCloner.AVD_DIR, name + ".avd")
             ini_path = os.path.join(EmulatorCloner.AVD_DIR, name + ".ini")
-            if os.path.isdir(avd_path) and os.path.isfile(ini_path):
+            entry = EmulatorCloner.catalog.get(name)
+            if entry is not None and entry.ini_valid:
                 try:
                     controller.create_avd(name)  # 'active'
                     registered_from_fs.append(name)
@@ -282,8 +322,10 @@ async def ensure_avd_capacity(sid: str, incoming_users: List[Dict[str, Any]]) ->
         "current_capacity": capacity,
         "deficit": deficit,
         "clones_needed": clones_needed,
-        "phase": "cloning"
+        "phase": "cloning" if clone else "deferred_to_provisioner"
     })
+    if not clone:
+        return []
 
     created: List[str] = []
     try:
@@ -292,29 +334,75 @@ async def ensure_avd_capacity(sid: str, incoming_users: List[Dict[str, Any]]) ->
         await emit(sid, "avd_base_verify_error", {"error": str(e)})
         raise
 
-    for _ in range(clones_needed):
+    if AVD_FLEET_MODE == "instances":
+        # Huecos = instancias del AVD base (sin directorios de clon)
         try:
-            await emit(sid, "avd_clone_started", {})
-            new_name = await EmulatorCloner.clone_emulator()
-            controller.create_avd(new_name)  # registrar en DB como 'active'
-            created.append(new_name)
-            await emit(sid, "avd_clone_finished", {"avd_name": new_name})
+            for name in await AvdInstances.create(clones_needed):
+                controller.create_avd(name)  # 'active'
+                created.append(name)
+                await emit(sid, "avd_instance_created", {"avd_name": name})
         except Exception as e:
             await emit(sid, "avd_clone_error", {"error": str(e)})
-            # Puedes 'raise' si quieres abortar al primer fallo
+        return created
 
+    created = await clone_and_register(sid, clones_needed)
+    return created
+
+
+async def create_avds_for_capacity(count: int, sid: Optional[str] = None) -> List[str]:
+    """Crea y registra `count` AVDs según AVD_FLEET_MODE (clones o instancias)."""
+    if AVD_FLEET_MODE == "instances":
+        created = await AvdInstances.create(count)
+        for name in created:
+            controller.create_avd(name)  # 'active'
+        return created
+    return await clone_and_register(sid or "", count)
+
+
+async def _on_provisioner_event(etype: str, data: Dict[str, Any]):
+    # Sin sesión propia: se notifica a todas las sesiones con cola SSE abierta
+    for sid in list(event_queues.keys()):
+        await emit(sid, etype, data)
+
+
+# Mantiene margen de capacidad clonando en segundo plano cuando no hay ejecuciones
+avd_provisioner = AvdProvisioner(
+    controller,
+    create_avds=create_avds_for_capacity,
+    is_idle=lambda: not any(st.get("status") == "running" for st in run_states.values()),
+    on_event=_on_provisioner_event,
+)
+
+
+async def clone_and_register(sid: str, count: int, hw_profile: Optional[str] = None) -> List[str]:
+    """
+    Clona `count` AVDs en paralelo (EMU_CLONE_IO_CONCURRENCY), registra cada uno en DB
+    como 'active' al terminar y reenvía el progreso por SSE. Devuelve los creados.
+    """
+    created: List[str] = []
+    async for ev in EmulatorCloner.clone_batch(count, hw_profile=hw_profile):
+        kind = ev["event"]
+        if kind == "reserved":
+            await emit(sid, "avd_clone_reserved", {"avd_names": ev["avd_names"]})
+        elif kind == "started":
+            await emit(sid, "avd_clone_started", {"avd_name": ev["avd_name"]})
+        elif kind == "finished":
+            controller.create_avd(ev["avd_name"])  # registrar en DB como 'active'
+            created.append(ev["avd_name"])
+            await emit(sid, "avd_clone_finished", {"avd_name": ev["avd_name"], "report": ev["report"]})
+        else:
+            await emit(sid, "avd_clone_error", {"avd_name": ev["avd_name"], "error": ev["error"]})
     return created
 
 
 def discover_avds_fs() -> List[str]:
     """
-    Descubre AVDs en el FS por ~/.android/avd (complementario a los de DB).
+    Descubre AVDs en el FS por ~/.android/avd (complementario a los de DB), vía el
+    catálogo compartido (solo relee el directorio si cambió).
     """
-    home = Path.home() / ".android" / "avd"
-    names: List[str] = []
-    if home.exists():
-        for p in home.glob("*.avd"):
-            names.append(p.stem)
+    names = EmulatorCloner.catalog.names()
+    # Instancias -read-only del AVD base (sin directorio .avd propio)
+    names += AvdInstances.existing()
     return sorted(names)
 
 # =========================
@@ -414,18 +502,29 @@ async def excel_upload(request: Request, file: UploadFile = File(...), sheet_nam
                     "new_password": new_password
                 })
 
-        # Asegura capacidad física (clones) según la cantidad de usuarios
+        # Planifica la capacidad sin clonar: el aprovisionador crea lo que falte en segundo plano
         if users:
-            created_avds = await ensure_avd_capacity(sid, incoming_users=users)
-
-            if created_avds:
-                await emit(sid, "avd_provisioned", {"created": created_avds})
-
-        # Asigna usuarios a AVDs mediante el Controller (crea nuevos AVDs en DB si hiciera falta)
-        controller.add_users(users)
-
-        await emit(sid, "excel_upload_finished", {"rows": len(users), "sheet": sheet_name})
-        return {"status": "success", "rows": len(users), "saved_to": str(dest)}
+            await ensure_avd_capacity(sid, incoming_users=users, clone=False)
+
+        # Reclama los huecos ya listos; los usuarios sin hueco quedan sin AVD (pendientes)
+        waiting_before = len(controller.unassigned_users())
+        added = controller.add_users(users, allow_unassigned=True)
+        waiting = len(controller.unassigned_users()) - waiting_before
+        claimed = added - waiting
+        avd_provisioner.kick()
+
+        await emit(sid, "excel_upload_finished", {
+            "rows": len(users), "sheet": sheet_name, "added": added,
+            "claimed_slots": claimed, "waiting_for_avd": waiting,
+        })
+        return {
+            "status": "success",
+            "rows": len(users),
+            "added": added,
+            "claimed_slots": claimed,
+            "waiting_for_avd": waiting,
+            "saved_to": str(dest),
+        }
     except Exception as e:
         await emit(sid, "excel_upload_error", {"error": str(e)})
         raise HTTPException(status_code=400, detail=f"Excel parse/load error: {e}")
@@ -464,7 +563,7 @@ async def db_avds_create(request: Request):
         await emit(sid, "avd_clone_started", {})
         new_name = await EmulatorCloner.clone_emulator()
         ok = controller.create_avd(new_name)
-        await emit(sid, "avd_clone_finished", {"avd_name": new_name})
+        await emit(sid, "avd_clone_finished", {"avd_name": new_name, "report": EmulatorCloner.clone_report(new_name)})
         return {"status": "success" if ok else "noop", "avd_name": new_name}
     except Exception as e:
         await emit(sid, "avd_clone_error", {"error": str(e)})
@@ -475,21 +574,138 @@ async def db_avds_create(request: Request):
 async def emulators_clone(request: Request, body: CloneManyRequest):
     sid = require_session(request)
     await EmulatorCloner.verify_base_files()
-    created: List[str] = []
-    for _ in range(max(1, body.count)):
-        await emit(sid, "avd_clone_started", {})
-        new_name = await EmulatorCloner.clone_emulator()
-        controller.create_avd(new_name)
-        created.append(new_name)
-        await emit(sid, "avd_clone_finished", {"avd_name": new_name})
-    return {"status": "success", "created": created}
+    if body.hw_profile and body.hw_profile not in EmulatorCloner.HW_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Perfil de hardware desconocido: {body.hw_profile}")
+    created = await clone_and_register(sid, max(1, body.count), hw_profile=body.hw_profile)
+    return {"status": "success" if created else "error", "created": created}
+
+
+@app.get("/avds/hw-profiles")
+async def avds_hw_profiles(request: Request):
+    sid = require_session(request)
+    return {"default": EmulatorCloner.HW_PROFILE, "profiles": EmulatorCloner.HW_PROFILES}
+
+
+@app.post("/avds/{avd_name}/hw-profile/{profile}")
+async def avds_apply_hw_profile(request: Request, avd_name: str, profile: str):
+    """Aplica un perfil de hardware a un clon existente (con el emulador apagado)."""
+    sid = require_session(request)
+    if EmulatorFleet.get_by_avd(avd_name) is not None:
+        raise HTTPException(status_code=409, detail=f"{avd_name} está en ejecución; apágalo antes.")
+    try:
+        applied = EmulatorCloner.apply_hw_profile(avd_name, profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "success", "avd_name": avd_name, "profile": profile, "applied": applied}
 
 # Descubrir AVDs del FS (útil para diagnóstico)
 @app.get("/emulators/available")
 async def emulators_available(request: Request):
     sid = require_session(request)
     names = discover_avds_fs()
-    return {"avds_fs": names}
+    entries = await asyncio.to_thread(EmulatorCloner.catalog.entries, True)
+    return {"avds_fs": names, "catalog": [e.to_dict() for e in entries]}
+
+
+@app.get("/emulators/pool")
+async def emulators_pool(request: Request):
+    sid = require_session(request)
+    return emulator_pool.stats()
+
+
+# Los AVDs vacíos que cubren el margen del aprovisionador no se recuperan
+avd_disk = AvdDiskManager(
+    controller,
+    is_running=EmulatorFleet.get_by_avd,
+    headroom_slots=lambda: avd_provisioner.headroom_slots + len(controller.unassigned_users()),
+)
+
+
+@app.get("/avds/disk")
+async def avds_disk(request: Request):
+    sid = require_session(request)
+    return await avd_disk.scan()
+
+
+@app.post("/avds/gc")
+async def avds_gc(request: Request, dry_run: bool = Query(True), include_completed: bool = Query(False)):
+    """Recupera clones huérfanos o sin usuarios (dry_run=true solo informa)."""
+    sid = require_session(request)
+    result = await avd_disk.reclaim(dry_run=dry_run, include_completed=include_completed)
+    await emit(sid, "avd_gc", result)
+    return result
+
+
+@app.post("/avds/disk/compact")
+async def avds_disk_compact(request: Request, dry_run: bool = Query(True)):
+    """Compacta userdata y, si se supera AVD_DISK_BUDGET_GB, recupera clones sin uso."""
+    sid = require_session(request)
+    if AvdDiskManager.DISK_BUDGET_GB > 0:
+        return await avd_disk.enforce_budget(dry_run=dry_run)
+    return await avd_disk.compact(dry_run=dry_run)
+
+
+@app.get("/avds/capacity")
+async def avds_capacity(request: Request):
+    sid = require_session(request)
+    return avd_provisioner.status()
+
+
+@app.get("/emulators/health")
+async def emulators_health(request: Request):
+    sid = require_session(request)
+    return emulator_supervisor.health()
+
+# =========================
+# Snapshots quickboot y tiempos de arranque
+# =========================
+def _snapshot_http_error(action: str, e: Exception) -> HTTPException:
+    """400 si la petición es inválida (nombre, serial); 502 si falla la consola del emulador."""
+    if isinstance(e, SnapshotRequestError):
+        return HTTPException(status_code=400, detail=str(e))
+    return HTTPException(status_code=502, detail=f"Error {action} snapshot: {e}")
+
+@app.get("/emulators/{serial}/snapshots")
+async def emulator_snapshots_list(request: Request, serial: str):
+    sid = require_session(request)
+    try:
+        return {"serial": serial, "snapshots": await SnapshotManager.list(serial)}
+    except (SnapshotError, asyncio.TimeoutError) as e:
+        raise _snapshot_http_error("listando", e)
+
+@app.post("/emulators/{serial}/snapshots/{name}")
+async def emulator_snapshot_save(request: Request, serial: str, name: str):
+    sid = require_session(request)
+    try:
+        await SnapshotManager.save(serial, name)
+        return {"status": "success", "serial": serial, "snapshot": name}
+    except (SnapshotError, asyncio.TimeoutError) as e:
+        raise _snapshot_http_error("guardando", e)
+
+@app.post("/emulators/{serial}/snapshots/{name}/load")
+async def emulator_snapshot_load(request: Request, serial: str, name: str):
+    sid = require_session(request)
+    try:
+        await SnapshotManager.load(serial, name)
+        return {"status": "success", "serial": serial, "snapshot": name}
+    except (SnapshotError, asyncio.TimeoutError) as e:
+        raise _snapshot_http_error("cargando", e)
+
+@app.delete("/emulators/{serial}/snapshots/{name}")
+async def emulator_snapshot_delete(request: Request, serial: str, name: str):
+    sid = require_session(request)
+    try:
+        await SnapshotManager.delete(serial, name)
+        return {"status": "success", "serial": serial, "snapshot": name}
+    except (SnapshotError, asyncio.TimeoutError) as e:
+        raise _snapshot_http_error("eliminando", e)
+
+@app.get("/emulators/boot-times")
+async def emulators_boot_times(request: Request, avd_name: Optional[str] = Query(None)):
+    sid = require_session(request)
+    return {"avd_name": avd_name, "boot_times": boot_metrics.summary(avd_name)}
 
 
 # =========================
@@ -513,15 +729,70 @@ async def run_status(request: Request):
 # Lógica de ejecución con eventos
 # =========================
 # === Helpers: Infra por grupo (levantar/derribar una vez por AVD) ===
-async def start_infra_for_group(avd_name: str, port_offset: int):
+async def boot_emulator(avd_name: str, port: Optional[int] = None) -> EmulatorInstance:
     """
-    Levanta Appium + Emulador para un grupo (avd_name) en puertos derivados del offset.
+    Arranca el emulador de `avd_name` (desde el snapshot base si EMU_SNAPSHOT_BOOT) y
+    espera a que esté listo. Si `port` es None, la flota elige uno libre.
+    """
+    # Las instancias -read-only no pueden guardar snapshots
+    use_snapshots = SNAPSHOT_BOOT and not AvdInstances.is_instance(avd_name)
+    from_snapshot = use_snapshots and SnapshotManager.exists_on_disk(avd_name, BASELINE_SNAPSHOT)
+    instance = await EmulatorFleet.launch(
+        avd_name,
+        port=port,
+        headless=HEADLESS,
+        no_snapshot=NO_SNAPSHOT,
+        optimize=True,
+        profile="snapshot-boot" if from_snapshot else EMU_PROFILE,
+        extra_args=["-snapshot", BASELINE_SNAPSHOT] if from_snapshot else None
+    )
+    try:
+        await EmulatorFleet.wait_for_ready(instance.serial, timeout=300)
+        if use_snapshots and not from_snapshot:
+            try:
+                await SnapshotManager.ensure_baseline(instance.serial, avd_name)
+            except SnapshotError as e:
+                log.warning(f"[{avd_name}] No se pudo guardar el snapshot base: {e}")
+
+        devices = await EmulatorFleet.list_devices()
+        if instance.serial not in devices:
+            raise RuntimeError(f"No se detectó el UDID esperado {instance.serial}. Dispositivos: {devices}")
+    except Exception:
+        await EmulatorFleet.stop(instance.serial)
+        raise
+    return instance
+
+
+# Pool de emuladores calientes (vive en el proceso del servidor; los grupos corren en
+# procesos hijos y reciben el UDID prestado). EMU_POOL_MAX: máximo de emuladores encendidos
+# (0 = el paralelismo del job).
+EMU_POOL_MAX = int(os.getenv("EMU_POOL_MAX", "0"))
+emulator_pool = EmulatorPool(max_size=max(1, EMU_POOL_MAX), launcher=boot_emulator)
+
+
+async def _on_supervisor_event(etype: str, data: Dict[str, Any]):
+    # Los eventos del supervisor van a la sesión que tiene prestado el emulador
+    owner = data.get("owner")
+    if owner:
+        await emit(owner, etype, data)
+
+
+# Vigila los emuladores del pool: reinicia (mismo serial) los caídos o colgados
+emulator_supervisor = EmulatorSupervisor(pool=emulator_pool, on_event=_on_supervisor_event)
+
+# Tiempo máximo que un grupo espera a que el supervisor recupere su emulador
+DEVICE_RECOVERY_TIMEOUT = int(os.getenv("EMU_DEVICE_RECOVERY_TIMEOUT", "240"))
+
+
+async def start_infra_for_group(avd_name: str, port_offset: int, udid: Optional[str] = None):
+    """
+    Levanta Appium (y el emulador si no se recibe `udid` prestado del pool) para un grupo
+    (avd_name) en puertos derivados del offset.
     Devuelve (host, appium_port, appium_url, udid)
     """
     host = APPIUM_HOST
     appium_port = BASE_APPIUM_PORT + (port_offset * 10)   # separación segura por grupo
     adb_port    = BASE_ADB_PORT    + (port_offset * 20)   # separación segura por grupo
-    expected_udid = f"emulator-{adb_port}"
 
     # Appium
     bound_port = await AppiumServerManager.start_appium_server(
@@ -529,33 +800,33 @@ async def start_infra_for_group(avd_name: str, port_offset: int):
     )
     appium_url = f"http://{host}:{bound_port}"
 
-    # Emulador
-    log.info(f"[{avd_name}] Lanzando emulador en ADB {adb_port} (UDID: {expected_udid})")
-    await Emulator.launch(
-        avd_name,
-        port=adb_port,
-        headless=HEADLESS,
-        no_snapshot=NO_SNAPSHOT,
-        optimize=True
-    )
-    await Emulator.wait_for_ready(serial=expected_udid, timeout=300)
+    if udid is not None:
+        log.info(f"[{avd_name}] Usando emulador prestado {udid}")
+        return host, bound_port, appium_url, udid
 
-    devices = await Emulator.list_devices()
-    if expected_udid not in devices:
+    # Emulador propio del grupo
+    log.info(f"[{avd_name}] Lanzando emulador en ADB {adb_port} (UDID: emulator-{adb_port})")
+    try:
+        instance = await boot_emulator(avd_name, port=adb_port)
+    except Exception:
         await AppiumServerManager.stop_appium_server(host, bound_port)
-        raise RuntimeError(f"No se detectó el UDID esperado {expected_udid}. Dispositivos: {devices}")
+        raise
 
-    return host, bound_port, appium_url, expected_udid
+    return host, bound_port, appium_url, instance.serial
 
 
-async def stop_infra_for_group(host: str, appium_port: int, udid: str):
-    """Cierra Emulador + Appium del grupo."""
-    try:
-        await Emulator.stop(udid)
-        await AppiumServerManager.stop_appium_server(host, appium_port)
-    except Exception as e:
-        log.warning(f"[{udid}] Error cerrando infra for group: {e}")
-        print(f"[{udid}] Error cerrando infra for group: {e}")
+async def stop_infra_for_group(host: str, appium_port: int, udid: str, stop_emulator: bool = True):
+    """
+    Cierra Appium del grupo y, si el emulador no es prestado, también el emulador: en
+    paralelo y verificando que cada proceso termina (como `teardown_all`).
+    """
+    steps = [AppiumServerManager.stop_appium_server(host, appium_port)]
+    if stop_emulator:
+        steps.append(EmulatorFleet.stop(udid))
+    for r in await asyncio.gather(*steps, return_exceptions=True):
+        if isinstance(r, Exception):
+            log.warning(f"[{udid}] Error cerrando infra for group: {r}")
+            print(f"[{udid}] Error cerrando infra for group: {r}")
         
 
 async def create_driver(avd_name: str, udid: str, appium_url: str):
@@ -570,55 +841,112 @@ async def create_driver(avd_name: str, udid: str, appium_url: str):
     return driver
 
 
-async def reset_instagram_app_safely(driver):
+async def reset_instagram_app_safely(udid: str) -> Optional[float]:
     """
-    Reset suave entre usuarios (evita cerrar sesión Appium).
-    Ajusta según tu estrategia: terminate/activate o reset().
+    Reset suave entre usuarios (evita cerrar sesión Appium) por la sesión ADB persistente
+    del dispositivo: EMU_RESET_BETWEEN_USERS (force-stop | clear) + relanzar la app.
+    Devuelve la duración en ms.
     """
     try:
-        pkg = "com.instagram.android"
-        await asyncio.to_thread(driver.terminate_app, pkg)
-        await asyncio.sleep(1)
-        await asyncio.to_thread(driver.activate_app, pkg)
+        ms = await reset_app(udid, mode=RESET_BETWEEN_USERS, relaunch=True)
         await asyncio.sleep(1)
+        return ms
     except Exception as e:
         log.warning(f"[reset] No se pudo reiniciar Instagram: {e}")
+        return None
 
 
-async def process_group_async(sid: str, avd_name: str, port_offset: int, user_list: list[dict]):
+async def recover_device_for_group(avd_name: str, udid: str, appium_url: str):
+    """
+    Tras un fallo de usuario: si el dispositivo no responde, espera a que vuelva (el
+    supervisor lo relanza con el mismo serial) y crea un driver nuevo.
+    """
+    try:
+        booted = await adb_client.getprop(udid, "sys.boot_completed") == "1"
+    except (TimeoutError, OSError, adbutils.AdbError):
+        # AdbError: offline o desaparecido, justo el caso de un emulador caído
+        booted = False
+    if booted:
+        return None
+    log.warning(f"[{avd_name}] {udid} no responde; esperando recuperación del emulador...")
+    await Emulator.wait_for_ready(serial=udid, timeout=DEVICE_RECOVERY_TIMEOUT)
+    try:
+        await quit_driver()
+    except Exception:
+        pass
+    return await create_driver(avd_name, udid, appium_url)
+
+
+async def process_group_async(sid: str, avd_name: str, port_offset: int, user_list: list[dict], leased_udid: Optional[str] = None):
     """
     Levanta infra UNA VEZ para avd_name, procesa usuarios secuencialmente reutilizando driver,
-    grabando cada ejecución por separado, y cierra al final.
+    grabando cada ejecución por separado, y cierra al final. Con `leased_udid` el emulador
+    viene del pool y queda encendido al terminar.
     """
     await emit(sid, "avd_group_started", {"avd": avd_name, "users": len(user_list), "offset": port_offset})
     host = None
     appium_port = None
+    udid = None
     driver = None
     try:
         # Infra única por grupo
-        host, appium_port, appium_url, udid = await start_infra_for_group(avd_name, port_offset)
+        host, appium_port, appium_url, udid = await start_infra_for_group(avd_name, port_offset, leased_udid)
         await emit(sid, "avd_infra_started", {"avd": avd_name, "udid": udid, "appium_port": appium_port})
 
         # Driver único por grupo (reutilizable)
         driver = await create_driver(avd_name, udid, appium_url)
 
+        # Logcat en memoria durante la sesión; solo se vuelca a disco si un usuario falla
+        logcat_stream.start(udid, package=APP_PACKAGE)
+        # Cambios de activity por eventos (los flujos esperan sin sondear current_activity)
+        activity_events.start(udid)
+
         for user in user_list:
             await emit(sid, "user_started", {"avd": avd_name, "user": user["user"]})
+            # Los artefactos de depuración de este usuario se nombran por ejecución/dispositivo/usuario
+            debug_sink.set_context(run_id=sid, udid=udid, user=user["user"])
 
             # Reset suave entre usuarios para partir “limpio”
-            await reset_instagram_app_safely(driver)
+            reset_ms = await reset_instagram_app_safely(udid)
+            await emit(sid, "user_reset", {"avd": avd_name, "user": user["user"], "mode": RESET_BETWEEN_USERS, "ms": reset_ms})
 
-            # Grabar por usuario
-            await async_start({"timeLimit": "120"})
+            # Grabar por usuario según RECORDING_POLICY (always | failure-only | sampled)
+            video_path = None
+            recording = UserRecording(udid, f"{udid}_{user['user']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                                      start_opts={"timeLimit": "120"})
             try:
-                # Aquí va tu flujo real por usuario:
-                # await InstagramActions.register_account(udid, user)
-                await asyncio.sleep(5)  # Simulación de trabajo
-            finally:
-                video_name = f"{udid}_{user['user']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                await async_stop(video_name)
-
-            await emit(sid, "user_finished", {"avd": avd_name, "user": user["user"], "video": video_name})
+                await recording.start()
+                failed = True
+                try:
+                    # Aquí va tu flujo real por usuario:
+                    # await InstagramActions.register_account(udid, user)
+                    await asyncio.sleep(5)  # Simulación de trabajo
+                    failed = False
+                finally:
+                    video_path = await recording.finish(failed)
+                    if video_path is not None:
+                        # Recodificado, miniatura, índice y retención fuera del flujo del dispositivo;
+                        # un fallo aquí no cambia el resultado del usuario
+                        try:
+                            video_path = video_postprocess.submit(video_path, run_id=sid, user=user["user"],
+                                                                  udid=udid, failed=failed)
+                        except Exception as e:
+                            log.warning(f"[{avd_name}] Post-procesado de vídeo no encolado: {e}")
+            except Exception as e:
+                logcat_path = logcat_stream.dump_for(udid, f"user_{user['user']}")
+                await emit(sid, "user_error", {"avd": avd_name, "user": user["user"], "error": str(e),
+                                               "logcat": str(logcat_path) if logcat_path else None,
+                                               "video": str(video_path) if video_path else None})
+                log.warning(f"[{avd_name}] Usuario {user['user']} falló: {e}")
+                # Si el emulador cayó, seguir con el siguiente usuario sobre el relanzado
+                new_driver = await recover_device_for_group(avd_name, udid, appium_url)
+                if new_driver is not None:
+                    driver = new_driver
+                    await emit(sid, "avd_device_recovered", {"avd": avd_name, "udid": udid})
+                continue
+
+            await emit(sid, "user_finished", {"avd": avd_name, "user": user["user"],
+                                              "video": str(video_path) if video_path else None})
 
         await emit(sid, "avd_group_finished", {"avd": avd_name})
     except Exception as e:
@@ -626,6 +954,11 @@ async def process_group_async(sid: str, avd_name: str, port_offset: int, user_li
         log.exception(f"[{avd_name}] Error en el grupo: {e}")
         print(f"[{avd_name}] Error en el grupo: {e}")
     finally:
+        if udid is not None:
+            logcat_stream.stop(udid)
+            activity_events.stop(udid)
+            frame_capture.close(udid)
+
         # Cierre driver (una sola vez)
         try:
             if driver is not None:
@@ -636,11 +969,27 @@ async def process_group_async(sid: str, avd_name: str, port_offset: int, user_li
 
         # Cierre Emulador + Appium
         if host is not None and appium_port is not None:
-            await stop_infra_for_group(host, appium_port, udid)
+            await stop_infra_for_group(host, appium_port, udid, stop_emulator=leased_udid is None)
             await emit(sid, "avd_infra_stopped", {"avd": avd_name})
 
-def run_group_wrapper(sid: str, avd_name: str, port_offset: int, user_list: list[dict]):
-    asyncio.run(process_group_async(sid, avd_name, port_offset, user_list))
+        # Terminar el post-procesado y los artefactos pendientes de este proceso (el dispositivo ya está libre)
+        await asyncio.to_thread(video_postprocess.drain)
+        await asyncio.to_thread(debug_sink.flush)
+
+def run_group_wrapper(sid: str, avd_name: str, port_offset: int, user_list: list[dict], leased_udid: Optional[str] = None):
+    async def _main():
+        # El padre termina los procesos de grupo con SIGTERM: cancelar para que corra el cierre
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            pass  # Windows
+        try:
+            await process_group_async(sid, avd_name, port_offset, user_list, leased_udid)
+        finally:
+            # Lo que este proceso arrancó y siga vivo (Appium, emulador propio): cierre verificado
+            # y en paralelo. El registro del padre no alcanza a este proceso.
+            await teardown_all()
+    asyncio.run(_main())
 
 # =========================
 # Lanzar ejecución por usuarios 
@@ -672,8 +1021,13 @@ async def run_launch(request: Request, body: LaunchRequest):
     from collections import defaultdict
     groups = defaultdict(list)  # avd_name -> [users...]
     total_users = 0
+    unassigned_users = 0
     for r in rows:  # (user, password, key, new_password, avd_name, status, updated_at)
         avd_name = r[4]
+        if not avd_name:
+            # Aún esperando a que el aprovisionador le asigne AVD
+            unassigned_users += 1
+            continue
         groups[avd_name].append({
             "user": r[0],
             "password": r[1],
@@ -693,6 +1047,7 @@ async def run_launch(request: Request, body: LaunchRequest):
         "max_parallel": max_parallel,
         "total_groups": len(avd_list),
         "total_users": total_users,
+        "unassigned_users": unassigned_users,
         "groups": {a: len(groups[a]) for a in avd_list},
     })
 
@@ -716,30 +1071,43 @@ async def run_launch(request: Request, body: LaunchRequest):
         offsets: dict[str, int] = {}              # avd -> port_offset libre
         free_offsets = list(range(max_parallel))  # recicla offsets 0..job-1
 
-        async def start_next_if_possible():
-            """Lanza procesos hasta agotar paralelismo o quedarnos sin pendientes."""
-            started = 0
-            while pending and free_offsets:
-                avd = pending.pop(0)
-                offset = free_offsets.pop(0)
+        async def _lease_and_run(avd: str, offset: int):
+            """Pide el emulador al pool, corre el grupo en su proceso y lo devuelve al pool."""
+            try:
+                instance = await emulator_pool.lease(avd, owner=sid)
+            except Exception as e:
+                await emit(sid, "emulator_lease_error", {"avd": avd, "error": str(e)})
+                log.warning(f"[{avd}] No se pudo obtener emulador del pool: {e}")
+                return
+            await emit(sid, "emulator_leased", {"avd": avd, "udid": instance.serial, "boot_seconds": instance.boot_seconds})
 
+            try:
                 p = Process(
                     target=run_group_wrapper,
-                    args=(sid, avd, offset, groups[avd]),
+                    args=(sid, avd, offset, groups[avd], instance.serial),
                     daemon=True
                 )
                 p.start()
-
                 procs[avd] = p
-                offsets[avd] = offset
+                await emit(sid, "process_started", {"avd": avd, "offset": offset, "pid": p.pid})
 
-                # join del proceso en background
-                async def _join(proc: Process):
-                    await asyncio.to_thread(proc.join)
-                joins[avd] = asyncio.create_task(_join(p))
+                # join del proceso sin bloquear el event loop
+                await asyncio.to_thread(p.join)
+            finally:
+                await emulator_pool.release(avd)
 
-                await emit(sid, "process_started", {"avd": avd, "offset": offset, "pid": p.pid})
+        async def start_next_if_possible():
+            """Lanza grupos hasta agotar paralelismo o quedarnos sin pendientes."""
+            started = 0
+            while pending and free_offsets:
+                avd = pending.pop(0)
+                offset = free_offsets.pop(0)
+                offsets[avd] = offset
+                joins[avd] = asyncio.create_task(_lease_and_run(avd, offset))
                 started += 1
+            # Con hueco en el pool, arrancar ya los siguientes grupos de la cola
+            if pending:
+                await emulator_pool.prewarm(pending)
             return started
 
         async def wait_one_finish():
@@ -755,11 +1123,13 @@ async def run_launch(request: Request, body: LaunchRequest):
                     break
             return finished_avd
 
+        emulator_pool.max_size = max(EMU_POOL_MAX, max_parallel)
+        emulator_supervisor.start()
         try:
             # Primer “llenado” de workers
             await start_next_if_possible()
 
-            while procs or pending:
+            while joins or pending:
                 finished_avd = await wait_one_finish()
                 if finished_avd is None:
                     break
@@ -773,6 +1143,9 @@ async def run_launch(request: Request, body: LaunchRequest):
 
                 await emit(sid, "process_finished", {"avd": finished_avd})
 
+                # El pool sigue a la cola: apaga emuladores en reposo que ya no hacen falta
+                await emulator_pool.resize(len(pending))
+
                 # Inmediatamente intenta arrancar el siguiente (estilo Pool)
                 await start_next_if_possible()
 
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Los módulos se importan como en el servidor (`utils.…`, `adb.…`), desde la raíz del repo
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,80 @@
+import os
+import http.client
+from urllib.parse import urlsplit
+
+import pytest
+
+from utils.recording_receiver import RecordingReceiver
+
+# Incluye secuencias que se parecen al delimitador para forzar los cortes entre bloques
+VIDEO = (b"\x00\x00\x00\x18ftypmp42" + os.urandom(3 << 20) + b"\r\n--not-the-boundary\r\n" + b"\r\n-") * 2
+
+
+@pytest.fixture
+def receiver():
+    r = RecordingReceiver(host="127.0.0.1", port=0)
+    yield r
+    r.close()
+
+
+def _put(url: str, body, headers: dict, chunked: bool = False) -> int:
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+    try:
+        conn.request("PUT", parts.path, body=body, headers=headers, encode_chunked=chunked)
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+def _multipart(boundary: str) -> bytes:
+    # Mismo formato que la subida de Appium (form-data, campo `file`), con un campo extra delante
+    return (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="note"\r\n\r\n'
+        f"hola\r\n"
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="video.mp4"\r\n'
+        f"Content-Type: video/mp4\r\n\r\n"
+    ).encode() + VIDEO + f"\r\n--{boundary}--\r\n".encode()
+
+
+def test_multipart_upload_writes_only_file_part(receiver, tmp_path):
+    dest = tmp_path / "rec.mp4"
+    url = receiver.expect(dest)
+    boundary = "----formdata-1234567890"
+    status = _put(url, _multipart(boundary), {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    assert status == 201
+    assert receiver.wait(url, 10) == dest
+    assert dest.read_bytes() == VIDEO
+
+
+def test_chunked_multipart_upload(receiver, tmp_path):
+    dest = tmp_path / "rec.mp4"
+    url = receiver.expect(dest)
+    boundary = "xyz"
+    body = _multipart(boundary)
+    chunks = (body[i:i + 70001] for i in range(0, len(body), 70001))
+    status = _put(url, chunks, {"Content-Type": f'multipart/form-data; boundary="{boundary}"',
+                                "Transfer-Encoding": "chunked"}, chunked=True)
+    assert status == 201
+    receiver.wait(url, 10)
+    assert dest.read_bytes() == VIDEO
+
+
+def test_raw_upload(receiver, tmp_path):
+    dest = tmp_path / "rec.mp4"
+    url = receiver.expect(dest)
+    assert _put(url, VIDEO, {"Content-Type": "video/mp4"}) == 201
+    receiver.wait(url, 10)
+    assert dest.read_bytes() == VIDEO
+
+
+def test_multipart_without_file_part_fails(receiver, tmp_path):
+    dest = tmp_path / "rec.mp4"
+    url = receiver.expect(dest)
+    body = b'--b\r\nContent-Disposition: form-data; name="note"\r\n\r\nhola\r\n--b--\r\n'
+    assert _put(url, body, {"Content-Type": "multipart/form-data; boundary=b"}) == 500
+    with pytest.raises(RuntimeError):
+        receiver.wait(url, 10)
+    assert not dest.exists()
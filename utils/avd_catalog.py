@@ -0,0 +1,126 @@
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple
+
+
+class AvdEntry:
+    """AVD encontrado en el directorio: nombre, número de clon, validez del .ini y tamaño."""
+
+    def __init__(self, name: str, clone_num: Optional[int], ini_valid: bool, avd_mtime_ns: int):
+        self.name = name
+        self.clone_num = clone_num
+        self.ini_valid = ini_valid
+        self.avd_mtime_ns = avd_mtime_ns
+        self.size_bytes: Optional[int] = None  # se calcula bajo demanda
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "avd_name": self.name,
+            "clone_num": self.clone_num,
+            "ini_valid": self.ini_valid,
+            "size_bytes": self.size_bytes,
+        }
+
+
+def _allocated_size(path: str) -> int:
+    total = 0
+    for root, _dirs, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total
+
+
+class AvdCatalog:
+    """
+    Índice del directorio de AVDs en una sola pasada de `os.scandir`. Se reconstruye solo
+    cuando cambia el mtime del directorio (crear/borrar/renombrar un .avd o .ini lo
+    actualiza); entre cambios las consultas no tocan el disco. El tamaño se calcula bajo
+    demanda y se cachea mientras no cambie el mtime del directorio .avd del AVD.
+    """
+
+    def __init__(self, avd_dir, base_name: str):
+        self.avd_dir = Path(avd_dir)
+        self.base_name = base_name
+        self._clone_re = re.compile(rf"^{re.escape(base_name)}_Clone(\d+)$")
+        self._lock = threading.Lock()
+        self._dir_mtime_ns: Optional[int] = None
+        self._entries: Dict[str, AvdEntry] = {}
+
+    @staticmethod
+    def _ini_valid(ini_path: str, avd_path: str) -> bool:
+        """El .ini existe y su 'path=' apunta al directorio .avd."""
+        try:
+            with open(ini_path, "r") as f:
+                for line in f:
+                    if line.startswith("path="):
+                        return os.path.realpath(line[5:].strip()) == os.path.realpath(avd_path)
+        except OSError:
+            return False
+        return False
+
+    def _rebuild(self, dir_mtime_ns: int) -> None:
+        previous = self._entries
+        entries: Dict[str, AvdEntry] = {}
+        inis = set()
+        dirs: List[Tuple[str, int]] = []
+        with os.scandir(self.avd_dir) as it:
+            for de in it:
+                if de.name.endswith(".ini"):
+                    inis.add(de.name[:-4])
+                elif de.name.endswith(".avd") and de.is_dir():
+                    dirs.append((de.name[:-4], de.stat().st_mtime_ns))
+        for name, avd_mtime in dirs:
+            m = self._clone_re.match(name)
+            avd_path = str(self.avd_dir / f"{name}.avd")
+            ini_valid = name in inis and self._ini_valid(str(self.avd_dir / f"{name}.ini"), avd_path)
+            entry = AvdEntry(name, int(m.group(1)) if m else None, ini_valid, avd_mtime)
+            old = previous.get(name)
+            if old is not None and old.avd_mtime_ns == avd_mtime:
+                entry.size_bytes = old.size_bytes
+            entries[name] = entry
+        self._entries = entries
+        self._dir_mtime_ns = dir_mtime_ns
+
+    def _refresh(self) -> None:
+        try:
+            mtime = os.stat(self.avd_dir).st_mtime_ns
+        except FileNotFoundError:
+            self._entries, self._dir_mtime_ns = {}, None
+            return
+        if mtime != self._dir_mtime_ns:
+            self._rebuild(mtime)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._dir_mtime_ns = None
+
+    # ---------- consultas ----------
+    def entries(self, with_size: bool = False) -> List[AvdEntry]:
+        with self._lock:
+            self._refresh()
+            entries = sorted(self._entries.values(), key=lambda e: (e.clone_num is None, e.clone_num or 0, e.name))
+        if with_size:
+            for e in entries:
+                if e.size_bytes is None:
+                    e.size_bytes = _allocated_size(str(self.avd_dir / f"{e.name}.avd"))
+        return entries
+
+    def get(self, name: str) -> Optional[AvdEntry]:
+        with self._lock:
+            self._refresh()
+            return self._entries.get(name)
+
+    def names(self) -> List[str]:
+        return [e.name for e in self.entries()]
+
+    def clones(self, valid_only: bool = False) -> List[AvdEntry]:
+        return [e for e in self.entries() if e.clone_num is not None and (e.ini_valid or not valid_only)]
+
+    def clone_nums(self) -> List[int]:
+        """Números de clon en uso (incluye reservas y clones a medio crear)."""
+        return [e.clone_num for e in self.clones()]
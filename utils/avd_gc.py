@@ -0,0 +1,313 @@
+import os
+import re
+import json
+import shutil
+import asyncio
+import time
+import subprocess
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+from db.controller import USERS_PER_AVD
+from utils.emulator_cloner import EmulatorCloner, _find_qemu_img
+from utils.avd_instances import AvdInstances
+
+
+def _dir_usage(path: str) -> Dict[str, int]:
+    """Bytes aparentes, asignados y asignados solo a este directorio (sin hardlinks compartidos)."""
+    apparent = allocated = exclusive = 0
+    for root, _dirs, names in os.walk(path):
+        for name in names:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            apparent += st.st_size
+            allocated += st.st_blocks * 512
+            if st.st_nlink == 1:
+                exclusive += st.st_blocks * 512
+    return {"apparent_bytes": apparent, "allocated_bytes": allocated, "exclusive_bytes": exclusive}
+
+
+def _qemu_info(qemu_img: str, path: str) -> Dict[str, Any]:
+    out = subprocess.run([qemu_img, "info", "--output=json", path], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout)
+
+
+def _compact_image(path: str) -> Tuple[int, Optional[str]]:
+    """
+    Compacta una imagen de disco y devuelve (bytes liberados, motivo si se omitió):
+    - raw: `fallocate --dig-holes` (los bloques a cero pasan a ser huecos); una raw
+      compartida por hardlink (copia congelada de la base) no se modifica;
+    - qcow2 sin backing: `qemu-img convert` a un qcow2 nuevo (descarta clusters libres);
+    - qcow2 con backing (overlay de un clon COW): `qemu-img convert -B <backing>` reescribe
+      el overlay con el mismo backing y solo los clusters que difieren de él.
+    """
+    before = os.stat(path).st_blocks * 512
+    qemu_img = _find_qemu_img()
+    fmt = "raw"
+    info: Dict[str, Any] = {}
+    if qemu_img:
+        info = _qemu_info(qemu_img, path)
+        fmt = info.get("format", "raw")
+    if fmt == "raw":
+        if os.stat(path).st_nlink > 1:
+            return 0, "shared_hardlink"
+        subprocess.run(["fallocate", "--dig-holes", path], check=True, capture_output=True)
+    elif fmt == "qcow2" and qemu_img:
+        tmp = path + ".compact"
+        cmd = [qemu_img, "convert", "-O", "qcow2"]
+        backing = info.get("backing-filename")
+        if backing:
+            # Mismo backing (tal cual está escrito, relativo o absoluto) que el overlay original
+            cmd += ["-B", backing]
+            if info.get("backing-filename-format"):
+                cmd += ["-F", info["backing-filename-format"]]
+        try:
+            subprocess.run(cmd + [path, tmp], check=True, capture_output=True)
+            shutil.copystat(path, tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    elif not qemu_img:
+        return 0, "no_qemu_img"
+    else:
+        return 0, f"format_{fmt}"
+    return max(0, before - os.stat(path).st_blocks * 512), None
+
+
+class AvdDiskManager:
+    """
+    Uso de disco por clon/instancia, detección de AVDs huérfanos o sin usuarios,
+    recuperación de espacio y compactación de userdata bajo AVD_DISK_BUDGET_GB.
+    Nunca se recuperan: AVDs reservados o a medio crear, los modificados hace menos de
+    AVD_GC_MIN_AGE segundos, ni los AVDs vacíos que forman el margen del aprovisionador.
+    """
+    DISK_BUDGET_GB = float(os.getenv("AVD_DISK_BUDGET_GB", "0"))  # 0 = sin presupuesto
+    MIN_AGE_S = float(os.getenv("AVD_GC_MIN_AGE", "3600"))
+    USERDATA_IMAGES = ("userdata-qemu.img", "userdata-qemu.img.qcow2")
+    CLONE_RE = re.compile(rf"^{re.escape(EmulatorCloner.BASE_NAME)}_Clone(\d+)$")
+
+    def __init__(self, controller, is_running=None, headroom_slots: Optional[Callable[[], int]] = None):
+        """
+        is_running: callable avd_name -> bool (p.ej. EmulatorFleet.get_by_avd).
+        headroom_slots: callable -> huecos libres que deben quedar (margen del aprovisionador
+        más usuarios esperando AVD); los AVDs sin usuarios que los cubren no se recuperan.
+        """
+        self.controller = controller
+        self.is_running = is_running or (lambda name: False)
+        self.headroom_slots = headroom_slots or (lambda: 0)
+
+    # ---------- inventario ----------
+    @staticmethod
+    def _path(name: str) -> str:
+        if AvdInstances.is_instance(name):
+            return str(AvdInstances.data_dir(name))
+        return os.path.join(EmulatorCloner.AVD_DIR, name + ".avd")
+
+    @staticmethod
+    def _fs_names() -> List[str]:
+        return [e.name for e in EmulatorCloner.catalog.clones()] + AvdInstances.existing()
+
+    @staticmethod
+    def _in_progress(name: str) -> bool:
+        if AvdInstances.is_instance(name):
+            return AvdInstances.is_creating(name)
+        return EmulatorCloner.is_cloning(name)
+
+    @classmethod
+    def _age_s(cls, name: str) -> float:
+        """Segundos desde el último cambio del directorio del AVD (o de su .ini)."""
+        paths = [cls._path(name)]
+        if not AvdInstances.is_instance(name):
+            paths.append(os.path.join(EmulatorCloner.AVD_DIR, name + ".ini"))
+        mtimes = []
+        for p in paths:
+            try:
+                mtimes.append(os.stat(p).st_mtime)
+            except OSError:
+                pass
+        return time.time() - max(mtimes) if mtimes else 0.0
+
+    def _protect(self, entries: List[Dict[str, Any]]) -> None:
+        """
+        Marca en `protected` por qué un candidato no se puede recuperar: 'in_progress',
+        'too_recent' o 'headroom' (AVD vacío que cubre el margen de huecos libres).
+        """
+        free = self.controller.free_slots()
+        keep = self.headroom_slots()
+        for e in entries:
+            e["protected"] = None
+            if e["reclaim_reason"] is None:
+                continue
+            if e["in_progress"]:
+                e["protected"] = "in_progress"
+            elif e["age_s"] < self.MIN_AGE_S:
+                e["protected"] = "too_recent"
+            elif e["reclaim_reason"] == "no_users" and (e["db_status"] or "").strip().lower() == "active":
+                if free - USERS_PER_AVD < keep:
+                    e["protected"] = "headroom"
+                else:
+                    free -= USERS_PER_AVD
+
+    @staticmethod
+    def _frozen_inventory() -> List[Dict[str, Any]]:
+        """Copias congeladas de la base (ver EmulatorCloner.prune_frozen) con su tamaño."""
+        out = []
+        for f in EmulatorCloner.frozen_copies():
+            out.append({"name": f["name"], "clones": f["clones"], "current": f["current"],
+                        "reclaimable": f["stale_tmp"] or (f["clones"] == 0 and not f["current"] and not f["building"]),
+                        **_dir_usage(f["path"])})
+        return out
+
+    async def scan(self) -> Dict[str, Any]:
+        """Inventario: por AVD tamaño, estado en DB, usuarios y motivo de recuperación."""
+        # DB en el hilo del event loop (conexión SQLite no compartible)
+        db_status = {r[0]: r[1] for r in self.controller.avds.read_all()}
+        users_by_avd: Dict[str, List[str]] = {}
+        for u in self.controller.users.read_all():
+            if u[4]:
+                users_by_avd.setdefault(u[4], []).append((u[5] or "").strip().lower())
+
+        fs_names = await asyncio.to_thread(self._fs_names)
+        sizes = await asyncio.gather(*(asyncio.to_thread(_dir_usage, self._path(n)) for n in fs_names))
+        states = await asyncio.to_thread(lambda: [(self._in_progress(n), self._age_s(n)) for n in fs_names])
+
+        entries = []
+        for name, size, (busy, age) in zip(fs_names, sizes, states):
+            user_states = users_by_avd.get(name, [])
+            entry = EmulatorCloner.catalog.get(name)
+            has_ini = AvdInstances.is_instance(name) or (entry is not None and entry.ini_valid)
+            if name not in db_status or not has_ini:
+                reason = "orphan"
+            elif not user_states:
+                reason = "no_users"
+            elif all(s == "completed" for s in user_states):
+                reason = "all_users_completed"
+            else:
+                reason = None
+            entries.append({
+                "avd_name": name,
+                "db_status": db_status.get(name),
+                "users": len(user_states),
+                "running": bool(self.is_running(name)),
+                "reclaim_reason": reason,
+                "in_progress": busy,
+                "age_s": round(age),
+                **size,
+            })
+        entries.sort(key=lambda e: e["exclusive_bytes"], reverse=True)
+        self._protect(entries)
+        missing_on_disk = sorted(n for n in db_status
+                                 if (self.CLONE_RE.match(n) or AvdInstances.is_instance(n)) and n not in fs_names)
+        frozen = await asyncio.to_thread(self._frozen_inventory)
+        total = sum(e["exclusive_bytes"] for e in entries) + sum(f["exclusive_bytes"] for f in frozen)
+        return {
+            "avds": entries,
+            "frozen_copies": frozen,
+            "missing_on_disk": missing_on_disk,
+            "total_exclusive_bytes": total,
+            "budget_bytes": int(self.DISK_BUDGET_GB * 2**30) or None,
+        }
+
+    # ---------- recuperación ----------
+    def _delete(self, name: str) -> None:
+        if AvdInstances.is_instance(name):
+            AvdInstances.delete(name)
+        else:
+            EmulatorCloner._discard_clone(name)  # .avd, .ini y marcador huérfano si lo hubiera
+
+    async def reclaim(self, dry_run: bool = True, include_completed: bool = False,
+                      names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Elimina AVDs huérfanos o sin usuarios (y con include_completed, aquellos cuyos
+        usuarios terminaron todos). Nunca toca el AVD base, los que están en ejecución ni
+        los protegidos (ver `_protect`).
+        """
+        inv = await self.scan()
+        reasons = {"orphan", "no_users"} | ({"all_users_completed"} if include_completed else set())
+        victims = [e for e in inv["avds"]
+                   if e["reclaim_reason"] in reasons and not e["running"] and e["protected"] is None
+                   and (names is None or e["avd_name"] in names)]
+        if not dry_run:
+            # Volver a comprobar justo antes de borrar: la reserva puede ser posterior al scan
+            busy = await asyncio.to_thread(lambda: {e["avd_name"] for e in victims if self._in_progress(e["avd_name"])})
+            victims = [e for e in victims if e["avd_name"] not in busy]
+            for e in victims:
+                await asyncio.to_thread(self._delete, e["avd_name"])
+                if e["db_status"] is not None:
+                    self.controller.avds.delete(e["avd_name"])
+                print(f"[AvdDiskManager] {e['avd_name']} recuperado ({e['reclaim_reason']}, "
+                      f"{e['exclusive_bytes'] / 2**20:.0f} MiB).")
+        # Copias congeladas que ya no enlaza ningún clon (también las que dejan los borrados de arriba)
+        pruned = await asyncio.to_thread(EmulatorCloner.prune_frozen, dry_run)
+        frozen = [{"name": f["name"], "bytes": f["bytes"]} for f in pruned]
+        freed = sum(e["exclusive_bytes"] for e in victims) + sum(f["bytes"] for f in frozen)
+        return {
+            "dry_run": dry_run,
+            "reclaimed": [{"avd_name": e["avd_name"], "reason": e["reclaim_reason"],
+                           "bytes": e["exclusive_bytes"]} for e in victims],
+            "frozen_copies": frozen,
+            "protected": [{"avd_name": e["avd_name"], "reason": e["reclaim_reason"], "protected": e["protected"]}
+                          for e in inv["avds"] if e["protected"]],
+            "freed_bytes": freed,
+        }
+
+    # ---------- compactación ----------
+    def _compact_avd(self, name: str) -> Tuple[int, List[Dict[str, str]]]:
+        """Compacta las imágenes de userdata; devuelve los bytes liberados y las omitidas (con motivo)."""
+        freed = 0
+        skipped: List[Dict[str, str]] = []
+        base = self._path(name)
+        for image in self.USERDATA_IMAGES:
+            path = os.path.join(base, image)
+            if os.path.isfile(path):
+                try:
+                    n, reason = _compact_image(path)
+                except (OSError, subprocess.CalledProcessError) as e:
+                    print(f"[AvdDiskManager] No se pudo compactar {path}: {e}")
+                    n, reason = 0, f"error: {e}"
+                freed += n
+                if reason:
+                    skipped.append({"image": image, "reason": reason})
+        return freed, skipped
+
+    async def compact(self, names: Optional[List[str]] = None, dry_run: bool = True) -> Dict[str, Any]:
+        inv = await self.scan()
+        targets = [e for e in inv["avds"]
+                   if not e["running"] and not e["in_progress"] and (names is None or e["avd_name"] in names)]
+        results = []
+        for e in targets:
+            freed, skipped = (0, []) if dry_run else await asyncio.to_thread(self._compact_avd, e["avd_name"])
+            results.append({"avd_name": e["avd_name"], "freed_bytes": freed, "skipped": skipped})
+        return {"dry_run": dry_run, "compacted": results, "freed_bytes": sum(r["freed_bytes"] for r in results)}
+
+    async def enforce_budget(self, dry_run: bool = True) -> Dict[str, Any]:
+        """
+        Si el uso supera AVD_DISK_BUDGET_GB: primero compacta (de mayor a menor) y, si no
+        basta, recupera AVDs huérfanos o sin usuarios.
+        """
+        inv = await self.scan()
+        budget = inv["budget_bytes"]
+        used = inv["total_exclusive_bytes"]
+        out: Dict[str, Any] = {"dry_run": dry_run, "budget_bytes": budget, "used_bytes": used, "actions": []}
+        if not budget or used <= budget:
+            return out
+        if dry_run:
+            out["actions"].append(await self.reclaim(dry_run=True))
+            return out
+        for e in inv["avds"]:
+            if used <= budget:
+                break
+            if e["running"] or e["in_progress"]:
+                continue
+            freed, skipped = await asyncio.to_thread(self._compact_avd, e["avd_name"])
+            used -= freed
+            out["actions"].append({"compact": e["avd_name"], "freed_bytes": freed, "skipped": skipped})
+        if used > budget:
+            res = await self.reclaim(dry_run=False)
+            used -= res["freed_bytes"]
+            out["actions"].append(res)
+        out["used_bytes"] = used
+        return out
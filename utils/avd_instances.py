@@ -0,0 +1,124 @@
+import os
+import re
+import shutil
+import asyncio
+import subprocess
+from pathlib import Path
+from typing import List, Dict, Any, Tuple
+
+from utils.emulator_cloner import EmulatorCloner, _find_qemu_img, _reflink, _mark_in_progress, _clear_in_progress, in_progress
+
+
+class AvdInstances:
+    """
+    Instancias lógicas de un único AVD base lanzadas con `-read-only`: cada instancia
+    ('<BASE>_InstN') es una fila más en la tabla `avds`, pero no tiene directorio .avd
+    propio; solo su imagen de datos (`-data`) en AVD_INSTANCES_DIR.
+    """
+    INSTANCES_DIR = Path(os.getenv("AVD_INSTANCES_DIR", str(Path.home() / ".android" / "avd_instances")))
+    PATTERN = re.compile(rf"^{re.escape(EmulatorCloner.BASE_NAME)}_Inst(\d+)$")
+
+    @staticmethod
+    def is_instance(avd_name: str) -> bool:
+        return bool(AvdInstances.PATTERN.match(avd_name or ""))
+
+    @staticmethod
+    def data_dir(avd_name: str) -> Path:
+        return AvdInstances.INSTANCES_DIR / avd_name
+
+    @staticmethod
+    def data_image(avd_name: str) -> Path:
+        return AvdInstances.data_dir(avd_name) / "userdata-qemu.img"
+
+    @staticmethod
+    def progress_marker(avd_name: str) -> Path:
+        """Marcador `<name>.creating` junto al directorio mientras se crea la imagen de datos."""
+        return AvdInstances.INSTANCES_DIR / f"{avd_name}.creating"
+
+    @staticmethod
+    def is_creating(avd_name: str) -> bool:
+        return in_progress(str(AvdInstances.progress_marker(avd_name)))
+
+    @staticmethod
+    def existing() -> List[str]:
+        """Instancias con imagen de datos ya creada, ordenadas por número."""
+        if not AvdInstances.INSTANCES_DIR.is_dir():
+            return []
+        found = []
+        for p in AvdInstances.INSTANCES_DIR.iterdir():
+            m = AvdInstances.PATTERN.match(p.name)
+            if m and (p / "userdata-qemu.img").exists():
+                found.append((int(m.group(1)), p.name))
+        return [name for _, name in sorted(found)]
+
+    @staticmethod
+    def resolve(avd_name: str, launch_kwargs: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Traduce un nombre lógico a (AVD real, kwargs de lanzamiento). Para una instancia:
+        el AVD base con `-read-only` y su propia imagen de datos.
+        """
+        if not AvdInstances.is_instance(avd_name):
+            return avd_name, launch_kwargs
+        image = AvdInstances.data_image(avd_name)
+        if not image.exists():
+            raise FileNotFoundError(f"La instancia '{avd_name}' no tiene imagen de datos ({image}).")
+        kwargs = dict(launch_kwargs)
+        kwargs["extra_args"] = list(kwargs.get("extra_args") or []) + ["-read-only", "-data", str(image)]
+        return EmulatorCloner.BASE_NAME, kwargs
+
+    @staticmethod
+    def _init_data_image(dst: Path) -> None:
+        """
+        Imagen de datos inicial de la instancia a partir de la base: si la base tiene
+        overlay qcow2 se aplana (conserva su estado, salida dispersa); si no, reflink o copia.
+        """
+        base_raw = os.path.join(EmulatorCloner.BASE_AVD, "userdata-qemu.img")
+        base_overlay = base_raw + ".qcow2"
+        qemu_img = _find_qemu_img()
+        if os.path.isfile(base_overlay) and qemu_img:
+            subprocess.run([qemu_img, "convert", "-O", "raw", base_overlay, str(dst)], check=True, capture_output=True)
+        elif not _reflink(base_raw, str(dst)):
+            shutil.copy2(base_raw, dst)
+
+    @staticmethod
+    def _create_one() -> str:
+        # mkdir atómico: dos llamadas concurrentes no pueden quedarse con el mismo número
+        AvdInstances.INSTANCES_DIR.mkdir(parents=True, exist_ok=True)
+        n = 1
+        while True:
+            name = f"{EmulatorCloner.BASE_NAME}_Inst{n}"
+            try:
+                os.mkdir(AvdInstances.data_dir(name))
+                break
+            except FileExistsError:
+                n += 1
+        marker = str(AvdInstances.progress_marker(name))
+        _mark_in_progress(marker)
+        try:
+            AvdInstances._init_data_image(AvdInstances.data_image(name))
+        except BaseException:
+            shutil.rmtree(AvdInstances.data_dir(name), ignore_errors=True)
+            raise
+        finally:
+            _clear_in_progress(marker)
+        return name
+
+    @staticmethod
+    async def create(count: int = 1) -> List[str]:
+        """Crea `count` instancias nuevas del AVD base y devuelve sus nombres lógicos."""
+        await EmulatorCloner.verify_base_files()
+        created = []
+        for _ in range(max(0, count)):
+            name = await asyncio.to_thread(AvdInstances._create_one)
+            print(f"[AvdInstances] Instancia {name} creada ({AvdInstances.data_dir(name)}).")
+            created.append(name)
+        return created
+
+    @staticmethod
+    def delete(avd_name: str) -> bool:
+        d = AvdInstances.data_dir(avd_name)
+        if not AvdInstances.is_instance(avd_name) or not d.is_dir():
+            return False
+        shutil.rmtree(d)
+        _clear_in_progress(str(AvdInstances.progress_marker(avd_name)))
+        return True
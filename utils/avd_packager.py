@@ -0,0 +1,557 @@
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import argparse
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Callable, BinaryIO
+
+from utils.emulator_cloner import EmulatorCloner, _find_qemu_img
+
+FORMAT_VERSION = 2
+
+
+def _data_ranges(fd: int, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Tramos con datos de un fichero disperso (SEEK_DATA/SEEK_HOLE), o None si el FS no lo soporta."""
+    if not hasattr(os, "SEEK_DATA"):
+        return None
+    ranges = []
+    pos = 0
+    try:
+        while pos < size:
+            try:
+                start = os.lseek(fd, pos, os.SEEK_DATA)
+            except OSError:
+                break  # ENXIO: solo huecos hasta el final
+            end = os.lseek(fd, start, os.SEEK_HOLE)
+            ranges.append((start, end))
+            pos = end
+    except OSError:
+        return None
+    return ranges
+
+
+def _overlaps(ranges: Optional[List[Tuple[int, int]]], start: int, end: int) -> bool:
+    if ranges is None:
+        return True
+    return any(s < end and start < e for s, e in ranges)
+
+
+def _bounded_map(pool: ThreadPoolExecutor, fn: Callable, items: Iterable, window: int) -> Iterable:
+    """`pool.map` con como mucho `window` tareas en vuelo (no carga todo en memoria)."""
+    inflight: deque = deque()
+    for item in items:
+        inflight.append(pool.submit(fn, item))
+        if len(inflight) >= window:
+            yield inflight.popleft().result()
+    while inflight:
+        yield inflight.popleft().result()
+
+
+def _safe_relpath(rel: str) -> str:
+    norm = os.path.normpath(rel)
+    if os.path.isabs(norm) or norm == ".." or norm.startswith(".." + os.sep):
+        raise ValueError(f"Ruta no válida en el manifiesto: {rel}")
+    return norm
+
+
+class AvdPackager:
+    """
+    Exporta un AVD (base o clon) como un tar en streaming, leyendo cada trozo una sola vez
+    (lectura, sha256 y zlib en la misma pasada, en paralelo):
+    - `manifest.json` primero: .ini y ficheros (ruta, tamaño, modo, backing), sin trozos;
+    - `chunks/<fichero>/<trozo>/<sha256>`: el trozo comprimido la primera vez que aparece
+      su contenido, vacío si repite uno ya enviado; los trozos a cero (o huecos de ficheros
+      dispersos) no se envían;
+    - `index.json` al final: la lista de sha256 de cada fichero, para comprobar que llegó todo.
+    La importación lee el tar en streaming, descomprime, verifica el sha256 y escribe cada
+    trozo con `pwrite` en su posición (los repetidos se copian al final desde la primera),
+    así que el tiempo lo marcan la red y el disco. Uso:
+
+        python -m utils.avd_packager export Nexus_5_API_31 -o base.avdpack
+        python -m utils.avd_packager export Nexus_5_API_31 -o - | ssh host \\
+            "cd /srv/app && python -m utils.avd_packager import -"
+        python -m utils.avd_packager check Nexus_5_API_31   # ida y vuelta en una copia temporal
+    """
+    CHUNK_SIZE = int(os.getenv("AVD_PACK_CHUNK_MB", "4")) * 2**20
+    LEVEL = int(os.getenv("AVD_PACK_LEVEL", "1"))
+    WORKERS = int(os.getenv("AVD_PACK_WORKERS", str(min(8, os.cpu_count() or 2))))
+    SKIP_SUFFIXES = (".lock",)
+
+    # ---------- exportación ----------
+    @staticmethod
+    def _backing(qemu_img: Optional[str], path: str, avd_dir: str) -> Optional[Dict[str, Any]]:
+        """
+        Backing de un overlay qcow2, descrito según dónde tendrá que estar en el destino:
+        - {"file", "format", "self": True}: otro fichero del mismo AVD (overlays propios, p.ej. del base);
+        - {"file", "format", "dir"}: un directorio de AVD_DIR (AVD base o su copia congelada);
+        - {"path", "format"}: fuera de AVD_DIR (p.ej. system-images del SDK); la ruta no cambia.
+        """
+        if not qemu_img or not path.endswith(".qcow2"):
+            return None
+        out = subprocess.run([qemu_img, "info", "--output=json", path], check=True, capture_output=True, text=True)
+        info = json.loads(out.stdout)
+        backing = info.get("full-backing-filename") or info.get("backing-filename")
+        if not backing:
+            return None
+        fmt = info.get("backing-filename-format", "raw")
+        backing = os.path.realpath(os.path.join(os.path.dirname(path), backing))
+        avd_dir = os.path.realpath(avd_dir)
+        root = os.path.realpath(EmulatorCloner.AVD_DIR)
+        if os.path.commonpath([backing, avd_dir]) == avd_dir:
+            return {"file": os.path.relpath(backing, avd_dir), "format": fmt, "self": True}
+        if os.path.dirname(os.path.dirname(backing)) == root:
+            return {"file": os.path.basename(backing), "format": fmt, "dir": os.path.basename(os.path.dirname(backing))}
+        return {"path": backing, "format": fmt}
+
+    @staticmethod
+    def _list_files(avd_dir: str, include_snapshots: bool) -> List[Dict[str, Any]]:
+        """Ficheros a exportar con sus metadatos (sin leer su contenido)."""
+        qemu_img = _find_qemu_img()
+        files: List[Dict[str, Any]] = []
+        for root, dirs, names in os.walk(avd_dir):
+            rel_root = os.path.relpath(root, avd_dir)
+            if rel_root == "." and not include_snapshots:
+                dirs[:] = [d for d in dirs if d != "snapshots"]
+            dirs.sort()
+            for name in sorted(names):
+                if name.endswith(AvdPackager.SKIP_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                entry: Dict[str, Any] = {
+                    "path": os.path.normpath(os.path.join(rel_root, name)),
+                    "size": st.st_size,
+                    "mode": st.st_mode & 0o777,
+                    "mtime": st.st_mtime,
+                }
+                backing = AvdPackager._backing(qemu_img, path, avd_dir)
+                if backing:
+                    entry["backing"] = backing
+                files.append(entry)
+        return files
+
+    @staticmethod
+    def _chunk_tasks(avd_dir: str, files: List[Dict[str, Any]]) -> Iterable[Tuple[int, int, str, int, int]]:
+        """(fichero, trozo, ruta, offset, longitud) de cada trozo con datos; los huecos se saltan sin leerlos."""
+        chunk_size = AvdPackager.CHUNK_SIZE
+        for fi, entry in enumerate(files):
+            path = os.path.join(avd_dir, entry["path"])
+            with open(path, "rb", buffering=0) as f:
+                ranges = _data_ranges(f.fileno(), entry["size"])
+            for ci, off in enumerate(range(0, entry["size"], chunk_size)):
+                length = min(chunk_size, entry["size"] - off)
+                if _overlaps(ranges, off, off + length):
+                    yield fi, ci, path, off, length
+
+    @staticmethod
+    def _chunk_reader() -> Callable:
+        """
+        Lee un trozo, calcula su sha256 y lo comprime solo si es la primera vez que aparece
+        ese contenido (en cualquier hilo). Devuelve (fichero, trozo, sha256 o None si es
+        cero, blob o None si es repetido).
+        """
+        zero = bytes(AvdPackager.CHUNK_SIZE)
+        claimed: set = set()
+        lock = threading.Lock()
+
+        def _read(task: Tuple[int, int, str, int, int]) -> Tuple[int, int, Optional[str], Optional[bytes]]:
+            fi, ci, path, off, length = task
+            with open(path, "rb", buffering=0) as f:
+                data = os.pread(f.fileno(), length, off)
+            if len(data) != length:
+                raise RuntimeError(f"{path} cambió durante la exportación (offset {off}).")
+            if data == zero[:length]:
+                return fi, ci, None, None
+            digest = hashlib.sha256(data).hexdigest()
+            with lock:
+                first = digest not in claimed
+                claimed.add(digest)
+            return fi, ci, digest, zlib.compress(data, AvdPackager.LEVEL) if first else None
+
+        return _read
+
+    @staticmethod
+    def _add_bytes(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(data))
+
+    @staticmethod
+    def export(avd_name: str, out: BinaryIO, include_snapshots: bool = True) -> Dict[str, Any]:
+        """Escribe el paquete de `avd_name` en `out` (fichero o pipe) y devuelve un informe."""
+        avd_dir = os.path.join(EmulatorCloner.AVD_DIR, avd_name + ".avd")
+        ini_path = os.path.join(EmulatorCloner.AVD_DIR, avd_name + ".ini")
+        if not os.path.isdir(avd_dir) or not os.path.isfile(ini_path):
+            raise FileNotFoundError(f"AVD no encontrado: {avd_name}")
+
+        t0 = time.monotonic()
+        files = AvdPackager._list_files(avd_dir, include_snapshots)
+        with open(ini_path, "r") as f:
+            ini = f.read()
+        manifest = {
+            "format": FORMAT_VERSION,
+            "avd_name": avd_name,
+            "base_name": EmulatorCloner.BASE_NAME,
+            "chunk_size": AvdPackager.CHUNK_SIZE,
+            "compression": "zlib",
+            "created_at": time.time(),
+            "ini": ini,
+            "files": files,
+        }
+        chunk_size = AvdPackager.CHUNK_SIZE
+        index: List[List[Optional[str]]] = [[None] * -(-e["size"] // chunk_size) for e in files]
+        report = {
+            "avd_name": avd_name,
+            "files": len(files),
+            "source_bytes": sum(e["size"] for e in files),
+            "chunks": sum(len(chunks) for chunks in index),
+            "unique_chunks": 0,
+            "stored_bytes": 0,
+        }
+
+        with tarfile.open(fileobj=out, mode="w|") as tar:
+            AvdPackager._add_bytes(tar, "manifest.json", json.dumps(manifest).encode())
+            sent: set = set()
+            # Repetidos cuyo primer envío (en otro hilo) aún no ha salido: van detrás de él
+            waiting: Dict[str, List[str]] = {}
+            with ThreadPoolExecutor(max_workers=AvdPackager.WORKERS) as pool:
+                for fi, ci, digest, blob in _bounded_map(
+                    pool, AvdPackager._chunk_reader(), AvdPackager._chunk_tasks(avd_dir, files),
+                    AvdPackager.WORKERS * 2
+                ):
+                    if digest is None:
+                        continue
+                    index[fi][ci] = digest
+                    member = f"chunks/{fi}/{ci}/{digest}"
+                    if blob is not None:
+                        AvdPackager._add_bytes(tar, member, blob)
+                        sent.add(digest)
+                        report["unique_chunks"] += 1
+                        report["stored_bytes"] += len(blob)
+                        for dup in waiting.pop(digest, []):
+                            AvdPackager._add_bytes(tar, dup, b"")
+                    elif digest in sent:
+                        AvdPackager._add_bytes(tar, member, b"")
+                    else:
+                        waiting.setdefault(digest, []).append(member)
+            AvdPackager._add_bytes(tar, "index.json", json.dumps({"chunks": index}).encode())
+
+        report["seconds"] = round(time.monotonic() - t0, 2)
+        print(
+            f"[AvdPackager] {avd_name} exportado en {report['seconds']}s: {report['unique_chunks']}/"
+            f"{report['chunks']} trozos, {report['stored_bytes'] / 2**20:.0f} MiB de "
+            f"{report['source_bytes'] / 2**20:.0f} MiB.",
+            file=sys.stderr  # stdout puede ser el propio paquete
+        )
+        return report
+
+    # ---------- importación ----------
+    @staticmethod
+    def _backing_target(backing: Dict[str, Any], avd_dir: str) -> Optional[str]:
+        """Ruta del backing en este host (None si no hay que tocar el overlay)."""
+        if backing.get("self"):
+            return os.path.join(avd_dir, _safe_relpath(backing["file"]))
+        if backing.get("path"):
+            return None
+        # Paquetes anteriores solo traían "file": backing dentro del AVD base
+        directory = backing.get("dir") or os.path.basename(EmulatorCloner.BASE_AVD)
+        return os.path.join(EmulatorCloner.AVD_DIR, _safe_relpath(directory), _safe_relpath(backing["file"]))
+
+    @staticmethod
+    def _check_backings(files: List[Dict[str, Any]]) -> None:
+        """Antes de instalar: los backings que no viajan en el paquete deben existir en este host."""
+        if any(e.get("backing") for e in files) and not _find_qemu_img():
+            raise RuntimeError("Se necesita qemu-img para importar un AVD con overlays qcow2.")
+        for entry in files:
+            backing = entry.get("backing")
+            if not backing or backing.get("self"):
+                continue
+            if backing.get("path"):
+                if not os.path.isfile(backing["path"]):
+                    print(f"[AvdPackager] Aviso: {entry['path']} depende de {backing['path']}, "
+                          f"que no existe en este host.")
+                continue
+            target = AvdPackager._backing_target(backing, "")
+            if not os.path.isfile(target):
+                raise FileNotFoundError(f"El overlay {entry['path']} necesita {target} en este host.")
+
+    @staticmethod
+    def _rebase_overlay(path: str, backing: Dict[str, Any], avd_dir: str) -> None:
+        """Apunta el overlay a su backing en este host; `avd_dir` es el directorio ya definitivo."""
+        target = AvdPackager._backing_target(backing, avd_dir)
+        if target is None:
+            return
+        subprocess.run(
+            [_find_qemu_img(), "rebase", "-u", "-F", backing["format"], "-b", target, path],
+            check=True, capture_output=True
+        )
+
+    @staticmethod
+    def import_(src: BinaryIO, name: Optional[str] = None, force: bool = False) -> Dict[str, Any]:
+        """
+        Lee un paquete de `src` en streaming y lo instala como `name` (por defecto el
+        nombre original) en el directorio de AVDs, reescribiendo el .ini como el cloner.
+        Se escribe en `<name>.avd.importing` y se renombra al terminar; los overlays se
+        reapuntan después del renombrado (los del propio AVD, p.ej. al importar el base,
+        apuntan a ficheros que solo existen en su ruta definitiva).
+        """
+        t0 = time.monotonic()
+        with tarfile.open(fileobj=src, mode="r|") as tar:
+            members = iter(tar)
+            first = next(members, None)
+            if first is None or first.name != "manifest.json":
+                raise ValueError("Paquete no válido: falta manifest.json al principio.")
+            manifest = json.loads(tar.extractfile(first).read())
+            if manifest.get("format") != FORMAT_VERSION or manifest.get("compression") != "zlib":
+                raise ValueError(f"Formato de paquete no soportado: {manifest.get('format')}")
+
+            name = name or manifest["avd_name"]
+            final_dir = os.path.join(EmulatorCloner.AVD_DIR, name + ".avd")
+            ini_path = os.path.join(EmulatorCloner.AVD_DIR, name + ".ini")
+            if os.path.exists(final_dir) or os.path.exists(ini_path):
+                if not force:
+                    raise FileExistsError(f"El AVD {name} ya existe (usa --force para reemplazarlo).")
+            AvdPackager._check_backings(manifest["files"])
+            work_dir = final_dir + ".importing"
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir)
+
+            chunk_size = manifest["chunk_size"]
+            fds: List[int] = []
+            try:
+                for entry in manifest["files"]:
+                    path = os.path.join(work_dir, _safe_relpath(entry["path"]))
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, entry["mode"])
+                    os.ftruncate(fd, entry["size"])  # los trozos a cero quedan como huecos
+                    fds.append(fd)
+
+                def _where(fi: int, ci: int) -> Tuple[int, int, int]:
+                    size = manifest["files"][fi]["size"]
+                    if not 0 <= ci * chunk_size < size:
+                        raise ValueError(f"Trozo fuera del fichero: {fi}/{ci}")
+                    return fds[fi], ci * chunk_size, min(chunk_size, size - ci * chunk_size)
+
+                def _write(item: Tuple[str, int, int, int, bytes]) -> int:
+                    digest, fd, off, length, blob = item
+                    data = zlib.decompress(blob)
+                    if len(data) != length or hashlib.sha256(data).hexdigest() != digest:
+                        raise ValueError(f"Checksum incorrecto en el trozo {digest}.")
+                    os.pwrite(fd, data, off)
+                    return length
+
+                received: Dict[Tuple[int, int], str] = {}
+                first: Dict[str, Tuple[int, int, int]] = {}
+                repeats: List[Tuple[str, int, int, int]] = []
+                trailer: Dict[str, Any] = {}
+
+                def _chunks():
+                    for m in members:
+                        if m.name == "index.json":
+                            trailer.update(json.loads(tar.extractfile(m).read()))
+                            continue
+                        if not m.name.startswith("chunks/"):
+                            continue
+                        fi, ci, digest = m.name[len("chunks/"):].split("/")
+                        fd, off, length = _where(int(fi), int(ci))
+                        received[(int(fi), int(ci))] = digest
+                        if m.size == 0:
+                            repeats.append((digest, fd, off, length))  # se copia al final
+                            continue
+                        first.setdefault(digest, (fd, off, length))
+                        yield digest, fd, off, length, tar.extractfile(m).read()
+
+                def _copy(item: Tuple[str, int, int, int]) -> int:
+                    digest, fd, off, length = item
+                    if digest not in first:
+                        raise ValueError(f"Trozo repetido sin original en el paquete: {digest}")
+                    src_fd, src_off, _ = first[digest]
+                    os.pwrite(fd, os.pread(src_fd, length, src_off), off)
+                    return length
+
+                written = 0
+                with ThreadPoolExecutor(max_workers=AvdPackager.WORKERS) as pool:
+                    for n in _bounded_map(pool, _write, _chunks(), AvdPackager.WORKERS * 2):
+                        written += n
+                    for n in _bounded_map(pool, _copy, repeats, AvdPackager.WORKERS * 2):
+                        written += n
+
+                # El índice final dice qué trozo va en cada posición: todo debe haber llegado
+                if "chunks" not in trailer:
+                    raise ValueError("Paquete incompleto: falta index.json al final.")
+                expected = {(fi, ci): d for fi, chunks in enumerate(trailer["chunks"])
+                            for ci, d in enumerate(chunks) if d is not None}
+                if expected != received:
+                    missing = len(set(expected.items()) - set(received.items()))
+                    raise ValueError(f"Paquete incompleto o inconsistente: {missing} trozos no coinciden con el índice.")
+            except BaseException:
+                for fd in fds:
+                    os.close(fd)
+                fds = []
+                shutil.rmtree(work_dir, ignore_errors=True)
+                raise
+            finally:
+                for fd in fds:
+                    os.fsync(fd)
+                    os.close(fd)
+
+        try:
+            if force:
+                shutil.rmtree(final_dir, ignore_errors=True)
+            os.rename(work_dir, final_dir)
+        except BaseException:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+        try:
+            for entry in manifest["files"]:
+                path = os.path.join(final_dir, _safe_relpath(entry["path"]))
+                if entry.get("backing"):
+                    AvdPackager._rebase_overlay(path, entry["backing"], final_dir)
+                os.utime(path, (entry["mtime"], entry["mtime"]))
+        except BaseException:
+            shutil.rmtree(final_dir, ignore_errors=True)
+            raise
+        lines = EmulatorCloner.render_ini(manifest["ini"].splitlines(keepends=True), name)
+        tmp = ini_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(lines)
+        os.replace(tmp, ini_path)
+
+        report = {
+            "avd_name": name,
+            "source_avd": manifest["avd_name"],
+            "files": len(manifest["files"]),
+            "unique_chunks": len(first),
+            "written_bytes": written,
+            "seconds": round(time.monotonic() - t0, 2),
+        }
+        print(
+            f"[AvdPackager] {name} importado en {report['seconds']}s: {report['files']} ficheros, "
+            f"{written / 2**20:.0f} MiB escritos."
+        )
+        return report
+
+    # ---------- verificación ----------
+    @staticmethod
+    def _file_digests(avd_dir: str, skip: Iterable[str]) -> Dict[str, str]:
+        skip = set(skip)
+        digests = {}
+        for root, _dirs, names in os.walk(avd_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, avd_dir)
+                if name.endswith(AvdPackager.SKIP_SUFFIXES) or rel in skip:
+                    continue
+                h = hashlib.sha256()
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(2**20), b""):
+                        h.update(block)
+                digests[rel] = h.hexdigest()
+        return digests
+
+    @staticmethod
+    def roundtrip_check(avd_name: str, include_snapshots: bool = True) -> Dict[str, Any]:
+        """
+        Exporta `avd_name`, lo importa como `<avd_name>_RoundTrip` y comprueba que el
+        contenido coincide y que cada overlay apunta al backing equivalente (los del propio
+        AVD, dentro de la copia importada). La copia se borra al terminar.
+        """
+        copy_name = f"{avd_name}_RoundTrip"
+        src_dir = os.path.join(EmulatorCloner.AVD_DIR, avd_name + ".avd")
+        copy_dir = os.path.join(EmulatorCloner.AVD_DIR, copy_name + ".avd")
+        copy_ini = os.path.join(EmulatorCloner.AVD_DIR, copy_name + ".ini")
+        qemu_img = _find_qemu_img()
+        problems: List[str] = []
+        try:
+            with tempfile.TemporaryFile() as package:
+                export = AvdPackager.export(avd_name, package, include_snapshots)
+                package.seek(0)
+                imported = AvdPackager.import_(package, copy_name, force=True)
+
+            overlays = {}
+            for root, _dirs, names in os.walk(src_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    backing = AvdPackager._backing(qemu_img, path, src_dir)
+                    if backing:
+                        overlays[os.path.relpath(path, src_dir)] = backing
+            for rel, backing in overlays.items():
+                got = AvdPackager._backing(qemu_img, os.path.join(copy_dir, rel), copy_dir)
+                if got != backing:
+                    problems.append(f"{rel}: backing {got} en la copia, {backing} en el original")
+
+            # Los overlays cambian de cabecera al reapuntarlos: se comparan por su backing
+            src = AvdPackager._file_digests(src_dir, overlays)
+            dst = AvdPackager._file_digests(copy_dir, overlays)
+            if not include_snapshots:
+                src = {k: v for k, v in src.items() if not k.startswith("snapshots" + os.sep)}
+            for rel in sorted(set(src) | set(dst)):
+                if src.get(rel) != dst.get(rel):
+                    problems.append(f"{rel}: contenido distinto" if rel in src and rel in dst
+                                    else f"{rel}: falta en {'la copia' if rel in src else 'el original'}")
+        finally:
+            shutil.rmtree(copy_dir, ignore_errors=True)
+            if os.path.exists(copy_ini):
+                os.remove(copy_ini)
+        return {
+            "avd_name": avd_name,
+            "ok": not problems,
+            "problems": problems,
+            "overlays": len(overlays),
+            "export": export,
+            "import": imported,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Exporta/importa AVDs como paquetes comprimidos con trozos deduplicados.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_exp = sub.add_parser("export", help="Empaqueta un AVD (base o clon).")
+    p_exp.add_argument("avd_name")
+    p_exp.add_argument("-o", "--output", default="-", help="Fichero de salida ('-' = stdout).")
+    p_exp.add_argument("--no-snapshots", action="store_true", help="No incluir el directorio snapshots/.")
+
+    p_imp = sub.add_parser("import", help="Instala un paquete en el directorio de AVDs.")
+    p_imp.add_argument("archive", help="Paquete de entrada ('-' = stdin).")
+    p_imp.add_argument("--name", default=None, help="Nombre del AVD importado (por defecto, el original).")
+    p_imp.add_argument("--force", action="store_true", help="Reemplazar el AVD si ya existe.")
+
+    p_chk = sub.add_parser("check", help="Exporta e importa un AVD en una copia temporal y compara.")
+    p_chk.add_argument("avd_name")
+    p_chk.add_argument("--no-snapshots", action="store_true", help="No incluir el directorio snapshots/.")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        if args.output == "-":
+            report = AvdPackager.export(args.avd_name, sys.stdout.buffer, not args.no_snapshots)
+        else:
+            with open(args.output, "wb") as out:
+                report = AvdPackager.export(args.avd_name, out, not args.no_snapshots)
+        print(json.dumps(report), file=sys.stderr)
+    elif args.command == "check":
+        report = AvdPackager.roundtrip_check(args.avd_name, not args.no_snapshots)
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report["ok"] else 1)
+    else:
+        if args.archive == "-":
+            report = AvdPackager.import_(sys.stdin.buffer, args.name, args.force)
+        else:
+            with open(args.archive, "rb") as src:
+                report = AvdPackager.import_(src, args.name, args.force)
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
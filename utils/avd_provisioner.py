@@ -0,0 +1,105 @@
+import os
+import math
+import asyncio
+from typing import Optional, List, Dict, Any, Callable, Awaitable
+
+from db.controller import USERS_PER_AVD
+
+
+class AvdProvisioner:
+    """
+    Mantiene en segundo plano un margen de capacidad (huecos de usuario libres en AVDs
+    'active'): cuando el margen baja de AVD_HEADROOM_SLOTS, o hay usuarios esperando
+    AVD, crea AVDs en los periodos sin ejecuciones y asigna los usuarios pendientes.
+    Así la subida de usuarios solo reclama capacidad ya lista y no espera a clonar.
+    """
+
+    def __init__(self, controller, create_avds: Callable[[int], Awaitable[List[str]]],
+                 is_idle: Optional[Callable[[], bool]] = None,
+                 headroom_slots: Optional[int] = None, interval: Optional[float] = None,
+                 on_event: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None):
+        """
+        create_avds: corrutina count -> nombres de los AVDs creados y registrados en DB.
+        is_idle: True si no hay ejecuciones en curso (solo entonces se clona).
+        """
+        self.controller = controller
+        self.create_avds = create_avds
+        self.is_idle = is_idle or (lambda: True)
+        self.headroom_slots = int(os.getenv("AVD_HEADROOM_SLOTS", "10")) if headroom_slots is None else headroom_slots
+        self.interval = float(os.getenv("AVD_PROVISION_INTERVAL", "30")) if interval is None else interval
+        self.on_event = on_event
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._provisioning = False
+
+    # ---------- ciclo de vida ----------
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._loop())
+            print(f"[AvdProvisioner] Margen objetivo: {self.headroom_slots} huecos libres.")
+
+    def kick(self) -> None:
+        """Revisa la capacidad ya (p.ej. tras una subida de usuarios)."""
+        self.start()
+        self._wake.set()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _emit(self, etype: str, data: Dict[str, Any]) -> None:
+        if self.on_event is not None:
+            try:
+                await self.on_event(etype, data)
+            except Exception as e:
+                print(f"[AvdProvisioner] Error notificando {etype}: {e}")
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.provision_once()
+            except Exception as e:
+                print(f"[AvdProvisioner] Error aprovisionando: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    # ---------- capacidad ----------
+    def status(self) -> Dict[str, Any]:
+        free = self.controller.free_slots()
+        waiting = len(self.controller.unassigned_users())
+        return {
+            "free_slots": free,
+            "waiting_users": waiting,
+            "headroom_target": self.headroom_slots,
+            "deficit": max(0, self.headroom_slots + waiting - free),
+            "provisioning": self._provisioning,
+            "idle": self.is_idle(),
+        }
+
+    async def provision_once(self) -> List[str]:
+        """Un ciclo: crea los AVDs que falten (si está ocioso) y asigna pendientes."""
+        created: List[str] = []
+        st = self.status()
+        if st["deficit"] > 0 and self.is_idle():
+            count = math.ceil(st["deficit"] / USERS_PER_AVD)
+            self._provisioning = True
+            await self._emit("avd_provisioning_started", {"count": count, **st})
+            try:
+                created = await self.create_avds(count)
+            finally:
+                self._provisioning = False
+            print(f"[AvdProvisioner] {len(created)}/{count} AVDs creados para mantener el margen.")
+
+        # La conexión SQLite pertenece al hilo del event loop: llamada directa
+        assigned = self.controller.assign_pending_users()
+        if created or assigned:
+            await self._emit("avd_provisioned", {"created": created, "assigned_users": assigned, **self.status()})
+        return created
@@ -0,0 +1,194 @@
+# utils/debug_sink.py
+"""
+Escritura asíncrona de artefactos de depuración (page source, screenshots...). El flujo
+solo captura los bytes y los encola; un hilo escritor los guarda con nombre único por
+ejecución, dispositivo y usuario (`<run>/<udid>_<user>_<ts>_<seq>_<tag>.<ext>`), comprime
+los de texto con gzip (los PNG ya van comprimidos) y aplica la retención.
+El contexto (run, udid, usuario) viaja en un contextvar, así que se propaga a los hilos
+de `asyncio.to_thread`.
+Todo va bajo DEBUG_SINK_DIR (por defecto `debug/sink`, aparte de los volcados manuales y de
+logcat en `debug/`), y la retención solo borra ficheros con el nombre que genera el sink.
+"""
+import os
+import re
+import gzip
+import time
+import queue
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Union, List, Tuple, Callable
+
+DEBUG_SINK_DIR = Path(os.getenv("DEBUG_SINK_DIR", "debug/sink"))
+DEBUG_QUEUE_SIZE = int(os.getenv("DEBUG_QUEUE_SIZE", "64"))
+DEBUG_RETENTION_DAYS = float(os.getenv("DEBUG_RETENTION_DAYS", "7"))  # 0 = sin límite
+DEBUG_RETENTION_MB = float(os.getenv("DEBUG_RETENTION_MB", "500"))  # 0 = sin límite
+_RETENTION_EVERY = 50  # escrituras entre pasadas de retención
+_COMPRESS = {"xml", "txt", "json", "html", "log"}
+# <udid>_<user>_<YYYYmmdd_HHMMSSmmm>_<seq>_<tag>.<ext>[.gz] (ver DebugSink._path)
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+_\d{8}_\d{9}_\d+_[A-Za-z0-9_.-]+\.[A-Za-z0-9]+(\.gz)?$")
+
+_context: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("debug_sink_context", default={})
+
+
+def _safe(value: Optional[str]) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(value or "na"))[:64]
+
+
+def set_context(run_id: Optional[str] = None, udid: Optional[str] = None, user: Optional[str] = None):
+    """Fija run/udid/usuario para los artefactos de este contexto. Devuelve el token del contextvar."""
+    ctx = dict(_context.get())
+    ctx.update({k: v for k, v in (("run_id", run_id), ("udid", udid), ("user", user)) if v is not None})
+    return _context.set(ctx)
+
+
+@contextmanager
+def debug_context(run_id: Optional[str] = None, udid: Optional[str] = None, user: Optional[str] = None):
+    token = set_context(run_id, udid, user)
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class DebugSink:
+    """Cola acotada + hilo escritor. `put` nunca espera: si la cola está llena, descarta."""
+
+    def __init__(self, root: Path = DEBUG_SINK_DIR, max_pending: int = DEBUG_QUEUE_SIZE):
+        self.root = Path(root)
+        self._queue: "queue.Queue[Tuple[Dict[str, str], str, str, Union[bytes, str], float]]" = queue.Queue(max_pending)
+        self._seq = itertools.count(1)
+        self._written = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="debug-sink", daemon=True)
+        self._thread.start()
+
+    # ---------- productor (hilo del flujo) ----------
+    def put(self, tag: str, ext: str, data: Union[bytes, str, Callable[[], bytes]]) -> bool:
+        """`data` puede ser una función sin argumentos: se llama en el hilo escritor (p.ej. codificar PNG)."""
+        try:
+            self._queue.put_nowait((dict(_context.get()), tag, ext, data, time.time()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f"[DebugSink] Cola llena; se descarta {tag}.{ext}.")
+            return False
+
+    def flush(self, timeout: float = 10) -> None:
+        """Espera a que se escriba lo encolado (como mucho `timeout` s)."""
+        end = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < end:
+            time.sleep(0.05)
+
+    # ---------- escritor ----------
+    def _path(self, ctx: Dict[str, str], tag: str, ext: str, ts: float) -> Path:
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(ts)) + f"{int(ts * 1000) % 1000:03d}"
+        name = f"{_safe(ctx.get('udid'))}_{_safe(ctx.get('user'))}_{stamp}_{next(self._seq)}_{_safe(tag)}.{ext}"
+        return self.root / _safe(ctx.get("run_id")) / name
+
+    def _write(self, ctx: Dict[str, str], tag: str, ext: str, data: Union[bytes, str], ts: float) -> Path:
+        if callable(data):
+            data = data()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if ext in _COMPRESS:
+            data = gzip.compress(data, compresslevel=6)
+            ext += ".gz"
+        path = self._path(ctx, tag, ext, ts)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return path
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                path = self._write(*item)
+                print(f"[DebugSink] guardado: {path}")
+                self._written += 1
+                if self._written % _RETENTION_EVERY == 1:
+                    self.apply_retention()
+            except Exception as e:
+                print(f"[DebugSink] Error guardando {item[1]}.{item[2]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def apply_retention(self, max_age_days: float = DEBUG_RETENTION_DAYS,
+                        max_mb: float = DEBUG_RETENTION_MB) -> List[Path]:
+        """
+        Borra artefactos más antiguos que `max_age_days` y los más viejos por encima de `max_mb`.
+        Solo cuenta y borra ficheros `<run>/<nombre del sink>`: nada que no haya escrito el sink.
+        """
+        files = []
+        for p in self.root.glob("*/*"):
+            if _NAME_RE.match(p.name) and p.is_file():
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+        files.sort()
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+        removed = []
+        for mtime, size, p in files:
+            too_old = max_age_days and now - mtime > max_age_days * 86400
+            too_big = max_mb and total > max_mb * 2**20
+            if not (too_old or too_big):
+                continue
+            p.unlink(missing_ok=True)
+            total -= size
+            removed.append(p)
+        for d in sorted({p.parent for p in removed}, reverse=True):
+            if d != self.root:
+                try:
+                    d.rmdir()  # solo si quedó vacío
+                except OSError:
+                    pass
+        return removed
+
+
+# Un escritor por proceso, creado al primer uso (el hilo no sobrevive al fork)
+_sink: Optional[DebugSink] = None
+_sink_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _sink, _sink_lock
+    _sink = None
+    _sink_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_sink() -> DebugSink:
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = DebugSink()
+        return _sink
+
+
+def capture(tag: str, **artifacts: Union[bytes, str, Callable[[], bytes], None]) -> None:
+    """
+    Encola artefactos ya capturados; la clave es la extensión:
+        capture("login_fail", xml=driver.page_source, png=driver.get_screenshot_as_png())
+    """
+    sink = get_sink()
+    for ext, data in artifacts.items():
+        if data is not None:
+            sink.put(tag, ext, data)
+
+
+def flush(timeout: float = 10) -> None:
+    with _sink_lock:
+        sink = _sink
+    if sink is not None:
+        sink.flush(timeout)
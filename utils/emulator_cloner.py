@@ -1,9 +1,91 @@
 import os
-import re
+import json
+import time
+import fcntl
 import shutil
+import hashlib
+import threading
 import aiofiles
 import asyncio
+import subprocess
 from pathlib import Path
+from typing import Optional, Dict, Any, List, AsyncIterator
+
+from utils.avd_catalog import AvdCatalog
+
+# ioctl FICLONE (linux/fs.h): clon por reflink en btrfs, XFS (reflink=1), bcachefs...
+_FICLONE = 0x40049409
+
+
+def _find_qemu_img() -> Optional[str]:
+    """qemu-img del PATH o el que trae el SDK del emulador."""
+    found = shutil.which("qemu-img")
+    if found:
+        return found
+    for env in ("ANDROID_SDK_ROOT", "ANDROID_HOME"):
+        root = os.getenv(env)
+        if root:
+            candidate = os.path.join(root, "emulator", "qemu-img")
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """Copia `src` en `dst` compartiendo bloques (sin copiar datos). False si el FS no lo soporta."""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            ok = False
+        else:
+            ok = True
+    if not ok:
+        os.unlink(dst)
+    else:
+        shutil.copystat(src, dst)
+    return ok
+
+
+def _allocated_bytes(path: str) -> int:
+    return os.stat(path).st_blocks * 512
+
+
+def _mark_in_progress(marker: str) -> None:
+    """Marca un AVD como en creación (el GC no lo toca mientras viva este proceso)."""
+    with open(marker, "w") as f:
+        f.write(str(os.getpid()))
+
+
+def _clear_in_progress(marker: str) -> None:
+    try:
+        os.remove(marker)
+    except FileNotFoundError:
+        pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def in_progress(marker: str) -> bool:
+    """True si el marcador existe y el proceso que lo escribió sigue vivo."""
+    try:
+        with open(marker, "r") as f:
+            pid = int(f.read().strip())
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError):
+        return True  # recién creado y aún vacío
+    # Si el proceso murió a mitad, el GC puede recuperarlo
+    return _pid_alive(pid)
+
 
 class EmulatorCloner:
     # Datos estáticos
@@ -13,6 +95,56 @@ class EmulatorCloner:
     BASE_NAME = 'Nexus_5_API_31'
     BASE_AVD = os.path.join(AVD_DIR, BASE_NAME + '.avd')
     BASE_INI = os.path.join(AVD_DIR, BASE_NAME + '.ini')
+    # auto: reflink -> hardlink + overlays qcow2 -> copia completa | copy: siempre copytree
+    CLONE_MODE = os.getenv("AVD_CLONE_MODE", "auto")
+    # Clonados simultáneos en un lote (limitado por el ancho de banda del disco)
+    IO_CONCURRENCY = int(os.getenv("EMU_CLONE_IO_CONCURRENCY", "2"))
+
+    # Perfiles de hardware aplicados al config.ini del clon (AVD_HW_PROFILE o parámetro).
+    # disk.dataPartition.size solo puede crecer respecto a la imagen de la base.
+    HW_PROFILES: Dict[str, Dict[str, str]] = {
+        # Mínimo viable: más emuladores por host
+        "lean": {
+            "hw.ramSize": "1536",
+            "vm.heapSize": "128",
+            "hw.cpu.ncore": "2",
+            "disk.dataPartition.size": "4G",
+            "hw.gpu.mode": "swiftshader_indirect",
+            "fastboot.forceColdBoot": "yes",
+        },
+        "balanced": {
+            "hw.ramSize": "2048",
+            "vm.heapSize": "256",
+            "hw.cpu.ncore": "2",
+            "disk.dataPartition.size": "6G",
+            "hw.gpu.mode": "swiftshader_indirect",
+            "fastboot.forceColdBoot": "no",
+        },
+        # Host con GPU: más fluido, menos densidad
+        "performance": {
+            "hw.ramSize": "3072",
+            "vm.heapSize": "512",
+            "hw.cpu.ncore": "4",
+            "disk.dataPartition.size": "6G",
+            "hw.gpu.mode": "host",
+            "fastboot.forceColdBoot": "no",
+        },
+    }
+    HW_PROFILE = os.getenv("AVD_HW_PROFILE") or None
+    # Imágenes escribibles sin overlay propio en la base: se les crea un overlay qcow2
+    WRITABLE_IMAGES = ("userdata-qemu.img", "cache.img", "sdcard.img")
+    # Copia congelada (solo lectura) de las imágenes de la base: `<BASE>.frozen-<hash>`
+    FROZEN_PREFIX = BASE_NAME + '.frozen-'
+    # Fichero vacío de cada copia congelada que sus clones enlazan por hardlink: st_nlink - 1
+    # es el número de clones que aún dependen de ella
+    FROZEN_REF = '.frozen-base.ref'
+    _frozen_lock = threading.Lock()
+
+    # Informe del último clonado por nombre de clon
+    _reports: Dict[str, Dict[str, Any]] = {}
+
+    # Índice compartido del directorio de AVDs (cloner, planificador de capacidad, API)
+    catalog = AvdCatalog(AVD_DIR, BASE_NAME)
 
     @staticmethod
     async def verify_base_files() -> None:
@@ -43,18 +175,8 @@ class EmulatorCloner:
         
         :return: Lista de números de clones existentes (e.g., [1, 2, 3]).
         """
-        clones = []
-        pattern = re.compile(rf"{re.escape(EmulatorCloner.BASE_NAME)}_Clone(\d+)\.avd")
-        files = await EmulatorCloner.list_avd_files()
-        for item in files:
-            item_path = os.path.join(EmulatorCloner.AVD_DIR, item)
-            loop = asyncio.get_event_loop()
-            is_dir = await loop.run_in_executor(None, os.path.isdir, item_path)
-            if is_dir:
-                match = pattern.match(item)
-                if match:
-                    clones.append(int(match.group(1)))
-        return sorted(clones)
+        loop = asyncio.get_event_loop()
+        return sorted(await loop.run_in_executor(None, EmulatorCloner.catalog.clone_nums))
     
     @staticmethod
     async def get_next_clone_num() -> int:
@@ -67,35 +189,311 @@ class EmulatorCloner:
         if not existing:
             return 1
         return max(existing) + 1
-    
+
+    @staticmethod
+    def _reserve_clone_nums_sync(count: int, start: int) -> List[int]:
+        reserved: List[int] = []
+        num = start
+        while len(reserved) < count:
+            path = os.path.join(EmulatorCloner.AVD_DIR, f"{EmulatorCloner.BASE_NAME}_Clone{num}.avd")
+            try:
+                os.mkdir(path)  # atómico: solo un llamador puede crear el directorio
+            except FileExistsError:
+                num += 1
+                continue
+            _mark_in_progress(EmulatorCloner.progress_marker(f"{EmulatorCloner.BASE_NAME}_Clone{num}"))
+            reserved.append(num)
+            num += 1
+        return reserved
+
+    @staticmethod
+    def progress_marker(name: str) -> str:
+        """Marcador `<name>.cloning` junto al .avd mientras el clon está reservado o copiándose."""
+        return os.path.join(EmulatorCloner.AVD_DIR, name + '.cloning')
+
+    @staticmethod
+    def is_cloning(name: str) -> bool:
+        return in_progress(EmulatorCloner.progress_marker(name))
+
     @staticmethod
-    async def clone_emulator() -> str:
+    async def reserve_clone_nums(count: int = 1) -> List[int]:
         """
-        Realiza la clonación del emulador de forma asíncrona:
-        - Copia el directorio .avd base al nuevo nombre.
-        - Copia el archivo .ini base al nuevo nombre.
-        - Modifica el archivo .ini clonado actualizando 'path' y 'path.rel'.
-        
-        :return: Nombre del nuevo clone (e.g., 'Pixel4_API31_PlayStore_Clone4').
+        Reserva `count` números de clone creando (mkdir atómico) su directorio .avd vacío.
+        Llamadas concurrentes (varios endpoints o procesos) nunca obtienen el mismo número.
         """
-        await EmulatorCloner.verify_base_files()
-        
-        num = await EmulatorCloner.get_next_clone_num()
-        new_name = f"{EmulatorCloner.BASE_NAME}_Clone{num}"
-        new_avd = os.path.join(EmulatorCloner.AVD_DIR, new_name + '.avd')
-        new_ini = os.path.join(EmulatorCloner.AVD_DIR, new_name + '.ini')
-        
-        # Copia el directorio .avd
+        start = await EmulatorCloner.get_next_clone_num()
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, shutil.copytree, EmulatorCloner.BASE_AVD, new_avd)
-        
-        # Copia el archivo .ini
-        await loop.run_in_executor(None, shutil.copy, EmulatorCloner.BASE_INI, new_ini)
-        
-        # Modifica el archivo .ini
-        async with aiofiles.open(new_ini, 'r') as f:
-            lines = await f.readlines()
-        
+        return await loop.run_in_executor(None, EmulatorCloner._reserve_clone_nums_sync, count, start)
+    
+    @staticmethod
+    def _backing_file(qemu_img: str, path: str) -> Optional[str]:
+        out = subprocess.run([qemu_img, "info", "--output=json", path], check=True, capture_output=True, text=True)
+        info = json.loads(out.stdout)
+        backing = info.get("full-backing-filename") or info.get("backing-filename")
+        return os.path.realpath(os.path.join(os.path.dirname(path), backing)) if backing else None
+
+    @staticmethod
+    def _rebase_into(qemu_img: str, path: str, src_dir: str, dst_dir: str) -> None:
+        """Si el overlay `path` depende de un fichero de `src_dir`, lo apunta al mismo nombre en `dst_dir`."""
+        backing = EmulatorCloner._backing_file(qemu_img, path)
+        if backing and os.path.dirname(backing) == os.path.realpath(src_dir):
+            fmt = "qcow2" if backing.endswith(".qcow2") else "raw"
+            subprocess.run(
+                [qemu_img, "rebase", "-u", "-F", fmt, "-b", os.path.join(dst_dir, os.path.basename(backing)), path],
+                check=True, capture_output=True
+            )
+
+    @staticmethod
+    def _frozen_images(entries: List[str]) -> List[str]:
+        """Imágenes de la base que los clones enlazados comparten: overlays, sus backings y las escribibles."""
+        overlays = {e[:-len(".qcow2")] for e in entries if e.endswith(".qcow2")}
+        return [e for e in entries
+                if e.endswith(".qcow2") or e in overlays or e in EmulatorCloner.WRITABLE_IMAGES]
+
+    @staticmethod
+    def _frozen_path() -> str:
+        """Ruta de la copia congelada de la versión actual de la base (hash de tamaños y mtimes)."""
+        base = EmulatorCloner.BASE_AVD
+        h = hashlib.sha1()
+        for name in EmulatorCloner._frozen_images(sorted(os.listdir(base))):
+            st = os.stat(os.path.join(base, name))
+            h.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode())
+        return os.path.join(EmulatorCloner.AVD_DIR, EmulatorCloner.FROZEN_PREFIX + h.hexdigest()[:12])
+
+    @staticmethod
+    def _frozen_base(qemu_img: str, dst: str) -> str:
+        """
+        Copia de solo lectura de las imágenes de la base, una por versión de la base. Los
+        clones enlazados solo comparten estos ficheros: arrancar la base (que escribe en sus
+        propios overlays) no les afecta. El clon `dst` queda registrado enlazando FROZEN_REF;
+        las versiones antiguas se borran cuando ya no las enlaza ningún clon (`prune_frozen`).
+        """
+        base = EmulatorCloner.BASE_AVD
+        images = EmulatorCloner._frozen_images(sorted(os.listdir(base)))
+        frozen = EmulatorCloner._frozen_path()
+        with EmulatorCloner._frozen_lock:
+            if not os.path.isdir(frozen):
+                EmulatorCloner._build_frozen(qemu_img, base, images, frozen)
+                created = True
+            else:
+                created = False
+            # Registrar el clon dentro del lock: prune_frozen no puede borrarla entre medias
+            os.link(os.path.join(frozen, EmulatorCloner.FROZEN_REF), os.path.join(dst, EmulatorCloner.FROZEN_REF))
+        if created:
+            EmulatorCloner.prune_frozen()
+        return frozen
+
+    @staticmethod
+    def _build_frozen(qemu_img: str, base: str, images: List[str], frozen: str) -> None:
+        tmp = f"{frozen}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.mkdir(tmp)
+        try:
+            for name in images:
+                s_path, d_path = os.path.join(base, name), os.path.join(tmp, name)
+                if name.endswith(".qcow2"):
+                    shutil.copy2(s_path, d_path)
+                    EmulatorCloner._rebase_into(qemu_img, d_path, base, frozen)
+                elif not _reflink(s_path, d_path):
+                    # convert conserva los huecos de las imágenes dispersas
+                    subprocess.run([qemu_img, "convert", "-f", "raw", "-O", "raw", s_path, d_path],
+                                   check=True, capture_output=True)
+                os.chmod(d_path, 0o444)
+            ref = os.path.join(tmp, EmulatorCloner.FROZEN_REF)
+            open(ref, "w").close()
+            os.chmod(ref, 0o444)
+            try:
+                os.rename(tmp, frozen)
+            except OSError:
+                if not os.path.isdir(frozen):
+                    raise
+                shutil.rmtree(tmp, ignore_errors=True)  # otro proceso la creó antes
+                return
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        print(f"[EmulatorCloner] Copia congelada de la base creada: {frozen}")
+
+    @staticmethod
+    def _frozen_clones(path: str) -> int:
+        """Clones que dependen de una copia congelada (las anteriores a FROZEN_REF: por hardlinks)."""
+        try:
+            return os.stat(os.path.join(path, EmulatorCloner.FROZEN_REF)).st_nlink - 1
+        except FileNotFoundError:
+            pass
+        with os.scandir(path) as it:
+            return max((de.stat().st_nlink - 1 for de in it if de.is_file(follow_symlinks=False)), default=0)
+
+    @staticmethod
+    def frozen_copies() -> List[Dict[str, Any]]:
+        """Copias congeladas en disco: nombre, clones que dependen de ella y si es la versión actual."""
+        try:
+            current = os.path.basename(EmulatorCloner._frozen_path())
+        except OSError:
+            current = None
+        out = []
+        for name in sorted(os.listdir(EmulatorCloner.AVD_DIR)):
+            path = os.path.join(EmulatorCloner.AVD_DIR, name)
+            if not name.startswith(EmulatorCloner.FROZEN_PREFIX) or not os.path.isdir(path):
+                continue
+            tmp_pid = name.rpartition(".tmp")[2] if ".tmp" in name else None
+            try:
+                clones = EmulatorCloner._frozen_clones(path)
+            except OSError:
+                continue
+            out.append({
+                "name": name,
+                "path": path,
+                "clones": clones,
+                "current": name == current,
+                # Copia a medias de un proceso que murió
+                "stale_tmp": bool(tmp_pid) and tmp_pid.isdigit() and not _pid_alive(int(tmp_pid)),
+                "building": bool(tmp_pid) and tmp_pid.isdigit() and _pid_alive(int(tmp_pid)),
+            })
+        return out
+
+    @staticmethod
+    def prune_frozen(dry_run: bool = False) -> List[Dict[str, Any]]:
+        """
+        Borra las copias congeladas que ya no enlaza ningún clon (salvo la de la versión
+        actual de la base, que reutilizará el próximo clon) y las copias a medias de procesos
+        muertos. Devuelve las copias borradas (o que se borrarían con `dry_run`) con sus bytes.
+        """
+        removed = []
+        with EmulatorCloner._frozen_lock:
+            for f in EmulatorCloner.frozen_copies():
+                if f["building"]:
+                    continue
+                if f["stale_tmp"] or (f["clones"] == 0 and not f["current"]):
+                    f["bytes"] = sum(_allocated_bytes(os.path.join(root, n))
+                                     for root, _dirs, names in os.walk(f["path"]) for n in names)
+                    if not dry_run:
+                        shutil.rmtree(f["path"], ignore_errors=True)
+                        print(f"[EmulatorCloner] Copia congelada sin clones borrada: {f['name']}")
+                    removed.append(f)
+        return removed
+
+    @staticmethod
+    def is_linked_clone(avd_name: str) -> bool:
+        """True si el AVD comparte ficheros por hardlink (p.ej. con la copia congelada de la base)."""
+        avd = os.path.join(EmulatorCloner.AVD_DIR, avd_name + '.avd')
+        try:
+            with os.scandir(avd) as it:
+                return any(de.is_file(follow_symlinks=False) and de.stat().st_nlink > 1 for de in it)
+        except OSError:
+            return False
+
+    @staticmethod
+    def _copy_tree_cow(src: str, dst: str, report: Dict[str, Any]) -> None:
+        """
+        Clona `src` en `dst` sin duplicar datos cuando es posible:
+        1. reflink (FICLONE) de todos los ficheros si el sistema de ficheros lo soporta (los
+           overlays que apuntaban a la base pasan a apuntar a la copia del clon);
+        2. si no, sobre la copia congelada de la base (`_frozen_base`): sus imágenes raw por
+           hardlink (son de solo lectura), overlays qcow2 nuevos encadenados a sus qcow2 y
+           copia del resto. Nada escribible se comparte. Los snapshots no se clonan en este
+           modo (su estado de disco vive dentro de los qcow2 de la base); el clon arranca en
+           frío y no admite `-wipe-data` (ver `is_linked_clone`).
+        3. sin qemu-img, copia completa.
+        """
+        files = report["files"]
+        qemu_img = _find_qemu_img()
+        use_reflink: Optional[bool] = None
+        entries = sorted(os.listdir(src))
+        overlays = {e[:-len(".qcow2")] for e in entries if e.endswith(".qcow2")}
+        frozen: Optional[str] = None
+        os.makedirs(dst, exist_ok=True)
+
+        for root, dirs, names in os.walk(src):
+            rel = os.path.relpath(root, src)
+            out_dir = dst if rel == "." else os.path.join(dst, rel)
+            os.makedirs(out_dir, exist_ok=True)
+            for name in names:
+                if name.endswith(".lock"):
+                    continue
+                s_path = os.path.join(root, name)
+                d_path = os.path.join(out_dir, name)
+                report["source_bytes"] += os.path.getsize(s_path)
+
+                top = rel == "."
+                if use_reflink is None:
+                    use_reflink = _reflink(s_path, d_path)
+                    if not use_reflink and qemu_img:
+                        frozen = EmulatorCloner._frozen_base(qemu_img, dst)
+                        report["frozen_base"] = os.path.basename(frozen)
+                if use_reflink and (os.path.exists(d_path) or _reflink(s_path, d_path)):
+                    files["reflink"] += 1
+                    if top and name.endswith(".qcow2") and qemu_img:
+                        EmulatorCloner._rebase_into(qemu_img, d_path, src, dst)
+                    continue
+
+                if top and frozen and name.endswith(".qcow2"):
+                    # Overlay nuevo sobre el qcow2 congelado (conserva el estado de la base)
+                    subprocess.run(
+                        [qemu_img, "create", "-q", "-f", "qcow2", "-F", "qcow2",
+                         "-b", os.path.join(frozen, name), d_path],
+                        check=True, capture_output=True
+                    )
+                    files["overlay"] += 1
+                    report["written_bytes"] += _allocated_bytes(d_path)
+                elif top and frozen and (name in overlays or name in EmulatorCloner.WRITABLE_IMAGES):
+                    frozen_path = os.path.join(frozen, name)
+                    os.link(frozen_path, d_path)
+                    files["hardlink"] += 1
+                    if name not in overlays:
+                        overlay = d_path + ".qcow2"
+                        subprocess.run(
+                            [qemu_img, "create", "-q", "-f", "qcow2", "-F", "raw", "-b", frozen_path, overlay],
+                            check=True, capture_output=True
+                        )
+                        files["overlay"] += 1
+                        report["written_bytes"] += _allocated_bytes(overlay)
+                else:
+                    shutil.copy2(s_path, d_path)
+                    files["copy"] += 1
+                    report["written_bytes"] += _allocated_bytes(d_path)
+            if not use_reflink and rel == ".":
+                dirs[:] = [d for d in dirs if d != "snapshots"]
+
+        report["mode"] = "reflink" if use_reflink else ("overlay" if qemu_img else "copy")
+
+    @staticmethod
+    def _copy_tree(src: str, dst: str, mode: str) -> Dict[str, Any]:
+        """Clona el directorio .avd y devuelve el informe (modo, bytes, ficheros por método)."""
+        report: Dict[str, Any] = {
+            "mode": "copy",
+            "source_bytes": 0,
+            "written_bytes": 0,
+            "files": {"reflink": 0, "hardlink": 0, "overlay": 0, "copy": 0},
+        }
+        if mode == "copy":
+            shutil.copytree(src, dst, dirs_exist_ok=True)
+            qemu_img = _find_qemu_img()
+            if qemu_img:
+                # Los overlays copiados siguen apuntando a la base: que usen las copias del clon
+                for name in os.listdir(dst):
+                    if name.endswith(".qcow2"):
+                        EmulatorCloner._rebase_into(qemu_img, os.path.join(dst, name), src, dst)
+            for root, _dirs, names in os.walk(dst):
+                for name in names:
+                    path = os.path.join(root, name)
+                    report["source_bytes"] += os.path.getsize(path)
+                    report["written_bytes"] += _allocated_bytes(path)
+                    report["files"]["copy"] += 1
+            return report
+        try:
+            EmulatorCloner._copy_tree_cow(src, dst, report)
+        except (OSError, subprocess.CalledProcessError) as e:
+            # Sin soporte (p.ej. hardlink entre dispositivos): copia completa
+            print(f"[EmulatorCloner] Clonado COW no disponible ({e}); copia completa.")
+            shutil.rmtree(dst, ignore_errors=True)
+            os.mkdir(dst)  # conservar la reserva del número
+            return EmulatorCloner._copy_tree(src, dst, "copy")
+        return report
+
+    @staticmethod
+    def render_ini(lines: List[str], new_name: str) -> List[str]:
+        """Líneas de un .ini de AVD con 'path' y 'path.rel' apuntando a `<new_name>.avd`."""
         new_lines = []
         for line in lines:
             if line.startswith('path='):
@@ -104,8 +502,180 @@ class EmulatorCloner:
                 new_lines.append(f"path.rel=avd/{new_name}.avd\n")
             else:
                 new_lines.append(line)
-        
+        return new_lines
+
+    @staticmethod
+    async def _write_clone_ini(new_name: str) -> str:
+        """
+        Copia el .ini base como `<new_name>.ini` actualizando 'path' y 'path.rel'.
+        """
+        new_ini = os.path.join(EmulatorCloner.AVD_DIR, new_name + '.ini')
+        async with aiofiles.open(EmulatorCloner.BASE_INI, 'r') as f:
+            lines = await f.readlines()
+
         async with aiofiles.open(new_ini, 'w') as f:
-            await f.writelines(new_lines)
-        
-        return new_name
\ No newline at end of file
+            await f.writelines(EmulatorCloner.render_ini(lines, new_name))
+        return new_ini
+
+    @staticmethod
+    def apply_hw_profile(avd_name: str, profile: str) -> Dict[str, str]:
+        """
+        Escribe las claves del perfil en `<avd_name>.avd/config.ini` (sustituye las existentes
+        y añade las que falten, conservando el resto). Devuelve las claves aplicadas.
+        """
+        if profile not in EmulatorCloner.HW_PROFILES:
+            raise ValueError(f"Perfil de hardware desconocido: {profile}. Opciones: {sorted(EmulatorCloner.HW_PROFILES)}")
+        values = EmulatorCloner.HW_PROFILES[profile]
+        config = os.path.join(EmulatorCloner.AVD_DIR, avd_name + '.avd', 'config.ini')
+        if not os.path.isfile(config):
+            raise FileNotFoundError(f"No existe {config}")
+
+        with open(config, 'r') as f:
+            lines = f.readlines()
+        pending = dict(values)
+        new_lines = []
+        for line in lines:
+            key = line.split('=', 1)[0].strip()
+            if key in pending:
+                new_lines.append(f"{key}={pending.pop(key)}\n")
+            else:
+                new_lines.append(line)
+        if new_lines and not new_lines[-1].endswith('\n'):
+            new_lines[-1] += '\n'
+        new_lines += [f"{k}={v}\n" for k, v in pending.items()]
+
+        # Escritura atómica: en modo reflink/hardlink nunca tocar el inodo de la base
+        tmp = config + '.tmp'
+        with open(tmp, 'w') as f:
+            f.writelines(new_lines)
+        os.replace(tmp, config)
+        print(f"[EmulatorCloner] Perfil de hardware '{profile}' aplicado a {avd_name}.")
+        return dict(values)
+
+    @staticmethod
+    async def clone_emulator(mode: Optional[str] = None, hw_profile: Optional[str] = None) -> str:
+        """
+        Realiza la clonación del emulador de forma asíncrona:
+        - Clona el directorio .avd base al nuevo nombre (copy-on-write si es posible,
+          ver `_copy_tree_cow`; `mode="copy"` fuerza la copia completa).
+        - Crea el archivo .ini del clon actualizando 'path' y 'path.rel'.
+        - Aplica el perfil de hardware `hw_profile` (o AVD_HW_PROFILE) a su config.ini.
+        El informe (modo, tamaño y tiempo) queda disponible en `clone_report(nombre)`.
+
+        :return: Nombre del nuevo clone (e.g., 'Pixel4_API31_PlayStore_Clone4').
+        """
+        await EmulatorCloner.verify_base_files()
+
+        num = (await EmulatorCloner.reserve_clone_nums(1))[0]
+        return await EmulatorCloner._clone_into(num, mode, hw_profile)
+
+    @staticmethod
+    async def _clone_into(num: int, mode: Optional[str] = None, hw_profile: Optional[str] = None) -> str:
+        """Clona la base en el número ya reservado; si falla o se cancela, libera la reserva."""
+        new_name = f"{EmulatorCloner.BASE_NAME}_Clone{num}"
+        new_avd = os.path.join(EmulatorCloner.AVD_DIR, new_name + '.avd')
+
+        t0 = time.monotonic()
+        loop = asyncio.get_event_loop()
+        copy = None
+        try:
+            copy = loop.run_in_executor(
+                None, EmulatorCloner._copy_tree, EmulatorCloner.BASE_AVD, new_avd, mode or EmulatorCloner.CLONE_MODE
+            )
+            report = await asyncio.shield(copy)
+            await EmulatorCloner._write_clone_ini(new_name)
+            hw_profile = hw_profile or EmulatorCloner.HW_PROFILE
+            if hw_profile:
+                await loop.run_in_executor(None, EmulatorCloner.apply_hw_profile, new_name, hw_profile)
+                report["hw_profile"] = hw_profile
+        except BaseException:
+            # También ante CancelledError (p.ej. clone_batch abandonado): sin directorios a medias.
+            # La cancelación no para el hilo que copia; se espera a que termine antes de borrar.
+            if copy is not None and not copy.done():
+                await asyncio.wait([copy])
+            await loop.run_in_executor(None, EmulatorCloner._discard_clone, new_name)
+            raise
+
+        _clear_in_progress(EmulatorCloner.progress_marker(new_name))
+        report.update({"avd_name": new_name, "seconds": round(time.monotonic() - t0, 2)})
+        EmulatorCloner._reports[new_name] = report
+        print(
+            f"[EmulatorCloner] {new_name} clonado ({report['mode']}) en {report['seconds']}s: "
+            f"{report['written_bytes'] / 2**20:.0f} MiB escritos de {report['source_bytes'] / 2**20:.0f} MiB."
+        )
+        return new_name
+
+    @staticmethod
+    def _discard_clone(name: str) -> None:
+        """
+        Borra el directorio .avd y el .ini de un clon (libera su número) y las copias
+        congeladas de la base que dejan de tener clones.
+        """
+        avd = os.path.join(EmulatorCloner.AVD_DIR, name + '.avd')
+        linked = os.path.exists(os.path.join(avd, EmulatorCloner.FROZEN_REF))
+        shutil.rmtree(avd, ignore_errors=True)
+        ini = os.path.join(EmulatorCloner.AVD_DIR, name + '.ini')
+        if os.path.exists(ini):
+            os.remove(ini)
+        _clear_in_progress(EmulatorCloner.progress_marker(name))
+        if linked:
+            EmulatorCloner.prune_frozen()
+
+    @staticmethod
+    async def clone_batch(count: int, mode: Optional[str] = None, concurrency: Optional[int] = None,
+                          hw_profile: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Clona `count` AVDs en paralelo (como mucho `concurrency` copias a la vez) y va
+        emitiendo eventos de progreso:
+            {"event": "reserved", "avd_names": [...]}
+            {"event": "started",  "avd_name": ...}
+            {"event": "finished", "avd_name": ..., "report": {...}}
+            {"event": "error",    "avd_name": ..., "error": "..."}
+        Los números se reservan todos al principio, así que no chocan con otros clonados.
+        """
+        await EmulatorCloner.verify_base_files()
+        if hw_profile and hw_profile not in EmulatorCloner.HW_PROFILES:
+            raise ValueError(f"Perfil de hardware desconocido: {hw_profile}")
+        nums = await EmulatorCloner.reserve_clone_nums(count)
+        names = [f"{EmulatorCloner.BASE_NAME}_Clone{n}" for n in nums]
+        yield {"event": "reserved", "avd_names": names}
+
+        sem = asyncio.Semaphore(max(1, concurrency or EmulatorCloner.IO_CONCURRENCY))
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def _one(num: int, name: str) -> None:
+            try:
+                await sem.acquire()
+            except BaseException:
+                # Cancelado esperando turno: la reserva no llegó a usarse
+                await asyncio.get_event_loop().run_in_executor(None, EmulatorCloner._discard_clone, name)
+                raise
+            try:
+                await events.put({"event": "started", "avd_name": name})
+                try:
+                    await EmulatorCloner._clone_into(num, mode, hw_profile)
+                    await events.put({"event": "finished", "avd_name": name,
+                                      "report": EmulatorCloner.clone_report(name)})
+                except Exception as e:
+                    await events.put({"event": "error", "avd_name": name, "error": str(e)})
+            finally:
+                sem.release()
+
+        tasks = [asyncio.ensure_future(_one(n, name)) for n, name in zip(nums, names)]
+        try:
+            pending = len(tasks)
+            while pending:
+                event = await events.get()
+                if event["event"] in ("finished", "error"):
+                    pending -= 1
+                yield event
+        finally:
+            # Si se abandona el lote, los clones en curso se cancelan y limpian su reserva
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    def clone_report(name: str) -> Optional[Dict[str, Any]]:
+        """Informe del clonado de `name` (None si no se clonó en este proceso)."""
+        return EmulatorCloner._reports.get(name)
\ No newline at end of file
@@ -0,0 +1,75 @@
+# utils/recording_policy.py
+"""
+Política de grabación por usuario (RECORDING_POLICY):
+- always: se graba y se guarda cada ejecución (comportamiento anterior).
+- failure-only: el dispositivo graba segmentos cortos rodantes (solo los K últimos) y
+  únicamente si el flujo falla se copian y se concatenan; si va bien se descartan.
+- sampled: se graba y se guarda una fracción RECORDING_SAMPLE_RATE de los usuarios.
+"""
+import os
+import random
+import asyncio
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from adb.screen_recorder import AdbScreenRecorder
+from utils.screen_recording import OUT_DIR, async_start, async_stop
+
+RECORDING_POLICY = os.getenv("RECORDING_POLICY", "always").strip().lower()
+RECORDING_SAMPLE_RATE = float(os.getenv("RECORDING_SAMPLE_RATE", "0.1"))
+RECORDING_SEGMENT_SECONDS = int(os.getenv("RECORDING_SEGMENT_SECONDS", "30"))
+RECORDING_KEEP_SEGMENTS = int(os.getenv("RECORDING_KEEP_SEGMENTS", "4"))
+POLICIES = ("always", "failure-only", "sampled")
+
+
+class UserRecording:
+    """
+    Grabación de un usuario según la política:
+
+        rec = UserRecording(udid, f"{udid}_{user}_{ts}", start_opts={"timeLimit": "120"})
+        await rec.start()
+        ...
+        video = await rec.finish(failed=True)  # Path o None
+    """
+
+    def __init__(self, serial: str, name: str, policy: Optional[str] = None,
+                 start_opts: Optional[Dict[str, Any]] = None, out_dir: Optional[Path] = None):
+        self.serial = serial
+        self.name = name
+        self.policy = (policy or RECORDING_POLICY).lower()
+        if self.policy not in POLICIES:
+            raise ValueError(f"Política de grabación desconocida: {self.policy}. Opciones: {POLICIES}")
+        self.start_opts = start_opts
+        self.out_dir = Path(out_dir or OUT_DIR)
+        self._mode: Optional[str] = None  # "full" | "rolling" | None (sin grabar)
+        self._rolling: Optional[AdbScreenRecorder] = None
+
+    async def start(self) -> None:
+        if self.policy == "failure-only":
+            self._rolling = AdbScreenRecorder(self.serial, self.name, segment_seconds=RECORDING_SEGMENT_SECONDS,
+                                              keep=RECORDING_KEEP_SEGMENTS)
+            await asyncio.to_thread(self._rolling.start)
+            self._mode = "rolling"
+        elif self.policy == "always" or random.random() < RECORDING_SAMPLE_RATE:
+            await async_start(self.start_opts, serial=self.serial)
+            self._mode = "full"
+
+    async def finish(self, failed: bool) -> Optional[Path]:
+        """Para la grabación y devuelve el vídeo guardado (None si no se guarda nada)."""
+        mode, self._mode = self._mode, None
+        if mode == "full":
+            return await async_stop(self.name, self.out_dir, serial=self.serial)
+        if mode != "rolling":
+            return None
+        rec, self._rolling = self._rolling, None
+        try:
+            await asyncio.to_thread(rec.stop)
+            if not failed:
+                return None
+            files = await asyncio.to_thread(rec.pull, self.out_dir / f"{self.name}.mp4")
+            if files:
+                print(f"[ScreenRecording] fallo: últimos segmentos guardados en {files[0]}"
+                      + (f" (+{len(files) - 1})" if len(files) > 1 else ""))
+            return files[0] if files else None
+        finally:
+            await asyncio.to_thread(rec.discard)
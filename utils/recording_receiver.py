@@ -0,0 +1,245 @@
+# utils/recording_receiver.py
+"""
+Receptor HTTP local para las grabaciones que Appium sube con `remotePath`: en lugar de
+devolver el MP4 entero en base64 dentro del JSON, Appium hace un PUT con el fichero y
+aquí se vuelca a disco por bloques (memoria acotada). Appium sube el fichero como
+multipart/form-data (campo `file`): solo esa parte llega al MP4. Se arranca bajo demanda,
+uno por proceso, en un puerto libre de RECORDING_RECEIVER_HOST.
+"""
+import os
+import uuid
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Optional, Dict, Iterator
+
+RECORDING_RECEIVER_HOST = os.getenv("RECORDING_RECEIVER_HOST", "127.0.0.1")
+RECORDING_RECEIVER_PORT = int(os.getenv("RECORDING_RECEIVER_PORT", "0"))  # 0 = puerto libre
+_BLOCK = 1 << 20
+_MAX_PART_HEADERS = 64 * 1024
+
+
+class _Upload:
+    """Subida esperada: destino, evento de fin y error si lo hubo."""
+
+    def __init__(self, dest: Path):
+        self.dest = dest
+        self.done = threading.Event()
+        self.error: Optional[str] = None
+        self.size = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_ReceiverServer"
+
+    def log_message(self, fmt, *args) -> None:  # sin log por petición
+        pass
+
+    def _iter_body(self) -> Iterator[bytes]:
+        """Cuerpo de la petición (Content-Length o chunked) por bloques."""
+        if "chunked" in (self.headers.get("Transfer-Encoding") or "").lower():
+            while True:
+                size = int(self.rfile.readline().split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass  # trailers
+                    return
+                remaining = size
+                while remaining:
+                    block = self.rfile.read(min(_BLOCK, remaining))
+                    if not block:
+                        raise ConnectionError("Subida interrumpida.")
+                    yield block
+                    remaining -= len(block)
+                self.rfile.readline()  # CRLF tras cada trozo
+        remaining = int(self.headers.get("Content-Length") or 0)
+        while remaining:
+            block = self.rfile.read(min(_BLOCK, remaining))
+            if not block:
+                raise ConnectionError("Subida interrumpida.")
+            yield block
+            remaining -= len(block)
+
+    def _read_body(self, out) -> int:
+        """Copia el cuerpo tal cual en `out`."""
+        written = 0
+        for block in self._iter_body():
+            out.write(block)
+            written += len(block)
+        return written
+
+    def _read_multipart(self, boundary: bytes, out) -> int:
+        """
+        Copia en `out` solo la parte de fichero (la primera con `filename=` o `name="file"`)
+        de un multipart/form-data, sin cargar el cuerpo en memoria: se guarda como mucho
+        un bloque más la longitud del delimitador.
+        """
+        delim = b"\r\n--" + boundary
+        keep = len(delim) - 1
+        chunks = self._iter_body()
+        buf = b"\r\n"  # el primer delimitador no lleva CRLF delante
+        written = 0
+        found = False
+
+        def fill() -> bool:
+            nonlocal buf
+            block = next(chunks, b"")
+            buf += block
+            return bool(block)
+
+        # Preámbulo hasta el primer delimitador
+        while (i := buf.find(delim)) < 0:
+            buf = buf[-keep:]
+            if not fill():
+                raise ValueError("Multipart sin delimitador inicial.")
+        buf = buf[i + len(delim):]
+        while True:
+            while len(buf) < 2 and fill():
+                pass
+            if buf.startswith(b"--"):
+                break  # delimitador de cierre
+            while (j := buf.find(b"\r\n\r\n")) < 0:
+                if len(buf) > _MAX_PART_HEADERS:
+                    raise ValueError("Cabeceras de parte multipart demasiado largas.")
+                if not fill():
+                    raise ValueError("Multipart truncado.")
+            headers = buf[:j].decode("latin-1").lower()
+            buf = buf[j + 4:]
+            is_file = not found and ("filename=" in headers or 'name="file"' in headers)
+            while (i := buf.find(delim)) < 0:
+                if len(buf) > keep:
+                    if is_file:
+                        out.write(buf[:-keep])
+                        written += len(buf) - keep
+                    buf = buf[-keep:]
+                if not fill():
+                    raise ValueError("Multipart truncado.")
+            if is_file:
+                out.write(buf[:i])
+                written += i
+                found = True
+            buf = buf[i + len(delim):]
+        for _ in chunks:
+            pass  # epílogo
+        if not found:
+            raise ValueError("El multipart no incluye ninguna parte de fichero.")
+        return written
+
+    def _multipart_boundary(self) -> Optional[bytes]:
+        """Boundary si el Content-Type es multipart/form-data, si no None."""
+        ctype, _, params = (self.headers.get("Content-Type") or "").partition(";")
+        if ctype.strip().lower() != "multipart/form-data":
+            return None
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "boundary" and value:
+                return value.strip('"').encode("latin-1")
+        raise ValueError("multipart/form-data sin boundary.")
+
+    def do_PUT(self) -> None:
+        token = self.path.rstrip("/").rsplit("/", 1)[-1]
+        upload = self.server.uploads.get(token)
+        if upload is None:
+            self.send_error(404, "Token de subida desconocido")
+            return
+        part = upload.dest.with_name(upload.dest.name + ".part")
+        try:
+            boundary = self._multipart_boundary()
+            with open(part, "wb") as f:
+                if boundary:
+                    upload.size = self._read_multipart(boundary, f)
+                else:
+                    upload.size = self._read_body(f)
+            os.replace(part, upload.dest)
+        except Exception as e:
+            upload.error = str(e)
+            part.unlink(missing_ok=True)
+            self.send_error(500, upload.error)
+        else:
+            self.send_response(201)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        finally:
+            upload.done.set()
+
+    do_POST = do_PUT
+
+
+class _ReceiverServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr):
+        super().__init__(addr, _Handler)
+        self.uploads: Dict[str, _Upload] = {}
+
+
+class RecordingReceiver:
+    """Receptor por proceso: `expect(dest)` da la URL a pasar como `remotePath`."""
+
+    def __init__(self, host: str = RECORDING_RECEIVER_HOST, port: int = RECORDING_RECEIVER_PORT):
+        self._server = _ReceiverServer((host, port))
+        self._thread = threading.Thread(target=self._server.serve_forever, name="recording-receiver", daemon=True)
+        self._thread.start()
+        self.host, self.port = self._server.server_address[:2]
+        print(f"[RecordingReceiver] Escuchando en http://{self.host}:{self.port}")
+
+    def expect(self, dest: Path) -> str:
+        """Registra una subida hacia `dest` y devuelve su URL."""
+        token = uuid.uuid4().hex
+        self._server.uploads[token] = _Upload(Path(dest))
+        return f"http://{self.host}:{self.port}/recordings/{token}"
+
+    def wait(self, url: str, timeout: float) -> Path:
+        """Espera a que termine la subida de `url` y devuelve el fichero escrito."""
+        token = url.rsplit("/", 1)[-1]
+        upload = self._server.uploads.get(token)
+        if upload is None:
+            raise KeyError(f"Subida no registrada: {url}")
+        try:
+            if not upload.done.wait(timeout):
+                raise TimeoutError(f"La grabación no llegó en {timeout:.0f}s.")
+            if upload.error:
+                raise RuntimeError(f"Error recibiendo la grabación: {upload.error}")
+            return upload.dest
+        finally:
+            self._server.uploads.pop(token, None)
+
+    def cancel(self, url: str) -> None:
+        """Olvida una subida que ya no llegará (p.ej. Appium falló antes de subir)."""
+        self._server.uploads.pop(url.rsplit("/", 1)[-1], None)
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# Un receptor por proceso, creado al primer uso
+_receiver: Optional[RecordingReceiver] = None
+_receiver_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # El hilo del servidor no sobrevive al fork: el hijo crea el suyo
+    global _receiver, _receiver_lock
+    _receiver = None
+    _receiver_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_receiver() -> RecordingReceiver:
+    global _receiver
+    with _receiver_lock:
+        if _receiver is None:
+            _receiver = RecordingReceiver()
+        return _receiver
+
+
+def stop_receiver() -> None:
+    global _receiver
+    with _receiver_lock:
+        receiver, _receiver = _receiver, None
+    if receiver is not None:
+        receiver.close()
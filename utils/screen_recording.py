@@ -2,17 +2,47 @@
 import os
 import base64
 import asyncio
+import threading
 from datetime import datetime
 from pathlib import Path
 from contextlib import asynccontextmanager
 from typing import Optional, Dict, Any
 
-from driver.driver_manager import get_driver
+from driver.driver_manager import get_driver, driver_serial
+from utils.recording_receiver import get_receiver
+from adb.screen_recorder import AdbScreenRecorder
 
 # Carpeta destino configurable por .env
 OUT_DIR = Path(os.getenv("SCREEN_RECORDINGS_PATH", "screenrecordings"))
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Cómo se obtiene el MP4 al parar:
+# - base64: en la respuesta de Appium (todo el vídeo en memoria, en Appium y aquí)
+# - upload: Appium lo sube por PUT (`remotePath`) al receptor local y llega a disco por bloques
+RECORDING_RETRIEVAL = os.getenv("RECORDING_RETRIEVAL", "base64").strip().lower()
+RECORDING_UPLOAD_TIMEOUT = float(os.getenv("RECORDING_UPLOAD_TIMEOUT", "120"))
+_B64_BLOCK = 4 * (1 << 20)  # múltiplo de 4: cada bloque se decodifica por separado
+
+# Quién graba:
+# - appium: start/stop_recording_screen del driver (límite timeLimit <= 180 s)
+# - adb: screenrecord en el dispositivo por una conexión ADB propia, encadenando segmentos
+#   de 180 s sin límite total; se copia con exec-out al parar
+RECORDING_BACKEND = os.getenv("RECORDING_BACKEND", "appium").strip().lower()
+
+# Grabaciones adb activas por serial (una por dispositivo en este proceso)
+_adb_recorders: Dict[str, AdbScreenRecorder] = {}
+_adb_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _adb_lock
+    _adb_recorders.clear()
+    _adb_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 
 def _timestamp() -> str:
     return datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -39,10 +69,48 @@ def _default_start_opts(platform_name: str) -> Dict[str, Any]:
         }
 
 
-def start_screen_recording(start_opts: Optional[Dict[str, Any]] = None) -> None:
+def _resolve_serial(serial: Optional[str]) -> str:
+    serial = serial or driver_serial(get_driver())
+    if not serial:
+        raise RuntimeError("Sin dispositivo para grabar pantalla (driver no inicializado y sin serial).")
+    return serial
+
+
+def _start_adb(serial: str, opts: Dict[str, Any]) -> None:
+    # timeLimit no aplica: los segmentos se encadenan hasta stop
+    recorder = AdbScreenRecorder(serial, "session", bit_rate=int(opts.get("bitRate", 4_000_000)),
+                                 size=opts.get("videoSize"))
+    with _adb_lock:
+        previous = _adb_recorders.pop(serial, None)
+        _adb_recorders[serial] = recorder
+    if previous is not None:
+        previous.stop()
+    recorder.start()
+
+
+def _stop_adb(serial: str, file_path: Path) -> Path:
+    with _adb_lock:
+        recorder = _adb_recorders.pop(serial, None)
+    if recorder is None:
+        raise RuntimeError(f"No hay grabación adb en curso en {serial}.")
+    try:
+        recorder.stop()
+        files = recorder.pull(file_path)
+    finally:
+        recorder.discard()
+    if not files:
+        raise RuntimeError(f"La grabación de {serial} no produjo vídeo.")
+    return files[0]
+
+
+def start_screen_recording(start_opts: Optional[Dict[str, Any]] = None, serial: Optional[str] = None) -> None:
     """
     Inicio sincrónico.
     """
+    if RECORDING_BACKEND == "adb":
+        _start_adb(_resolve_serial(serial), {**_default_start_opts("android"), **(start_opts or {})})
+        return
+
     driver = get_driver()
     if driver is None:
         raise RuntimeError("Driver no inicializado para grabar pantalla.")
@@ -57,21 +125,46 @@ def start_screen_recording(start_opts: Optional[Dict[str, Any]] = None) -> None:
     driver.start_recording_screen(**opts)
 
 
-def stop_screen_recording(filename: str, out_dir: Optional[Path] = None) -> Path:
+def _write_base64(b64: str, file_path: Path) -> None:
+    """Decodifica por bloques para no duplicar el vídeo entero en memoria."""
+    with open(file_path, "wb") as f:
+        for i in range(0, len(b64), _B64_BLOCK):
+            f.write(base64.b64decode(b64[i:i + _B64_BLOCK]))
+
+
+def _stop_with_upload(driver, file_path: Path) -> None:
+    receiver = get_receiver()
+    url = receiver.expect(file_path)
+    try:
+        # Appium sube multipart/form-data; el receptor extrae la parte `file`
+        driver.stop_recording_screen(remotePath=url, method="PUT", fileFieldName="file")
+    except Exception:
+        receiver.cancel(url)
+        raise
+    receiver.wait(url, RECORDING_UPLOAD_TIMEOUT)
+
+
+def stop_screen_recording(filename: str, out_dir: Optional[Path] = None, serial: Optional[str] = None) -> Path:
     """
-    Detiene la grabación y guarda el MP4.
+    Detiene la grabación y guarda el MP4 (según RECORDING_BACKEND y RECORDING_RETRIEVAL).
     """
-    driver = get_driver()
-    if driver is None:
-        raise RuntimeError("Driver no inicializado para grabar pantalla.")
-
-    b64 = driver.stop_recording_screen()  # base64
     out = (out_dir or OUT_DIR)
     out.mkdir(parents=True, exist_ok=True)
     file_path = out / (filename if filename.endswith(".mp4") else f"{filename}.mp4")
 
-    with open(file_path, "wb") as f:
-        f.write(base64.b64decode(b64))
+    if RECORDING_BACKEND == "adb":
+        file_path = _stop_adb(_resolve_serial(serial), file_path)
+        print(f"[ScreenRecording] guardado: {file_path}")
+        return file_path
+
+    driver = get_driver()
+    if driver is None:
+        raise RuntimeError("Driver no inicializado para grabar pantalla.")
+
+    if RECORDING_RETRIEVAL == "upload":
+        _stop_with_upload(driver, file_path)
+    else:
+        _write_base64(driver.stop_recording_screen(), file_path)  # base64
 
     print(f"[ScreenRecording] guardado: {file_path}")
     return file_path
@@ -79,12 +172,12 @@ def stop_screen_recording(filename: str, out_dir: Optional[Path] = None) -> Path
 
 # ---------------------- Versiones asíncronas ---------------------- #
 
-async def async_start(start_opts: Optional[Dict[str, Any]] = None) -> None:
-    await asyncio.to_thread(start_screen_recording, start_opts)
+async def async_start(start_opts: Optional[Dict[str, Any]] = None, serial: Optional[str] = None) -> None:
+    await asyncio.to_thread(start_screen_recording, start_opts, serial)
 
 
-async def async_stop(filename: str, out_dir: Optional[Path] = None) -> Path:
-    return await asyncio.to_thread(stop_screen_recording, filename, out_dir)
+async def async_stop(filename: str, out_dir: Optional[Path] = None, serial: Optional[str] = None) -> Path:
+    return await asyncio.to_thread(stop_screen_recording, filename, out_dir, serial)
 
 
 # ------------------- Context manager asíncrono -------------------- #
@@ -0,0 +1,208 @@
+# utils/video_postprocess.py
+"""
+Post-procesado de grabaciones en segundo plano: un pool de hilos acotado que, por cada
+MP4 guardado, lo recodifica a un perfil pequeño, genera una miniatura, añade una
+línea al índice de la ejecución (`<OUT_DIR>/index/<run_id>.jsonl`) y aplica la retención
+por antigüedad y tamaño total. `submit` nunca bloquea ni lanza: si la cola está llena o
+algo falla, el vídeo se queda tal cual.
+Son hilos y no procesos: el trabajo pesado ya corre en subprocesos de ffmpeg, y los grupos
+corren en procesos daemon, que no pueden crear procesos hijos (ProcessPoolExecutor).
+"""
+import os
+import json
+import time
+import shutil
+import threading
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any, List
+
+VIDEO_POSTPROCESS_WORKERS = int(os.getenv("VIDEO_POSTPROCESS_WORKERS", "1"))  # por proceso
+VIDEO_POSTPROCESS_QUEUE = int(os.getenv("VIDEO_POSTPROCESS_QUEUE", "20"))
+VIDEO_TRANSCODE_HEIGHT = int(os.getenv("VIDEO_TRANSCODE_HEIGHT", "640"))
+VIDEO_TRANSCODE_CRF = int(os.getenv("VIDEO_TRANSCODE_CRF", "32"))
+VIDEO_KEEP_ORIGINAL = os.getenv("VIDEO_KEEP_ORIGINAL", "0") == "1"
+VIDEO_RETENTION_DAYS = float(os.getenv("VIDEO_RETENTION_DAYS", "14"))  # 0 = sin límite
+VIDEO_RETENTION_GB = float(os.getenv("VIDEO_RETENTION_GB", "20"))  # 0 = sin límite
+_MEDIA_SUFFIXES = (".mp4", ".jpg")
+
+
+def transcoded_path(path: Path) -> Path:
+    return path.with_name(f"{path.stem}_small.mp4")
+
+
+def _ffmpeg(*args: str) -> None:
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", *args], check=True, capture_output=True)
+
+
+def apply_retention(out_dir: Path, max_age_days: float = VIDEO_RETENTION_DAYS,
+                    max_total_gb: float = VIDEO_RETENTION_GB) -> List[str]:
+    """Borra vídeos y miniaturas más antiguos que `max_age_days` y, después, los más viejos
+    hasta quedar por debajo de `max_total_gb`. Devuelve los ficheros borrados."""
+    files = []
+    for p in Path(out_dir).iterdir():
+        if p.suffix in _MEDIA_SUFFIXES and not p.name.startswith(".") and p.is_file():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+    files.sort()
+    removed = []
+    now = time.time()
+    total = sum(size for _, size, _ in files)
+    budget = max_total_gb * 2**30
+    for mtime, size, p in files:
+        too_old = max_age_days and now - mtime > max_age_days * 86400
+        too_big = max_total_gb and total > budget
+        if not (too_old or too_big):
+            continue
+        p.unlink(missing_ok=True)
+        total -= size
+        removed.append(p.name)
+    return removed
+
+
+def _process(path: str, run_id: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Trabajo de un hilo del pool: recodificar, miniatura, índice y retención."""
+    src = Path(path)
+    record: Dict[str, Any] = {"source": src.name, "run_id": run_id, "ts": time.time(), **meta,
+                              "source_bytes": src.stat().st_size}
+    if shutil.which("ffmpeg"):
+        thumb = src.with_suffix(".jpg")
+        try:
+            _ffmpeg("-ss", "0.5", "-i", str(src), "-frames:v", "1", "-vf", "scale=-2:320", str(thumb))
+            record["thumbnail"] = thumb.name
+        except subprocess.CalledProcessError:
+            pass
+        dst = transcoded_path(src)
+        tmp = dst.with_name(f".{dst.name}")
+        t0 = time.monotonic()
+        try:
+            _ffmpeg("-i", str(src), "-vf", f"scale=-2:{VIDEO_TRANSCODE_HEIGHT}", "-c:v", "libx264",
+                    "-preset", "veryfast", "-crf", str(VIDEO_TRANSCODE_CRF), "-an",
+                    "-movflags", "+faststart", str(tmp))
+            os.replace(tmp, dst)
+            record.update({"video": dst.name, "video_bytes": dst.stat().st_size,
+                           "transcode_seconds": round(time.monotonic() - t0, 2)})
+            if not VIDEO_KEEP_ORIGINAL:
+                src.unlink(missing_ok=True)
+        except subprocess.CalledProcessError as e:
+            tmp.unlink(missing_ok=True)
+            record.update({"video": src.name, "error": e.stderr.decode(errors="ignore")[-300:]})
+    else:
+        record["video"] = src.name
+
+    index = src.parent / "index" / f"{run_id}.jsonl"
+    index.parent.mkdir(parents=True, exist_ok=True)
+    # Una sola escritura con O_APPEND: varias entradas concurrentes no se mezclan
+    fd = os.open(index, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + "\n").encode())
+    finally:
+        os.close(fd)
+
+    record["retention_removed"] = apply_retention(src.parent)
+    return record
+
+
+class VideoPostProcessor:
+    """Pool acotado de post-procesado para un proceso."""
+
+    def __init__(self, workers: int = VIDEO_POSTPROCESS_WORKERS, max_pending: int = VIDEO_POSTPROCESS_QUEUE):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, path: Path, run_id: str = "default", **meta) -> Path:
+        """
+        Encola `path` sin esperar. Devuelve dónde quedará el vídeo (el recodificado si hay
+        ffmpeg y no se conserva el original; si la cola está llena o falla, el propio `path`).
+        """
+        path = Path(path)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                print(f"[VideoPostProcess] Cola llena ({self._pending}); {path.name} se queda sin procesar.")
+                return path
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="video-post")
+            pool = self._pool
+            self._pending += 1
+        try:
+            future = pool.submit(_process, str(path), run_id, meta)
+        except Exception as e:
+            with self._lock:
+                self._pending -= 1
+            print(f"[VideoPostProcess] No se pudo encolar {path.name}: {e}")
+            return path
+        future.add_done_callback(self._done)
+        if shutil.which("ffmpeg") and not VIDEO_KEEP_ORIGINAL:
+            return transcoded_path(path)
+        return path
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+        try:
+            record = future.result()
+        except Exception as e:
+            print(f"[VideoPostProcess] Error procesando vídeo: {e}")
+            return
+        if record.get("error"):
+            print(f"[VideoPostProcess] {record['source']}: no se pudo recodificar ({record['error']}).")
+        elif "video_bytes" in record:
+            print(f"[VideoPostProcess] {record['source']} -> {record['video']} "
+                  f"({record['source_bytes'] / 2**20:.1f} -> {record['video_bytes'] / 2**20:.1f} MiB).")
+
+    def pending(self) -> int:
+        return self._pending
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Con `wait`, termina lo encolado antes de salir (p.ej. al acabar un grupo)."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+
+# Un pool por proceso, creado al primer uso (sus hilos no sobreviven al fork)
+_processor: Optional[VideoPostProcessor] = None
+_processor_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _processor, _processor_lock
+    _processor = None
+    _processor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_postprocessor() -> VideoPostProcessor:
+    global _processor
+    with _processor_lock:
+        if _processor is None:
+            _processor = VideoPostProcessor()
+        return _processor
+
+
+def submit(path: Path, run_id: str = "default", **meta) -> Path:
+    """Nunca lanza: un fallo del post-procesado no debe cambiar el resultado del usuario."""
+    try:
+        return get_postprocessor().submit(path, run_id, **meta)
+    except Exception as e:
+        print(f"[VideoPostProcess] Error encolando {Path(path).name}: {e}")
+        return Path(path)
+
+
+def drain() -> None:
+    """Espera a lo encolado en este proceso y cierra el pool."""
+    with _processor_lock:
+        processor = _processor
+    if processor is not None:
+        processor.shutdown(wait=True)